@@ -1,40 +1,91 @@
 
-import json, os
-from typing import List, Dict, Any
+import json, os, time, threading
+from concurrent.futures import ThreadPoolExecutor, Future, wait, TimeoutError as FutureTimeout
+from typing import List, Dict, Any, Tuple, Iterator
 from llm_client import LLMClient
+from llm_scheduler import INTERACTIVE
 from retriever import VectorStore
 from storage import DB
+from table_store import TableStore
+from answer_cache import AnswerCache
+from planner import PlanCache, needs_planning, planner_stats
+from prompts import plan_messages, refine_messages, sql_messages, synth_messages
 
-SYSTEM_PLAN = """You are an analysis planner. Break the user question into 2-5 bite-size sub-queries.
-Return strict JSON:
-{"subqueries": ["...","..."], "notes": "short rationale"}
-"""
+def _deadline(name: str, default: str) -> float | None:
+    v = float(os.getenv(name, default))
+    return v if v > 0 else None
 
-SYSTEM_SYNTH = """You are a careful banking analyst. Use the provided CONTEXT passages to answer.
-- Cite using [filename#chunk_id] footnotes.
-- If unsure, say what is missing.
-- Be concise, accurate, and safe for a private bank environment.
-"""
+# Per-stage deadlines in seconds (0 = wait indefinitely); a late stage degrades instead of blocking the turn
+AGENT_WORKERS = int(os.getenv("AGENT_WORKERS", "8"))
+AGENT_PLAN_TIMEOUT = _deadline("AGENT_PLAN_TIMEOUT", "20")
+AGENT_RETRIEVE_TIMEOUT = _deadline("AGENT_RETRIEVE_TIMEOUT", "10")
+AGENT_REFINE_TIMEOUT = _deadline("AGENT_REFINE_TIMEOUT", "15")
+AGENT_SQL_TIMEOUT = _deadline("AGENT_SQL_TIMEOUT", "20")
+# 1 = draft the refinement query as soon as the raw-question hits come back thin (< 3),
+# instead of after the planner and every subquery retrieval
+AGENT_SPECULATIVE_REFINE = os.getenv("AGENT_SPECULATIVE_REFINE", "0") == "1"
+PLANNER_FAST_PATH = os.getenv("PLANNER_FAST_PATH", "1") == "1"
+
+_executor: ThreadPoolExecutor | None = None
+
+def _pool() -> ThreadPoolExecutor:
+    # one pool shared by every AgenticRAG instance (app.py and /code/summarize both create one)
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=AGENT_WORKERS, thread_name_prefix="agent")
+    return _executor
+
+def _wait(fut: Future, timeout: float | None, default: Any) -> Tuple[Any, bool]:
+    """Result of fut within timeout, else (default, True). Errors also fall back to default."""
+    try:
+        return fut.result(timeout=timeout), False
+    except FutureTimeout:
+        return default, True
+    except Exception:
+        return default, False
+
+def _ms(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000, 1)
 
 class AgenticRAG:
-    def __init__(self, db: DB, vector: VectorStore):
+    def __init__(self, db: DB, vector: VectorStore, tables: TableStore | None = None,
+                 cache: AnswerCache | None = None, plan_cache: PlanCache | None = None, priority: int = INTERACTIVE):
         self.db = db
         self.vector = vector
-        self.llm = LLMClient()
-
-    def _plan(self, question: str) -> List[str]:
-        msg = [
-            {"role": "system", "content": SYSTEM_PLAN},
-            {"role": "user", "content": f"Question: {question}"}
-        ]
-        out = self.llm.chat(msg, temperature=0.2, max_tokens=300)
+        self.tables = tables
+        self.cache = cache
+        self.plan_cache = plan_cache
+        # priority: scheduler class of every LLM call this instance makes (llm_scheduler.BATCH for bulk jobs)
+        self.llm = LLMClient(priority=priority)
+
+    def _plan(self, session_id: str, question: str) -> List[str] | None:
+        # None when the planner reply does not parse
+        out = self.llm.chat(plan_messages(question), temperature=0.2, max_tokens=300, session_id=session_id)
         try:
             js = json.loads(out)
-            subs = js.get("subqueries", [])
+            subs = [s for s in js.get("subqueries", []) if isinstance(s, str) and s.strip()]
             if not subs: subs = [question]
             return subs[:5]
         except Exception:
-            return [question]
+            return None
+
+    def _plan_stage(self, pool: ThreadPoolExecutor, session_id: str, question: str) -> Tuple[List[str], str]:
+        """(subqueries, source): simple questions skip the planner, repeated ones reuse a cached plan."""
+        if PLANNER_FAST_PATH and not needs_planning(question):
+            return [question], "skipped"
+        if self.plan_cache is not None:
+            cached = self.plan_cache.get(session_id, question)
+            if cached:
+                return cached, "cache"
+        subs, late = _wait(pool.submit(self._plan, session_id, question), AGENT_PLAN_TIMEOUT, None)
+        if subs is None:
+            return [question], "timeout" if late else "fallback"
+        if self.plan_cache is not None:
+            self.plan_cache.put(session_id, question, subs)
+        return subs, "llm"
+
+    def _refine_query(self, session_id: str, question: str) -> str:
+        return self.llm.chat(refine_messages(question), temperature=0.3, max_tokens=60, session_id=session_id).strip()
 
     def _retrieve(self, subquery: str, k: int = 6, kind_hint: str | None = None) -> List[Dict[str, Any]]:
         hits = self.vector.search(subquery, k=k)
@@ -46,46 +97,177 @@ class AgenticRAG:
                 "chunk_id": meta.get("chunk_id"),
                 "filename": meta.get("filename"),
                 "text": meta.get("text"),
+                "start_line": meta.get("start_line"),
+                "end_line": meta.get("end_line"),
+                "table": meta.get("table"),
             })
 
-# Heuristic: if question hints at code, DB2, or JCL, rank such chunks slightly higher
-if any(kw in subquery.lower() for kw in ["cobol","jcl","copybook","vsam","cics","db2","sql"]):
-    for r in results:
-        fname = (r.get("filename") or "").lower()
-        if any(x in fname for x in ["db2:", ".cbl", ".cob", ".cpy", ".jcl", ".cics"]):
-            r["score"] += 0.05
+        # Heuristic: if question hints at code, DB2, or JCL, rank such chunks slightly higher
+        if any(kw in subquery.lower() for kw in ["cobol","jcl","copybook","vsam","cics","db2","sql"]):
+            for r in results:
+                fname = (r.get("filename") or "").lower()
+                if any(x in fname for x in ["db2:", ".cbl", ".cob", ".cpy", ".jcl", ".cics"]):
+                    r["score"] += 0.05
         return results
 
-    def _synthesize(self, question: str, contexts: List[Dict[str, Any]]) -> str:
-        context_block = "\n\n".join(
-            f"[{c['filename']}#{c['chunk_id']}]\n{c['text']}" for c in contexts
-        ) or "(no context)"
-        messages = [
-            {"role": "system", "content": SYSTEM_SYNTH},
-            {"role": "user", "content": f"QUESTION:\n{question}\n\nCONTEXT:\n{context_block}"}
-        ]
-        return self.llm.chat(messages, temperature=0.0, max_tokens=900)
+    def _structured_lookup(self, session_id: str, question: str, names: List[str]) -> Dict[str, Any] | None:
+        # Imported DB2 tables live in a local SQL copy: ask for one SELECT and run it exactly.
+        t0 = time.monotonic()
+        schema_lines = []
+        for name in names:
+            cols = ", ".join(f"{c} {t}" for c, t in self.tables.describe(name))
+            schema_lines.append(f"TABLE {name} ({cols})")
+        try:
+            sql = json.loads(self.llm.chat(sql_messages(schema_lines, question), temperature=0.0, max_tokens=300,
+                                           session_id=session_id)).get("sql")
+            if not sql:
+                return None
+            # the stage stops waiting at AGENT_SQL_TIMEOUT; interrupt the query then too, so it does
+            # not keep holding one of the shared agent workers
+            timeout = None if AGENT_SQL_TIMEOUT is None else AGENT_SQL_TIMEOUT - (time.monotonic() - t0)
+            if timeout is not None and timeout <= 0:
+                return None
+            res = self.tables.query(session_id, sql, max_rows=50, timeout=timeout)
+        except Exception:
+            return None
+        body = "\n".join("\t".join(str(v) for v in row) for row in res["rows"]) or "(no rows)"
+        more = "\n(truncated)" if res["truncated"] else ""
+        return {
+            "score": 1.0,
+            "chunk_id": "sql",
+            "filename": "SQL:" + ",".join(names),
+            "text": f"SQL: {sql}\n" + "\t".join(res["columns"]) + f"\n{body}{more}",
+        }
+
+    def _synthesize(self, session_id: str, question: str, contexts: List[Dict[str, Any]], stream: bool = False):
+        # context in chunk-id order, question last (see prompts.py)
+        return self.llm.chat(synth_messages(question, contexts), temperature=0.0, max_tokens=900, stream=stream,
+                             session_id=session_id)
+
+    @staticmethod
+    def _citations(contexts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        citations = []
+        for c in contexts:
+            cit = {"chunk_id": c["chunk_id"], "filename": c["filename"], "score": c["score"]}
+            if c.get("start_line"):
+                cit.update(start_line=c["start_line"], end_line=c["end_line"])
+            citations.append(cit)
+        return citations
+
+    def _cached(self, session_id: str, question: str) -> Tuple[Dict[str, Any] | None, int | None]:
+        # (cached result, chunk_version the answer is being computed against)
+        if self.cache is None:
+            return None, None
+        t0 = time.perf_counter()
+        version = self.db.chunk_version(session_id)
+        hit = self.cache.lookup(session_id, question, version)
+        if hit is None:
+            return None, version
+        timings = {"cache": hit["match"], "similarity": hit["similarity"], "total_ms": _ms(t0)}
+        return {"answer": hit["answer"], "citations": hit["citations"], "timings": timings, "cached": True}, version
 
     def answer(self, session_id: str, question: str) -> Dict[str, Any]:
-        # 1) Plan
-        subqueries = self._plan(question)
+        hit, version = self._cached(session_id, question)
+        if hit:
+            return hit
+        contexts, timings = self._gather(session_id, question)
+
+        # 3) Synthesize
+        t0 = time.perf_counter()
+        answer = self._synthesize(session_id, question, contexts)
+        timings["synthesize_ms"] = _ms(t0)
+        timings["total_ms"] = _ms(timings.pop("_start"))
+        result = {"answer": answer, "citations": self._citations(contexts), "timings": timings}
+        if self.cache is not None and not timings["degraded"]:
+            self.cache.store(session_id, question, result, version, timings["total_ms"])
+        return result
+
+    def answer_stream(self, session_id: str, question: str) -> Iterator[Dict[str, Any]]:
+        """Same pipeline as answer(), as events: {"type": "citations"} once retrieval is done,
+        then {"type": "token"} per synthesis delta, then {"type": "done"} with the full answer."""
+        hit, version = self._cached(session_id, question)
+        if hit:
+            yield {"type": "citations", "citations": hit["citations"]}
+            yield {"type": "token", "text": hit["answer"]}
+            yield {"type": "done", **hit}
+            return
+        contexts, timings = self._gather(session_id, question)
+        citations = self._citations(contexts)
+        yield {"type": "citations", "citations": citations}
+
+        t0 = time.perf_counter()
+        parts: List[str] = []
+        for text in self._synthesize(session_id, question, contexts, stream=True):
+            if not parts:
+                timings["first_token_ms"] = _ms(timings["_start"])
+            parts.append(text)
+            yield {"type": "token", "text": text}
+        timings["synthesize_ms"] = _ms(t0)
+        timings["total_ms"] = _ms(timings.pop("_start"))
+        result = {"answer": "".join(parts), "citations": citations, "timings": timings}
+        if self.cache is not None and not timings["degraded"]:
+            self.cache.store(session_id, question, result, version, timings["total_ms"])
+        yield {"type": "done", **result}
 
-        # 2) Iterative retrieval (agentic loop): retrieve per subquery, then optional refinement
+    def _gather(self, session_id: str, question: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        # Concurrent pipeline: the raw question is retrieved while the planner runs, subqueries
+        # are retrieved in parallel and the refinement query is drafted speculatively. Each stage
+        # has a deadline (AGENT_*_TIMEOUT) after which the turn continues with what it has.
+        pool = _pool()
+        degraded: List[str] = []
+        timings: Dict[str, Any] = {"_start": time.perf_counter(), "degraded": degraded}
+
+        # 1) Plan, with retrieval on the raw question already running: the planner round-trip
+        # is then off the critical path for most turns
+        t0 = time.perf_counter()
+        spec_f = pool.submit(self._retrieve, question, 6)
+        refine: Dict[str, Future] = {}
+        refine_lock = threading.Lock()
+
+        def start_refine() -> Future:
+            # at most one refinement LLM call per turn, whoever asks first
+            with refine_lock:
+                if "f" not in refine:
+                    refine["f"] = pool.submit(self._refine_query, session_id, question)
+                return refine["f"]
+
+        if AGENT_SPECULATIVE_REFINE:
+            spec_f.add_done_callback(lambda f: start_refine() if f.exception() is None and len(f.result()) < 3 else None)
+        subqueries, source = self._plan_stage(pool, session_id, question)
+        if source == "timeout":
+            degraded.append("plan")
+        timings["plan_ms"] = _ms(t0)
+        timings["plan_source"] = source
+        planner_stats.record("fallback" if source == "timeout" else source, timings["plan_ms"])
+        timings["speculative_ready"] = spec_f.done()
+
+        # 2) Retrieval: remaining subqueries at once, merged with the speculative hits.
+        # A plan that timed out or did not parse is just [question], which spec_f already covers.
+        t0 = time.perf_counter()
+        q = question.strip().lower()
+        futures = [spec_f] + [pool.submit(self._retrieve, sq, 6) for sq in subqueries if sq.strip().lower() != q]
+        done, pending = wait(futures, timeout=AGENT_RETRIEVE_TIMEOUT)
         gathered: List[Dict[str, Any]] = []
-        for sq in subqueries:
-            hits = self._retrieve(sq, k=6)
-            gathered.extend(hits)
+        for f in futures:
+            if f in done and f.exception() is None:
+                gathered.extend(f.result())
+        if pending:
+            degraded.append("retrieve")
+        timings["retrieve_ms"] = _ms(t0)
 
-        # Optional: refinement step if too few relevant results (score threshold demo)
+        # Refinement only if too few relevant results (score threshold demo)
         if len(gathered) < 3:
-            # Ask LLM to suggest a refined query
-            refine_msgs = [
-                {"role": "system", "content": "Suggest a sharper search query for RAG given the user's question."},
-                {"role": "user", "content": question}
-            ]
-            refined = self.llm.chat(refine_msgs, temperature=0.3, max_tokens=60)
-            hits = self._retrieve(refined.strip(), k=6)
-            gathered.extend(hits)
+            t0 = time.perf_counter()
+            refined, late = _wait(start_refine(), AGENT_REFINE_TIMEOUT, "")
+            if refined:
+                hits, late_r = _wait(pool.submit(self._retrieve, refined, 6), AGENT_RETRIEVE_TIMEOUT, [])
+                gathered.extend(hits)
+                late = late or late_r
+            if late:
+                degraded.append("refine")
+            timings["refine_ms"] = _ms(t0)
+        elif "f" in refine:
+            refine["f"].cancel()
 
         # Deduplicate by chunk_id preserving best score
         seen = {}
@@ -97,9 +279,17 @@ if any(kw in subquery.lower() for kw in ["cobol","jcl","copybook","vsam","cics",
                 seen[cid] = c
         contexts = sorted(seen.values(), key=lambda x: -x["score"])[:10]
 
-        # 3) Synthesize
-        answer = self._synthesize(question, contexts)
+        # Structured path: questions hitting imported table summaries get an exact SQL result
+        if self.tables is not None:
+            names = sorted({c["table"] for c in contexts if c.get("table")})
+            if names:
+                t0 = time.perf_counter()
+                sql_ctx, late = _wait(pool.submit(self._structured_lookup, session_id, question, names),
+                                      AGENT_SQL_TIMEOUT, None)
+                if late:
+                    degraded.append("sql")
+                if sql_ctx:
+                    contexts = [sql_ctx] + contexts[:9]
+                timings["sql_ms"] = _ms(t0)
 
-        # citations
-        citations = [{"chunk_id": c["chunk_id"], "filename": c["filename"], "score": c["score"]} for c in contexts]
-        return {"answer": answer, "citations": citations}
+        return contexts, timings
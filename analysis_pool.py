@@ -0,0 +1,87 @@
+# analysis_pool.py
+import os, sqlite3, threading, atexit
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple, Callable, Any, Optional
+
+# Process pool for the regex-bound lineage / field scans. Workers read their chunk batch straight
+# from SQLite (only id ranges cross the process boundary) and return partial maps that the caller
+# merges in batch order. ANALYSIS_WORKERS=1 keeps everything in-process.
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", str(min(4, os.cpu_count() or 1))))
+ANALYSIS_BATCH_CHUNKS = int(os.getenv("ANALYSIS_BATCH_CHUNKS", "500"))
+# smaller scans are not worth the IPC
+ANALYSIS_PARALLEL_MIN_CHUNKS = int(os.getenv("ANALYSIS_PARALLEL_MIN_CHUNKS", "2000"))
+
+_lock = threading.Lock()
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+
+
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    """Shared pool, created on first use (spawn: the API process runs threads)."""
+    global _pool, _pool_workers
+    with _lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"))
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+
+
+atexit.register(shutdown)
+
+
+def plan(db_path: str, session_id: str, workers: Optional[int] = None,
+         batch: Optional[int] = None) -> Tuple[int, List[Tuple[int, int]]]:
+    """(workers, inclusive chunk id ranges of `batch` chunks in id order) for a session scan;
+    (0, []) when it should run in-process (pool disabled or too few chunks)."""
+    workers = ANALYSIS_WORKERS if workers is None else workers
+    batch = batch or ANALYSIS_BATCH_CHUNKS
+    if workers <= 1:
+        return 0, []
+    with sqlite3.connect(db_path) as con:
+        ids = [r[0] for r in con.execute("SELECT id FROM chunks WHERE session_id=? ORDER BY id ASC", (session_id,))]
+    if len(ids) < ANALYSIS_PARALLEL_MIN_CHUNKS:
+        return 0, []
+    return workers, [(ids[i], ids[min(i + batch, len(ids)) - 1]) for i in range(0, len(ids), batch)]
+
+
+def read_batch(db_path: str, session_id: str, lo: int, hi: int) -> List[Tuple[str, str]]:
+    con = sqlite3.connect(db_path)
+    try:
+        return con.execute(
+            "SELECT filename, content FROM chunks WHERE session_id=? AND id BETWEEN ? AND ? ORDER BY id ASC",
+            (session_id, lo, hi)
+        ).fetchall()
+    finally:
+        con.close()
+
+
+def read_ids(db_path: str, session_id: str, ids: List[int]) -> List[Tuple[str, str]]:
+    con = sqlite3.connect(db_path)
+    try:
+        rows = []
+        for i in range(0, len(ids), 500):
+            part = ids[i:i + 500]
+            rows += con.execute(
+                f"SELECT filename, content FROM chunks WHERE session_id=? AND id IN ({','.join('?' * len(part))}) ORDER BY id ASC",
+                (session_id, *part)
+            ).fetchall()
+        return rows
+    finally:
+        con.close()
+
+
+def map_ordered(fn: Callable[..., Any], jobs: List[tuple], workers: int) -> List[Any]:
+    """fn(*job) for every job on the pool; results in job order (the merge stays deterministic)."""
+    pool = get_pool(workers)
+    return [f.result() for f in [pool.submit(fn, *job) for job in jobs]]
@@ -0,0 +1,146 @@
+# answer_cache.py
+import re, json, time, sqlite3, hashlib, threading
+from typing import List, Dict, Any, Optional
+import numpy as np
+
+RE_IDENTIFIER = re.compile(r"[A-Za-z0-9][A-Za-z0-9\-_#@$.]*")
+
+
+def normalize_question(q: str) -> str:
+    return re.sub(r"\s+", " ", q).strip().rstrip("?.!").strip().lower()
+
+
+def identifiers(q: str) -> frozenset:
+    """Program/file/field names in a question (tokens with digits, hyphens, underscores or all
+    caps). Two questions that name different things must not share a cached answer."""
+    out = set()
+    for t in RE_IDENTIFIER.findall(q):
+        t = t.rstrip(".")
+        if any(ch.isdigit() for ch in t) or "-" in t or "_" in t or (t.isupper() and len(t) > 1):
+            out.add(t.upper())
+    return frozenset(out)
+
+
+class AnswerCache:
+    """Per-session cache of finished answers in front of AgenticRAG.answer.
+
+    Lookups try the exact (normalized) question hash first, then embedding similarity
+    >= threshold among the session's entries that name the same identifiers. Every entry
+    records the session's chunk_version (see DB.chunk_version) when it was computed, so
+    any later ingest, upsert or delete in the session invalidates it; stale rows are
+    purged on the next lookup. Entries also keep the chunk ids their answer used."""
+    def __init__(self, db_path: str, embed=None, threshold: float = 0.92, ttl_s: float = 86400,
+                 max_entries: int = 500):
+        self.db_path = db_path
+        self.embed = embed          # callable List[str] -> normalized np.ndarray, None = exact only
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "hits_exact": 0, "hits_semantic": 0, "misses": 0, "stores": 0,
+                       "invalidated": 0, "saved_ms": 0.0}
+        self._init()
+
+    def _init(self):
+        with sqlite3.connect(self.db_path) as con:
+            con.execute("""
+            CREATE TABLE IF NOT EXISTS answer_cache(
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT,
+                qhash TEXT,
+                question TEXT,
+                idents TEXT,
+                embedding BLOB,
+                answer TEXT,
+                citations TEXT,
+                chunk_ids TEXT,
+                chunk_version INTEGER,
+                cost_ms REAL,
+                hits INTEGER DEFAULT 0,
+                created_at REAL
+            );
+            """)
+            con.execute("CREATE INDEX IF NOT EXISTS idx_answer_cache_q ON answer_cache(session_id, qhash)")
+            con.commit()
+
+    def _count(self, key: str, n: float = 1):
+        with self._lock:
+            self._stats[key] += n
+
+    @staticmethod
+    def _qhash(question: str) -> str:
+        return hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()
+
+    def lookup(self, session_id: str, question: str, chunk_version: int) -> Optional[Dict[str, Any]]:
+        """Cached {"answer", "citations", "match", "similarity"} or None."""
+        self._count("lookups")
+        t0 = time.perf_counter()
+        now = time.time()
+        with sqlite3.connect(self.db_path) as con:
+            cur = con.execute(
+                "DELETE FROM answer_cache WHERE session_id = ? AND (chunk_version != ? OR created_at < ?)",
+                (session_id, chunk_version, now - self.ttl_s)
+            )
+            if cur.rowcount:
+                self._count("invalidated", cur.rowcount)
+            row = con.execute(
+                "SELECT id, answer, citations, cost_ms FROM answer_cache WHERE session_id = ? AND qhash = ? ORDER BY id DESC LIMIT 1",
+                (session_id, self._qhash(question))
+            ).fetchone()
+            match, sim = "exact", 1.0
+            if row is None and self.embed is not None:
+                idents = json.dumps(sorted(identifiers(question)))
+                rows = con.execute(
+                    "SELECT id, answer, citations, cost_ms, embedding FROM answer_cache WHERE session_id = ? AND idents = ?",
+                    (session_id, idents)
+                ).fetchall()
+                if rows:
+                    q = self.embed([question])[0]
+                    mat = np.stack([np.frombuffer(r[4], dtype=np.float32) for r in rows])
+                    sims = mat @ q
+                    best = int(np.argmax(sims))
+                    if sims[best] >= self.threshold:
+                        row, match, sim = rows[best][:4], "semantic", float(sims[best])
+            if row is not None:
+                con.execute("UPDATE answer_cache SET hits = hits + 1 WHERE id = ?", (row[0],))
+            con.commit()
+        if row is None:
+            self._count("misses")
+            return None
+        self._count("hits_" + match)
+        # latency saved = what the original answer cost minus this lookup
+        self._count("saved_ms", max(0.0, (row[3] or 0.0) - (time.perf_counter() - t0) * 1000))
+        return {"answer": row[1], "citations": json.loads(row[2]), "match": match, "similarity": round(sim, 4)}
+
+    def store(self, session_id: str, question: str, result: Dict[str, Any], chunk_version: int, cost_ms: float):
+        emb = self.embed([question])[0].astype(np.float32).tobytes() if self.embed is not None else None
+        chunk_ids = sorted({c["chunk_id"] for c in result.get("citations", []) if isinstance(c.get("chunk_id"), int)})
+        with sqlite3.connect(self.db_path) as con:
+            con.execute(
+                """INSERT INTO answer_cache(session_id, qhash, question, idents, embedding, answer, citations,
+                chunk_ids, chunk_version, cost_ms, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (session_id, self._qhash(question), question, json.dumps(sorted(identifiers(question))), emb,
+                 result["answer"], json.dumps(result.get("citations", [])), json.dumps(chunk_ids),
+                 chunk_version, cost_ms, time.time())
+            )
+            # keep the most recent max_entries per session
+            con.execute(
+                """DELETE FROM answer_cache WHERE session_id = ? AND id NOT IN (
+                SELECT id FROM answer_cache WHERE session_id = ? ORDER BY id DESC LIMIT ?)""",
+                (session_id, session_id, self.max_entries)
+            )
+            con.commit()
+        self._count("stores")
+
+    def clear(self, session_id: str):
+        with sqlite3.connect(self.db_path) as con:
+            con.execute("DELETE FROM answer_cache WHERE session_id = ?", (session_id,))
+            con.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+        hits = out["hits_exact"] + out["hits_semantic"]
+        out["hit_rate"] = round(hits / out["lookups"], 4) if out["lookups"] else 0.0
+        out["saved_ms"] = round(out["saved_ms"], 1)
+        return out
@@ -3,6 +3,7 @@ import os, io, uuid, time, json, re
 from typing import List, Optional, Dict, Any
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse
 from fastapi import APIRouter
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
@@ -10,8 +11,15 @@ from dotenv import load_dotenv
 from storage import DB, ensure_dirs
 from ingest import TextIngestor
 from code_ingest import CodeIngestor
+from db2_ingest import Db2Ingestor
 from retriever import VectorStore
+from table_store import TableStore
 from agent import AgenticRAG
+from code_summarizer import CodeSummarizer
+from answer_cache import AnswerCache
+from planner import PlanCache, planner_stats
+from llm_client import llm_stats
+from llm_scheduler import llm_scheduler, LLMBusy, INTERACTIVE, BATCH
 from guardrails import redact_for_logs
 
 load_dotenv()
@@ -19,15 +27,28 @@ load_dotenv()
 DATA_DIR = os.getenv("DATA_DIR", "./data")
 DB_PATH = os.getenv("DB_PATH", os.path.join(DATA_DIR, "rag.sqlite"))
 INDEX_PATH = os.getenv("INDEX_PATH", os.path.join(DATA_DIR, "index.faiss"))
+TABLES_DB_PATH = os.getenv("TABLES_DB_PATH", os.path.join(DATA_DIR, "tables.sqlite"))
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1200"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "180"))
+CODE_CHUNK_MODE = os.getenv("CODE_CHUNK_MODE", "structured")
+CODE_CHUNK_LINES = int(os.getenv("CODE_CHUNK_LINES", "120"))
+DB2_IMPORT_BATCH = int(os.getenv("DB2_IMPORT_BATCH", "1000"))
+ANSWER_CACHE = os.getenv("ANSWER_CACHE", "1") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+PLAN_CACHE_THRESHOLD = float(os.getenv("PLAN_CACHE_THRESHOLD", "0.95"))
 
 ensure_dirs(DATA_DIR)
 db = DB(DB_PATH)
 vector = VectorStore(INDEX_PATH)
 ingestor = TextIngestor(db, vector, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
-code_ingestor = CodeIngestor(db, vector)
-agent = AgenticRAG(db, vector)
+code_ingestor = CodeIngestor(db, vector, lines_per_chunk=CODE_CHUNK_LINES, mode=CODE_CHUNK_MODE)
+tables = TableStore(TABLES_DB_PATH)
+db2_ingestor = Db2Ingestor(db, vector, tables, batch_size=DB2_IMPORT_BATCH)
+answer_cache = AnswerCache(DB_PATH, embed=vector.embed, threshold=ANSWER_CACHE_THRESHOLD, ttl_s=ANSWER_CACHE_TTL)
+plan_cache = PlanCache(embed=vector.embed, threshold=PLAN_CACHE_THRESHOLD)
+agent = AgenticRAG(db, vector, tables=tables, cache=answer_cache if ANSWER_CACHE else None, plan_cache=plan_cache)
+code_summarizer = CodeSummarizer(db)
 
 app = FastAPI(title="Agentic RAG (Private Bank)")
 api = APIRouter(prefix="/api")
@@ -70,44 +91,106 @@ def upload_files(session_id: str = Form(...), files: List[UploadFile] = File(...
         n = ingestor.ingest_text(session_id, f.filename, text)
         total_chunks += n
         docs.append({"filename": f.filename, "chunks": n})
+    field_index.refresh(session_id)
     return {"ingested_chunks": total_chunks, "details": docs}
 
+def _too_busy(e: LLMBusy) -> HTTPException:
+    return HTTPException(429, str(e), headers={"Retry-After": str(int(e.retry_after))})
+
 @api.post("/chat")
 def chat(payload: ChatTurn):
     if not db.session_exists(payload.session_id):
         raise HTTPException(400, "Invalid session_id")
+    # Reject before any work when the LLM queue is already full
+    try:
+        llm_scheduler.admit(INTERACTIVE)
+    except LLMBusy as e:
+        raise _too_busy(e)
     # Store user message
     db.add_message(payload.session_id, role="user", content=payload.message)
     # Agentic answer
-    result = agent.answer(payload.session_id, payload.message)
+    try:
+        result = agent.answer(payload.session_id, payload.message)
+    except LLMBusy as e:
+        raise _too_busy(e)
     # Store assistant message
     db.add_message(payload.session_id, role="assistant", content=result["answer"], citations=json.dumps(result["citations"]))
     return result
 
-@api.get("/history/{session_id}")
+@api.post("/chat/stream")
+def chat_stream(payload: ChatTurn):
+    """Server-Sent Events: `citations` once retrieval is done, `token` per synthesis delta,
+    then `done` (or `error`). The assistant message is persisted when the stream completes."""
+    if not db.session_exists(payload.session_id):
+        raise HTTPException(400, "Invalid session_id")
+    try:
+        llm_scheduler.admit(INTERACTIVE)
+    except LLMBusy as e:
+        raise _too_busy(e)
+    db.add_message(payload.session_id, role="user", content=payload.message)
+
+    def sse(event: str, data: Dict[str, Any]) -> str:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    def events():
+        try:
+            for ev in agent.answer_stream(payload.session_id, payload.message):
+                if ev["type"] == "done":
+                    db.add_message(payload.session_id, role="assistant", content=ev["answer"],
+                                   citations=json.dumps(ev["citations"]))
+                yield sse(ev["type"], ev)
+        except LLMBusy as e:
+            yield sse("error", {"type": "error", "detail": str(e), "status": 429, "retry_after": e.retry_after})
+        except Exception as e:
+            yield sse("error", {"type": "error", "detail": str(e)})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @api.post("/db2/import-table")
-def db2_import_table(session_id: str = Form(...), table: str = Form(...), schema: str | None = Form(None), limit: int | None = Form(None)):
-    from db2_hooks import fetch_all
+def db2_import_table(session_id: str = Form(...), table: str = Form(...), schema: str | None = Form(None), limit: int | None = Form(None),
+                     batch_size: int | None = Form(None), watermark_col: str | None = Form(None), key_cols: str | None = Form(None),
+                     reset_watermark: bool = Form(False)):
+    if not db.session_exists(session_id):
+        raise HTTPException(400, "Invalid session_id")
+    keys = [c.strip() for c in (key_cols or "").split(",") if c.strip()] or None
+    # Rows are streamed, stored and embedded batch by batch (see Db2Ingestor);
+    # watermark_col switches to an incremental import from the last stored watermark
+    try:
+        return db2_ingestor.ingest_table(session_id, table, schema=schema, limit=limit, batch_size=batch_size,
+                                         watermark_col=watermark_col or None, key_cols=keys, reset_watermark=reset_watermark)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+@api.get("/db2/import-status/{session_id}")
+def db2_import_status(session_id: str):
+    if not db.session_exists(session_id):
+        raise HTTPException(400, "Invalid session_id")
+    return {"imports": db.get_imports(session_id)}
+
+@api.get("/db2/tables/{session_id}")
+def db2_tables(session_id: str):
     if not db.session_exists(session_id):
         raise HTTPException(400, "Invalid session_id")
-    rows = list(fetch_all(table=table, schema=schema, limit=limit))
-    if not rows:
-        return {"ingested_chunks": 0, "rows": 0}
-    # Flatten rows to text lines to index; also store into chunks
-    texts, metas = [], []
-    for i, row in enumerate(rows):
-        text = "\n".join(f"{k}: {v}" for k, v in row.items())
-        cid = db.add_chunk(session_id, f"DB2:{schema+'.' if schema else ''}{table}", i, text)
-        texts.append(text)
-        metas.append({"chunk_id": cid, "session_id": session_id, "filename": f"DB2:{schema+'.' if schema else ''}{table}", "text": text, "kind": "db2"})
-    vector.add_texts(texts, metas)
-    return {"ingested_chunks": len(texts), "rows": len(rows)}
+    return {"tables": tables.list_tables(session_id)}
+
+@api.post("/db2/query")
+def db2_query(session_id: str = Form(...), sql: str = Form(...), max_rows: int = Form(200)):
+    if not db.session_exists(session_id):
+        raise HTTPException(400, "Invalid session_id")
+    try:
+        return tables.query(session_id, sql, max_rows=max_rows)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
 
 @api.post("/code/summarize")
 def code_summarize(session_id: str = Form(...), files: list[UploadFile] | None = File(None), prompt: str = Form("Summarize the mainframe code: entry points, files/tables used, key business rules, side effects, and outputs.")):
     if not db.session_exists(session_id):
         raise HTTPException(400, "Invalid session_id")
+    try:
+        llm_scheduler.admit(BATCH)
+    except LLMBusy as e:
+        raise _too_busy(e)
     # If files provided, ingest them as code; else summarize code chunks already in session
     new_chunks = 0
     if files:
@@ -118,30 +201,48 @@ def code_summarize(session_id: str = Form(...), files: list[UploadFile] | None =
             except Exception:
                 text = content.decode("latin-1", errors="ignore")
             new_chunks += code_ingestor.ingest_code(session_id, f.filename, text)
-    # Build a focused query and run agent synthesis over top code chunks
-    from agent import AgenticRAG
-    rag = AgenticRAG(db, vector)
-    question = f"{prompt}\nFocus only on code in this session. Produce a structured summary with sections for Programs/Entries, Data I/O, File/DB2 Access, Copybooks, and Notable Conditions."
-    result = rag.answer(session_id, question)
+        field_index.refresh(session_id)
+    # Map-reduce over every code member in the session (cached per member content hash)
+    instruction = f"{prompt}\nProduce a structured summary with sections for Programs/Entries, Data I/O, File/DB2 Access, Copybooks, and Notable Conditions."
+    try:
+        result = code_summarizer.summarize(session_id, instruction)
+    except LLMBusy as e:
+        raise _too_busy(e)
+    result["new_chunks"] = new_chunks
     return result
 
-
+@api.get("/history/{session_id}")
 def history(session_id: str):
     if not db.session_exists(session_id):
         raise HTTPException(400, "Invalid session_id")
     return {"history": db.get_messages(session_id)}
 
 
-from csv_diff import read_csv_bytes, fetch_db2_sample, schema_diff, data_diff_on_key
-from lineage import analyze_session as lineage_analyze
-from field_lineage import analyze_fields
+from csv_diff import read_csv_bytes, fetch_db2_sample, schema_diff, data_diff_on_key, suggest_keys
+from stream_diff import stream_diff
+from db2_hooks import current_schema
+from lineage import LineageCache
+from field_index import FieldIndex
 from pydantic import BaseModel
 
+# per-file lineage partials, merged per session and reused until its chunk_version changes
+lineage_cache = LineageCache(db)
+# identifier index for field usage (refreshed after ingest) + copybook layout / result caches
+field_index = FieldIndex(db)
+
 class CsvDiffResult(BaseModel):
     schema_diff: dict   # was `schema`
     data_diff: dict  
 
 # app.py
+@api.get("/db2/current-schema")
+def db2_current_schema():
+    # cached in db2_hooks (DB2_META_TTL), safe to poll from the dashboard
+    try:
+        return {"schema": current_schema()}
+    except ValueError:
+        return {"schema": None}
+
 @api.post("/db2/csv-diff", response_model=CsvDiffResult)
 def db2_csv_diff(
     session_id: str = Form(...),
@@ -152,6 +253,7 @@ def db2_csv_diff(
     csv_file: UploadFile = File(...),
     sample_mismatches: int = Form(20),
     db2_limit: int = Form(2000),
+    mode: str = Form("sample"),              # "full": out-of-core reconciliation of every row
 ):
     if not db.session_exists(session_id):
         raise HTTPException(400, "Invalid session_id")
@@ -159,6 +261,18 @@ def db2_csv_diff(
     # prefer db2_schema; fall back to schema; fall back to CURRENT SCHEMA
     eff_schema = db2_schema or schema or current_schema()
 
+    if mode == "full":
+        # whole table vs whole CSV, hash-partitioned on disk (see stream_diff); db2_limit does not apply
+        keys_list = [c.strip() for c in (key_cols or "").split(",") if c.strip()]
+        try:
+            res = stream_diff(csv_file.file, table, schema=eff_schema, key_cols=keys_list,
+                              sample=sample_mismatches, workdir=DATA_DIR)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        db.add_message(session_id, role="system",
+                       content=f"DB2/CSV full diff on {eff_schema}.{table} rows={res['data_diff']['rows']}")
+        return res
+
     csv_b = csv_file.file.read()
     df_csv = read_csv_bytes(csv_b)
     df_db2 = fetch_db2_sample(table, eff_schema, limit=db2_limit)
@@ -176,49 +290,98 @@ def db2_csv_diff(
 def analysis_lineage(session_id: str):
     if not db.session_exists(session_id):
         raise HTTPException(400, "Invalid session_id")
-    report = lineage_analyze(db, session_id)
+    report = lineage_cache.get(session_id)
     return {"lineage": report}
 
 @api.get("/analysis/crud-map/{session_id}")
 def analysis_crud_map(session_id: str):
     if not db.session_exists(session_id):
         raise HTTPException(400, "Invalid session_id")
-    report = lineage_analyze(db, session_id)
+    report = lineage_cache.get(session_id)
     return {"crud_map": report}
 
 
 from fastapi.responses import FileResponse
-from lineage import analyze_session as lineage_analyze
-from field_lineage import analyze_fields
-from graph_builder import build_crud_graph, neighborhood_subgraph, to_pyvis_html
-from export_utils import export_markdown
+from graph_store import GraphStore, GRAPH_MAX_NODES
+from graph_view import GraphViews, GRAPH_CLUSTER_PREFIX, GRAPH_PAGE_SIZE, page as view_page
+from export_utils import export_report, EXPORT_FORMATS
+
+# lineage graph in indexed SQLite tables, synced to the session's chunk_version
+graph_store = GraphStore(db, lineage_cache)
+# laid-out / clustered views and rendered HTML, cached per chunk_version
+graph_views = GraphViews(db, lineage_cache, graph_store, DATA_DIR)
+
+def _expand_list(expand: str) -> List[str]:
+    return [e.strip() for e in (expand or "").split(",") if e.strip()]
 
 @api.get("/analysis/graph/crud/{session_id}")
-def graph_crud(session_id: str):
+def graph_crud(session_id: str, cluster: str = "auto", prefix_len: int = GRAPH_CLUSTER_PREFIX, expand: str = ""):
+    # large maps are collapsed into clusters; expand=CLUSTER::PGM:ACC,... opens them
+    if not db.session_exists(session_id):
+        raise HTTPException(400, "Invalid session_id")
+    if cluster not in ("auto", "prefix", "none"):
+        raise HTTPException(400, "cluster must be auto, prefix or none")
+    out_html, cached = graph_views.crud_html(session_id, cluster=cluster, prefix_len=prefix_len, expand=_expand_list(expand))
+    return {"html_path": out_html, "url": f"/data/{os.path.basename(out_html)}", "cached": cached}
+
+@api.get("/analysis/graph/view/{session_id}")
+def graph_view(session_id: str, cluster: str = "auto", prefix_len: int = GRAPH_CLUSTER_PREFIX, expand: str = "",
+               offset: int = 0, limit: int = GRAPH_PAGE_SIZE):
+    # JSON CRUD map with server-side x/y, paged by nodes (each edge is sent with its later endpoint)
     if not db.session_exists(session_id):
         raise HTTPException(400, "Invalid session_id")
-    lineage = lineage_analyze(db, session_id)["lineage"] if "lineage" in lineage_analyze(db, session_id) else lineage_analyze(db, session_id)
-    G = build_crud_graph(lineage)
-    out_html = os.path.join(DATA_DIR, f"{session_id}_crud_map.html")
-    to_pyvis_html(G, out_html, title="CRUD Map")
-    return {"html_path": out_html, "url": f"/data/{os.path.basename(out_html)}"}
+    if cluster not in ("auto", "prefix", "none"):
+        raise HTTPException(400, "cluster must be auto, prefix or none")
+    version, view = graph_views.view(session_id, cluster=cluster, prefix_len=prefix_len, expand=_expand_list(expand))
+    return {"version": version, **view_page(view, offset, limit)}
 
 @api.get("/analysis/graph/dependency/{session_id}")
 def graph_dependency(session_id: str, element: str, radius: int = 2):
     if not db.session_exists(session_id):
         raise HTTPException(400, "Invalid session_id")
-    lineage = lineage_analyze(db, session_id)["lineage"] if "lineage" in lineage_analyze(db, session_id) else lineage_analyze(db, session_id)
-    G = build_crud_graph(lineage)
-    sub = neighborhood_subgraph(G, element, radius=radius)
-    out_html = os.path.join(DATA_DIR, f"{session_id}_dep_{element.replace('/','_')}.html")
-    to_pyvis_html(sub, out_html, title=f"Dependency: {element}")
-    return {"html_path": out_html, "url": f"/data/{os.path.basename(out_html)}"}
+    out_html, cached = graph_views.dependency_html(session_id, element, radius=radius)
+    return {"html_path": out_html, "url": f"/data/{os.path.basename(out_html)}", "cached": cached}
+
+@api.get("/analysis/graph/neighborhood/{session_id}")
+def graph_neighborhood(session_id: str, element: str, radius: int = 2, max_nodes: int = GRAPH_MAX_NODES):
+    if not db.session_exists(session_id):
+        raise HTTPException(400, "Invalid session_id")
+    return graph_store.neighborhood(session_id, element, radius=radius, max_nodes=max_nodes)
+
+@api.get("/analysis/graph/impact/{session_id}")
+def graph_impact(session_id: str, element: str, depth: int = 3, mode: str | None = None):
+    # mode=read|write: direct users of the element only ("what reads this table");
+    # otherwise the downstream read -> write -> read chain up to depth
+    if not db.session_exists(session_id):
+        raise HTTPException(400, "Invalid session_id")
+    if mode:
+        if mode not in ("read", "write", "any"):
+            raise HTTPException(400, "mode must be read, write or any")
+        return graph_store.users(session_id, element, mode=None if mode == "any" else mode)
+    return graph_store.impact(session_id, element, depth=depth)
+
+@api.get("/analysis/graph/path/{session_id}")
+def graph_path(session_id: str, source: str, target: str, max_hops: int = 6):
+    if not db.session_exists(session_id):
+        raise HTTPException(400, "Invalid session_id")
+    return graph_store.path(session_id, source, target, max_hops=max_hops)
+
+@api.get("/analysis/graph/search/{session_id}")
+def graph_search(session_id: str, q: str, limit: int = 20):
+    if not db.session_exists(session_id):
+        raise HTTPException(400, "Invalid session_id")
+    return {"nodes": graph_store.search(session_id, q, limit=limit)}
 
 @api.post("/export/session")
-def export_session(session_id: str = Form(...), include_llm: bool = Form(False)):
+def export_session(session_id: str = Form(...), include_llm: bool = Form(False), format: str = Form("md"),
+                   gzip: bool = Form(False), copybooks: str = Form("")):
     if not db.session_exists(session_id):
         raise HTTPException(400, "Invalid session_id")
-    lineage = lineage_analyze(db, session_id)
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(400, f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    lineage = lineage_cache.get(session_id)
+    # field usage per copybook hint (comma-separated), served from the field index result cache
+    fields = [field_index.analyze(session_id, cb) for cb in _expand_list(copybooks)]
     # fetch last assistant message as synthesis if requested
     synthesis = None
     if include_llm:
@@ -227,16 +390,19 @@ def export_session(session_id: str = Form(...), include_llm: bool = Form(False))
             if m["role"] == "assistant":
                 synthesis = m["content"]
                 break
-    md_path = export_markdown(session_id, lineage.get("lineage", lineage), synthesis, DATA_DIR)
-    return {"md_path": md_path}
+    path = export_report(session_id, lineage, DATA_DIR, fmt=format, compress=gzip, analysis_answer=synthesis,
+                         fields=fields, version=db.chunk_version(session_id))
+    out = {"path": path, "url": f"/data/exports/{os.path.basename(path)}", "format": format,
+           "bytes": os.path.getsize(path)}
+    if format == "md" and not gzip:
+        out["md_path"] = path
+    return out
 
 @api.get("/analysis/fields/{session_id}")
 def analysis_fields(session_id: str, copybook: str):
     if not db.session_exists(session_id):
         raise HTTPException(400, "Invalid session_id")
-    return analyze_fields(db, session_id, copybook)
-
-@api.get("/healthz")
+    return field_index.analyze(session_id, copybook)
 
 import zipfile, io
 from code_ingest import CodeIngestor
@@ -269,11 +435,21 @@ def batch_upload_zip(session_id: str = Form(...), archive: UploadFile = File(...
         except Exception as e:
             # skip problematic file and continue
             pass
+    field_index.refresh(session_id)
     return {"count_docs": count_docs, "count_code": count_code, "total_chunks": total_chunks}
 
+@api.get("/healthz")
 def health():
     return {"status": "ok"}
 
+@api.get("/metrics")
+def metrics():
+    # LLM call counts, retries, token usage and latency percentiles since startup
+    return {"llm": llm_stats.snapshot(), "scheduler": llm_scheduler.snapshot(), "answer_cache": answer_cache.stats(),
+            "planner": planner_stats.snapshot(), "lineage": dict(lineage_cache.stats),
+            "graph": dict(graph_store.stats), "fields": dict(field_index.stats),
+            "graph_views": dict(graph_views.stats)}
+
 
 app.include_router(api)
 
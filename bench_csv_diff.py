@@ -0,0 +1,104 @@
+# bench_csv_diff.py — compare the old per-key loop with the vectorized data_diff_on_key.
+# Usage: python bench_csv_diff.py [--rows 1000000] [--cols 8] [--check-only]
+import argparse, sys, time
+import numpy as np
+import pandas as pd
+from csv_diff import data_diff_on_key, _normalize_colnames
+
+
+def legacy_data_diff_on_key(db2_df, csv_df, key_cols, sample=20):
+    # Pre-vectorization implementation (row loop, capped at 5,000 common keys), kept for comparison.
+    db2 = db2_df.copy()
+    csv = csv_df.copy()
+    db2.columns = _normalize_colnames(db2.columns.tolist())
+    csv.columns = _normalize_colnames(csv.columns.tolist())
+    keys = [k.upper() for k in key_cols]
+    db2.set_index(keys, inplace=True, drop=False)
+    csv.set_index(keys, inplace=True, drop=False)
+    both_idx = db2.index.intersection(csv.index)
+    diffs = []
+    common_cols = sorted(list(set(db2.columns) & set(csv.columns)))
+    checked = 0
+    for idx in both_idx[:5000]:
+        checked += 1
+        row_db2 = db2.loc[idx, common_cols]
+        row_csv = csv.loc[idx, common_cols]
+        neq = (row_db2.astype(str).values != row_csv.astype(str).values)
+        if any(neq):
+            diffs.append(idx)
+            if len(diffs) >= sample:
+                break
+    return checked
+
+
+def make_frames(rows: int, cols: int, seed: int = 7):
+    rng = np.random.default_rng(seed)
+    data = {"ID": np.arange(rows)}
+    for i in range(cols):
+        data[f"C{i}"] = rng.integers(0, 1_000_000, rows) if i % 2 else rng.random(rows).round(4)
+    db2 = pd.DataFrame(data)
+    csv = db2.sample(frac=1.0, random_state=seed).reset_index(drop=True)
+    # ~1% value drift, ~0.5% keys only on one side
+    drift = rng.choice(rows, size=max(1, rows // 100), replace=False)
+    csv.loc[drift, "C0"] = csv.loc[drift, "C0"] + 1
+    csv = csv.iloc[rows // 200:]
+    db2 = db2.iloc[: rows - rows // 200]
+    return db2, csv
+
+
+def regression_checks():
+    """Small cases with known answers; returns the names of the failing ones."""
+    failed = []
+    db2 = pd.DataFrame({"ID": [1, 2, 3], "AMT": [100, 200, 300], "FLAG": [True, False, True]})
+    # keys on one side only: the outer join widens the other side's int/bool columns
+    extra = pd.concat([db2, pd.DataFrame({"ID": [4], "AMT": [400], "FLAG": [False]})], ignore_index=True)
+    for name, left, right in (("csv-only key", db2, extra), ("db2-only key", extra, db2)):
+        res = data_diff_on_key(left, right, ["ID"])
+        if res["mismatch_row_count"]:
+            failed.append(f"{name}: false mismatches {res['mismatch_counts_by_column']}")
+    # a real drift next to a one-sided key is still reported, with the original formatting
+    csv = pd.DataFrame({"ID": [1, 2, 3, 4], "AMT": [100, 201, 300, 400], "FLAG": [True, False, True, True]})
+    res = data_diff_on_key(db2, csv, ["ID"])
+    if res["mismatch_counts_by_column"] != {"AMT": 1} or res["sample_row_mismatches"][0]["csv"]["AMT"] != "201":
+        failed.append(f"drift: {res['mismatch_counts_by_column']} {res['sample_row_mismatches']}")
+    return failed
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--cols", type=int, default=8)
+    ap.add_argument("--sample", type=int, default=1_000_000,
+                    help="legacy loop stops after this many mismatches (large = scan its full 5,000-key window)")
+    ap.add_argument("--check-only", action="store_true", help="run the regression checks and exit")
+    args = ap.parse_args()
+
+    failed = regression_checks()
+    for f in failed:
+        print(f"CHECK FAILED: {f}")
+    if failed:
+        sys.exit(1)
+    print("regression checks: ok")
+    if args.check_only:
+        return
+
+    db2, csv = make_frames(args.rows, args.cols)
+    print(f"rows={args.rows:,} cols={args.cols + 1}")
+
+    t0 = time.perf_counter()
+    checked = legacy_data_diff_on_key(db2, csv, ["ID"], sample=args.sample)
+    legacy_s = time.perf_counter() - t0
+    per_key = legacy_s / max(checked, 1)
+    print(f"legacy loop : {legacy_s:8.2f}s for {checked:,} keys "
+          f"(~{per_key * args.rows:,.0f}s extrapolated to all keys)")
+
+    t0 = time.perf_counter()
+    res = data_diff_on_key(db2, csv, ["ID"], sample=20)
+    vec_s = time.perf_counter() - t0
+    print(f"vectorized  : {vec_s:8.2f}s for {res['common_key_count']:,} keys, "
+          f"{res['mismatch_row_count']:,} mismatched rows {res['mismatch_counts_by_column']}")
+    print(f"speedup (per key): {per_key * res['common_key_count'] / vec_s:,.0f}x")
+
+
+if __name__ == "__main__":
+    main()
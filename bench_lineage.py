@@ -0,0 +1,279 @@
+# bench_lineage.py — compare the former per-regex passes of lineage/field_lineage with the
+# single-pass cobol_scanner on a synthetic mainframe repository, and the process-pool path
+# (analysis_pool) with the sequential one; every variant must give identical results.
+# Usage: python bench_lineage.py [--programs 3000] [--copybooks 200] [--jcl 300] [--chunk-lines 120] [--workers 4]
+#        python bench_lineage.py --check   (small pool-vs-sequential equivalence check)
+# Exits non-zero when any variant differs.
+import argparse, os, random, re, sys, tempfile, time
+from typing import Dict, Any, List, Set, Tuple
+import analysis_pool
+from storage import DB
+from lineage import analyze_session, LineageCache, _add_op, _norm_copy_name, _finalize, RE_SQL_TABLE, RE_SQL_VERB
+from field_index import FieldIndex
+from field_lineage import analyze_fields, _collect_copybook_fields, _wordset, RE_SQL_HOST, RE_SQL_INSERT, \
+    RE_SQL_UPDATE, RE_SQL_SELECT, RE_SQL_INTO, RE_SQL_SET, RE_SQL_WHERE
+
+# --- former implementation: one finditer pass per pattern (kept for comparison) ---
+L_FILE_ASSIGN = re.compile(r'\bSELECT\s+(\S+)\s+ASSIGN\b', re.IGNORECASE)
+L_FD = re.compile(r'\bFD\s+(\S+)', re.IGNORECASE)
+L_READ = re.compile(r'\bREAD\s+(\S+)', re.IGNORECASE)
+L_WRITE = re.compile(r'\bWRITE\s+(\S+)', re.IGNORECASE)
+L_REWRITE = re.compile(r'\bREWRITE\s+(\S+)', re.IGNORECASE)
+L_DELETE = re.compile(r'\bDELETE\s+(\S+)', re.IGNORECASE)
+L_EXEC_SQL = re.compile(r'EXEC\s+SQL(.*?)END-EXEC\.', re.IGNORECASE | re.DOTALL)
+L_JCL_DD = re.compile(r'^\s*//(?P<step>\S+)\s+DD\s+DSN=(?P<dsn>[^,]+)', re.IGNORECASE | re.MULTILINE)
+L_COPY = re.compile(r'\bCOPY\s+["\']?([A-Z0-9_.\-\/]+)["\']?', re.IGNORECASE)
+L_CICS = re.compile(r'EXEC\s+CICS\s+(READ|REWRITE|WRITE|DELETE)\s+(FILE|QUEUE)\s*\(\s*([\w\-\.\']+)\s*\)', re.IGNORECASE)
+L_MQ_CALL = re.compile(r'CALL\s+["\']MQ(PUT|GET|OPEN|CLOSE)["\']', re.IGNORECASE)
+L_XML_GEN = re.compile(r'\bXML\s+GENERATE\b\s+([A-Z0-9\-]+)', re.IGNORECASE)
+L_XML_PARSE = re.compile(r'\bXML\s+PARSE\b\s+([A-Z0-9\-]+)', re.IGNORECASE)
+L_SELECT_ASSIGN = re.compile(r'\bSELECT\s+(\S+)\s+ASSIGN\s+TO\s+([A-Z0-9_\-\'"]+)', re.IGNORECASE)
+L_MOVE = re.compile(r'\bMOVE\s+([A-Z0-9\-]+)\s+TO\s+([A-Z0-9\-]+)', re.IGNORECASE)
+L_COMPUTE = re.compile(r'\bCOMPUTE\s+([A-Z0-9\-]+)\s*=', re.IGNORECASE)
+L_ADD = re.compile(r'\bADD\s+.+\s+TO\s+([A-Z0-9\-]+)', re.IGNORECASE)
+L_SUB = re.compile(r'\bSUBTRACT\s+.+\s+FROM\s+([A-Z0-9\-]+)', re.IGNORECASE)
+L_MULT = re.compile(r'\bMULTIPLY\s+.+\s+BY\s+([A-Z0-9\-]+)', re.IGNORECASE)
+L_DIV = re.compile(r'\bDIVIDE\s+.+\s+INTO\s+([A-Z0-9\-]+)', re.IGNORECASE)
+L_IF = re.compile(r'\bIF\s+([^\.]+)\.', re.IGNORECASE | re.DOTALL)
+L_WRITE_REC = re.compile(r'\bWRITE\s+([A-Z0-9\-]+)', re.IGNORECASE)
+L_REWRITE_REC = re.compile(r'\bREWRITE\s+([A-Z0-9\-]+)', re.IGNORECASE)
+
+
+def legacy_lineage(rows: List[Tuple[str, str]]) -> Dict[str, Any]:
+    files: Dict[str, Any] = {}
+    tables: Dict[str, Any] = {}
+    for program, content in rows:
+        if not any(x in (program or "").lower() for x in [".cbl", ".cob", ".cpy", ".jcl", ".cics", "db2:"]):
+            continue
+        for pat, op in ((L_FILE_ASSIGN, "ASSIGN"), (L_FD, "FD"), (L_READ, "READ"), (L_WRITE, "WRITE"),
+                        (L_REWRITE, "REWRITE"), (L_DELETE, "DELETE")):
+            for m in pat.finditer(content):
+                _add_op(files, m.group(1), op, program, 0)
+        for block in L_EXEC_SQL.findall(content):
+            vm = RE_SQL_VERB.search(block)
+            verb = vm.group(1).upper() if vm else None
+            for tm in RE_SQL_TABLE.finditer(block):
+                tbl = tm.group(1) or tm.group(2)
+                if tbl and verb:
+                    _add_op(tables, tbl.replace('\n', ' ').strip(), verb, program, 0)
+        for m in L_COPY.finditer(content):
+            logical, physical = _norm_copy_name(m.group(1).upper())
+            _add_op(files, f"COPYBOOK:{logical}", "COPY", program, 0)
+            _add_op(files, f"COPYBOOK:{physical}", "COPY", program, 0)
+        for m in L_CICS.finditer(content):
+            _add_op(files, m.group(3).strip(" '\""), f"CICS_{m.group(1).upper()}", program, 0)
+        for m in L_MQ_CALL.finditer(content):
+            _add_op(files, "MQ", f"MQ{m.group(1).upper()}", program, 0)
+        for m in L_XML_GEN.finditer(content):
+            _add_op(files, m.group(1), "XML_GENERATE", program, 0)
+        for m in L_XML_PARSE.finditer(content):
+            _add_op(files, m.group(1), "XML_PARSE", program, 0)
+        for m in L_SELECT_ASSIGN.finditer(content):
+            _add_op(files, f"LOGICAL:{m.group(1)}", f"ASSIGN:{m.group(2).strip(chr(39) + chr(34) + ' ')}", program, 0)
+        for jm in L_JCL_DD.finditer(content):
+            _add_op(files, f"DSN:{jm.group('dsn')}", "JCL_DD", program, 0)
+    return {"files": _finalize(files), "tables": _finalize(tables)}
+
+
+def legacy_field_usage(rows: List[Tuple[str, str]], fields: Dict[str, Any], record_names: Set[str]) -> Tuple[Set[str], Set[str]]:
+    input_use: Set[str] = set()
+    updated_use: Set[str] = set()
+    for _, content in rows:
+        u = content.upper()
+        candidate = _wordset(u).intersection(set(fields.keys()))
+        for im in L_IF.finditer(u):
+            input_use.update(_wordset(im.group(1)).intersection(candidate))
+        for mm in L_MOVE.finditer(u):
+            if mm.group(1) in fields: input_use.add(mm.group(1))
+            if mm.group(2) in fields: updated_use.add(mm.group(2))
+        for pat in (L_COMPUTE, L_ADD, L_SUB, L_MULT, L_DIV):
+            for m in pat.finditer(u):
+                if m.group(1) in fields: updated_use.add(m.group(1))
+        for block in re.findall(r'EXEC\s+SQL(.*?)END-EXEC\.', u, flags=re.IGNORECASE | re.DOTALL):
+            if RE_SQL_INSERT.search(block) or RE_SQL_UPDATE.search(block):
+                setm = RE_SQL_SET.search(block)
+                if setm:
+                    input_use.update(hv for hv in RE_SQL_HOST.findall(setm.group(1)) if hv in fields)
+                input_use.update(hv for hv in RE_SQL_HOST.findall(block) if hv in fields)
+            if RE_SQL_SELECT.search(block):
+                for inm in RE_SQL_INTO.finditer(block):
+                    updated_use.update(hv for hv in RE_SQL_HOST.findall(inm.group(1)) if hv in fields)
+                wm = RE_SQL_WHERE.search(block)
+                if wm:
+                    input_use.update(hv for hv in RE_SQL_HOST.findall(wm.group(1)) if hv in fields)
+        for pat in (L_WRITE_REC, L_REWRITE_REC):
+            for m in pat.finditer(u):
+                if m.group(1) in record_names:
+                    updated_use.update(fields.keys())
+    return input_use, updated_use
+
+
+# --- synthetic repository ---
+def copybook(n: int) -> str:
+    lines = [f"       01 CB{n:04d}-REC."]
+    for j in range(12):
+        value = f" VALUE 'Y'" if j % 5 == 0 else ""
+        lines.append(f"          05 CB{n:04d}-F{j:02d} PIC X({j + 1}){value}.")
+    return "\n".join(lines)
+
+
+def program(n: int, copybooks: int, rng: random.Random, body: int) -> str:
+    cb = rng.randrange(copybooks)
+    f = lambda: f"CB{cb:04d}-F{rng.randrange(12):02d}"
+    out = ["       IDENTIFICATION DIVISION.", f"       PROGRAM-ID. PGM{n:05d}.", "       ENVIRONMENT DIVISION.",
+           "       FILE-CONTROL.", f"           SELECT IN-{n} ASSIGN TO DD{n % 97:03d}.",
+           f"           SELECT OUT-{n} ASSIGN TO 'OUT{n % 89:03d}'.", "       DATA DIVISION.", f"       FD IN-{n}.",
+           f"       COPY CB{cb:04d}.", "       PROCEDURE DIVISION."]
+    stmts = [
+        lambda: f"           READ IN-{n} INTO CB{cb:04d}-REC.",
+        lambda: f"           WRITE CB{cb:04d}-REC.",
+        lambda: f"           REWRITE OUT-{n}-REC.",
+        lambda: f"           MOVE {f()} TO {f()}.",
+        lambda: f"           MOVE WS-COUNT TO {f()}.",
+        lambda: f"           COMPUTE {f()} = {f()} * 2.",
+        lambda: f"           ADD 1 TO {f()}.",
+        lambda: f"           SUBTRACT WS-FEE FROM {f()}.",
+        lambda: f"           IF {f()} > 0 AND {f()} = 'Y'\n              PERFORM 100-POST-{n}\n           END-IF.",
+        lambda: f"           EXEC SQL SELECT BAL, NAME INTO :{f()}, :{f()} FROM ACCT{n % 40:02d}\n"
+                f"                WHERE ID = :{f()} END-EXEC.",
+        lambda: f"           EXEC SQL UPDATE TXN{n % 30:02d} SET AMT = :{f()} WHERE ID = :{f()} END-EXEC.",
+        lambda: f"           EXEC SQL INSERT INTO HIST{n % 20:02d} VALUES (:{f()}) END-EXEC.",
+        lambda: f"           EXEC CICS READ FILE('VSAM{n % 50:02d}') INTO(WS-REC) END-EXEC.",
+        lambda: f"           CALL 'MQPUT' USING HCONN HOBJ MSG.",
+        lambda: f"           XML GENERATE WS-XML-{n} FROM CB{cb:04d}-REC.",
+        lambda: f"           DELETE OUT-{n} RECORD.",
+        lambda: f"      *    MOVE OLD-FIELD TO NEW-FIELD (comment)",
+        lambda: f"           PERFORM 200-NEXT-{rng.randrange(99)} THRU 200-EXIT.",
+    ]
+    for _ in range(body):
+        out.append(rng.choice(stmts)())
+    out.append("           GOBACK.")
+    return "\n".join(out)
+
+
+def jcl(n: int) -> str:
+    return "\n".join([f"//JOB{n:04d} JOB (ACCT),'NIGHTLY'", f"//STEP1   EXEC PGM=PGM{n:05d}",
+                      f"//INFILE  DD DSN=PROD.IN.D{n:04d},DISP=SHR", f"//OUTFILE DD DSN=PROD.OUT.D{n:04d},DISP=(NEW,CATLG)",
+                      "//SYSOUT  DD SYSOUT=*"])
+
+
+def build(programs: int, copybooks: int, jobs: int, body: int, chunk_lines: int, seed: int) -> Tuple[DB, str, List[Tuple[str, str]]]:
+    rng = random.Random(seed)
+    members = [(f"CB{i:04d}.cpy", copybook(i)) for i in range(copybooks)]
+    members += [(f"PGM{i:05d}.cbl", program(i, copybooks, rng, body)) for i in range(programs)]
+    members += [(f"JOB{i:04d}.jcl", jcl(i)) for i in range(jobs)]
+    db = DB(os.path.join(tempfile.mkdtemp(), "bench.sqlite"))
+    sid = db.create_session("bench")
+    rows: List[Tuple[str, str]] = []
+    for name, text in members:
+        lines = text.split("\n")
+        parts = ["\n".join(lines[i:i + chunk_lines]) for i in range(0, len(lines), chunk_lines)]
+        db.add_chunks(sid, name, list(enumerate(parts)))
+        rows += [(name, p) for p in parts]
+    return db, sid, rows
+
+
+def same_lineage(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    # key order too: exports and graphs iterate it
+    return a == b and list(a["files"]) == list(b["files"]) and list(a["tables"]) == list(b["tables"])
+
+
+def check(workers: int) -> List[str]:
+    """Pool path vs sequential on a small repository, with the parallel thresholds forced low
+    so every pool code path runs (odd batch size: ranges split members across batches)."""
+    failed = []
+    analysis_pool.ANALYSIS_WORKERS = workers
+    analysis_pool.ANALYSIS_PARALLEL_MIN_CHUNKS = 1
+    analysis_pool.ANALYSIS_BATCH_CHUNKS = 7
+    db, sid, _ = build(60, 8, 6, 40, 20, 11)
+
+    seq = analyze_session(db, sid, workers=1)
+    if not same_lineage(analyze_session(db, sid, workers=workers), seq):
+        failed.append("analyze_session")
+    for hint in ("CB0003", "CB0007", "NOPE"):
+        ref = analyze_fields(db, sid, hint, workers=1)
+        if analyze_fields(db, sid, hint, workers=workers) != ref:
+            failed.append(f"analyze_fields {hint}")
+        if FieldIndex(db).analyze(sid, hint) != ref:
+            failed.append(f"FieldIndex.analyze {hint}")
+
+    cache = LineageCache(db)
+    if not same_lineage(cache.get(sid), seq):
+        failed.append("LineageCache cold")
+    # incremental: one member replaced, one removed, one added
+    db.delete_file_chunks(sid, "PGM00003.cbl")
+    db.add_chunks(sid, "PGM00003.cbl", [(0, program(3, 8, random.Random(99), 40))])
+    db.delete_file_chunks(sid, "PGM00010.cbl")
+    db.add_chunks(sid, "PGM99999.cbl", [(0, program(99999, 8, random.Random(5), 40))])
+    if not same_lineage(cache.get(sid), analyze_session(db, sid, workers=1)):
+        failed.append("LineageCache incremental")
+    return failed
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--programs", type=int, default=3000)
+    ap.add_argument("--copybooks", type=int, default=200)
+    ap.add_argument("--jcl", type=int, default=300)
+    ap.add_argument("--body", type=int, default=150, help="statements per program")
+    ap.add_argument("--chunk-lines", type=int, default=120)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--workers", type=int, default=4, help="process pool size for the parallel runs")
+    ap.add_argument("--check", action="store_true", help="only run the small pool-vs-sequential check")
+    args = ap.parse_args()
+
+    if args.check:
+        failed = check(max(2, args.workers))
+        for f in failed:
+            print(f"MISMATCH: {f}")
+        print("check: " + ("FAILED" if failed else "ok"))
+        sys.exit(1 if failed else 0)
+
+    db, sid, rows = build(args.programs, args.copybooks, args.jcl, args.body, args.chunk_lines, args.seed)
+    mb = sum(len(c) for _, c in rows) / 1e6
+    print(f"members={args.programs + args.copybooks + args.jcl} chunks={len(rows)} text={mb:.1f} MB")
+    results: Dict[str, bool] = {}
+
+    t = time.perf_counter(); old = legacy_lineage(rows); t_old = time.perf_counter() - t
+    t = time.perf_counter(); new = analyze_session(db, sid, workers=1); t_new = time.perf_counter() - t
+    same = results["lineage scanner"] = same_lineage(old, new)
+    print(f"lineage  legacy {t_old:7.2f}s  scanner {t_new:7.2f}s  speedup x{t_old / t_new:4.1f}  identical={same}")
+
+    hint = "CB0007"
+    t = time.perf_counter(); res = analyze_fields(db, sid, hint, workers=1); t_new = time.perf_counter() - t
+    t = time.perf_counter()
+    fields: Dict[str, Any] = {}
+    recs: Set[str] = set()
+    for name, text in rows:
+        low = name.lower()
+        if ".cpy" in low and (hint in name.upper() or hint in text.upper()):
+            rec, fd = _collect_copybook_fields(text)
+            if rec: recs.add(rec)
+            for k, v in fd.items():
+                fields.setdefault(k, v)
+    inp, upd = legacy_field_usage(rows, fields, recs)
+    t_old = time.perf_counter() - t
+    same = results["fields scanner"] = sorted(inp) == res["fields"]["input"] and sorted(upd) == res["fields"]["derived_or_updated"]
+    print(f"fields   legacy {t_old:7.2f}s  scanner {t_new:7.2f}s  speedup x{t_old / t_new:4.1f}  identical={same}")
+
+    # process pool vs sequential (the first call also pays for spawning the workers)
+    analyze_session(db, sid, workers=args.workers)
+    t = time.perf_counter(); par = analyze_session(db, sid, workers=args.workers); t_par = time.perf_counter() - t
+    same = results["lineage pool"] = same_lineage(par, new)
+    print(f"lineage  {args.workers} workers {t_par:7.2f}s  identical={same}")
+    t = time.perf_counter(); pres = analyze_fields(db, sid, hint, workers=args.workers); t_par = time.perf_counter() - t
+    same = results["fields pool"] = pres == res
+    print(f"fields   {args.workers} workers {t_par:7.2f}s  identical={same}")
+    analysis_pool.ANALYSIS_WORKERS = args.workers
+    t = time.perf_counter(); cached = LineageCache(db).get(sid); t_par = time.perf_counter() - t
+    same = results["LineageCache"] = same_lineage(cached, new)
+    print(f"LineageCache cold refresh {t_par:7.2f}s  equal={same}")
+
+    failed = [k for k, ok in results.items() if not ok]
+    if failed:
+        print("MISMATCH: " + ", ".join(failed))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 
-import os, requests, streamlit as st
+import os, json, requests, streamlit as st
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -28,36 +28,53 @@ st.sidebar.write(f"Active: `{sid}`")
 
 with tabs[0]:
     st.header("Upload Documents")
-uploaded = st.file_uploader("Upload PDF/DOCX/TXT", type=["pdf","docx","txt"], accept_multiple_files=True)
-if uploaded and st.button("Ingest"):
-    files = [("files", (f.name, f.read(), f.type or "application/octet-stream")) for f in uploaded]
-    data = {"session_id": sid}
-    r = requests.post(f"{API_BASE}/upload", files=files, data=data, timeout=600)
-    st.success(r.json())
+    uploaded = st.file_uploader("Upload PDF/DOCX/TXT", type=["pdf","docx","txt"], accept_multiple_files=True)
+    if uploaded and st.button("Ingest"):
+        files = [("files", (f.name, f.read(), f.type or "application/octet-stream")) for f in uploaded]
+        data = {"session_id": sid}
+        r = requests.post(f"{API_BASE}/upload", files=files, data=data, timeout=600)
+        st.success(r.json())
 
     st.header("Chat")
-if "messages" not in st.session_state:
-    st.session_state["messages"] = []
-
-# Load previous
-hr = requests.get(f"{API_BASE}/history/{sid}", timeout=30)
-history = hr.json().get("history", [])
-for m in history:
-    with st.chat_message(m["role"]):
-        st.markdown(m["content"])
-        if m["role"] == "assistant" and m.get("citations"):
-            st.caption(f"Citations: {m['citations']}")
+    if "messages" not in st.session_state:
+        st.session_state["messages"] = []
+
+    # Load previous
+    hr = requests.get(f"{API_BASE}/history/{sid}", timeout=30)
+    history = hr.json().get("history", [])
+    for m in history:
+        with st.chat_message(m["role"]):
+            st.markdown(m["content"])
+            if m["role"] == "assistant" and m.get("citations"):
+                st.caption(f"Citations: {m['citations']}")
 
     user_input = st.chat_input("Ask about your internal documents…")
     if user_input:
         with st.chat_message("user"):
-        st.markdown(user_input)
-    st.session_state["messages"].append({"role":"user","content":user_input})
-    r = requests.post(f"{API_BASE}/chat", json={"session_id": sid, "message": user_input}, timeout=120)
-    data = r.json()
-            with st.chat_message("assistant"):
-            st.markdown(data["answer"])
-        st.caption(f"Citations: {data['citations']}")
+            st.markdown(user_input)
+        st.session_state["messages"].append({"role":"user","content":user_input})
+        citations = []
+
+        def stream_answer():
+            # /chat/stream sends citations first, then tokens as the model writes them
+            with requests.post(f"{API_BASE}/chat/stream", json={"session_id": sid, "message": user_input},
+                               stream=True, timeout=(10, 300)) as r:
+                event = None
+                for line in r.iter_lines(decode_unicode=True):
+                    if line.startswith("event:"):
+                        event = line[6:].strip()
+                    elif line.startswith("data:"):
+                        data = json.loads(line[5:])
+                        if event == "token":
+                            yield data["text"]
+                        elif event == "citations":
+                            citations.extend(data["citations"])
+                        elif event == "error":
+                            yield f"\n\n_Error: {data['detail']}_"
+
+        with st.chat_message("assistant"):
+            st.write_stream(stream_answer())
+            st.caption(f"Citations: {citations}")
 
 
 with tabs[1]:
@@ -99,6 +116,7 @@ with tabs[3]:
     key_cols = st.text_input("Key columns (comma-separated)", value="ID")
     db2_limit = st.number_input("DB2 sample rows (for performance)", min_value=100, value=2000, step=100)
     sample_mismatches = st.number_input("Sample mismatches to show", min_value=5, value=20, step=5)
+    full_diff = st.checkbox("Full reconciliation (every row, streamed through disk buckets)", value=False)
     csv_upload = st.file_uploader("Upload CSV", type=["csv"])
     if st.button("Run Diff"):
         if not csv_upload or not table_name or not key_cols.strip():
@@ -111,14 +129,15 @@ with tabs[3]:
                 "key_cols": key_cols,
                 "sample_mismatches": int(sample_mismatches),
                 "db2_limit": int(db2_limit),
+                "mode": "full" if full_diff else "sample",
             }
             files = {"csv_file": (csv_upload.name, csv_upload.getvalue(), "text/csv")}
             r = requests.post(f"{API_BASE}/db2/csv-diff", data=data, files=files, timeout=600)
             res = r.json()
             st.subheader("Schema Diff")
-            st.json(res.get("schema", {}))
-            st.subheader("Data Diff (sample)")
-            st.json(res.get("data", {}))
+            st.json(res.get("schema_diff", {}))
+            st.subheader("Data Diff")
+            st.json(res.get("data_diff", {}))
 
 with tabs[4]:
     st.header("Lineage / CRUD Maps")
@@ -163,16 +182,21 @@ with tabs[5]:
 
 with tabs[6]:
     st.header("Export")
-    st.caption("Export analysis as Markdown (and download).")
+    st.caption("Export analysis as Markdown, CSV, JSONL or GraphML (and download).")
     include_llm = st.checkbox("Include last LLM synthesis from Chat", value=True)
-    if st.button("Generate Markdown"):
-        r = requests.post(f"{API_BASE}/export/session", data={"session_id": sid, "include_llm": "true" if include_llm else "false"}, timeout=600)
-        path = r.json().get("md_path")
+    fmt = st.selectbox("Format", ["md", "csv", "jsonl", "graphml"])
+    use_gzip = st.checkbox("gzip", value=False)
+    export_cbs = st.text_input("Field usage for copybooks (comma-separated, optional)", "")
+    if st.button("Generate Export"):
+        r = requests.post(f"{API_BASE}/export/session", data={"session_id": sid, "include_llm": "true" if include_llm else "false",
+                          "format": fmt, "gzip": "true" if use_gzip else "false", "copybooks": export_cbs}, timeout=600)
+        path = r.json().get("path")
         if path:
-            st.success(f"Markdown generated: {path}")
+            st.success(f"Export generated: {path}")
             # Fetch content and enable download
             try:
-                txt = open(path, "r", encoding="utf-8").read()
-                st.download_button("Download Markdown", txt, file_name=path.split("/")[-1], mime="text/markdown")
+                data = open(path, "rb").read()
+                st.download_button("Download export", data, file_name=path.split("/")[-1],
+                                   mime="application/gzip" if use_gzip else "text/plain")
             except Exception:
                 st.info("Open the file from the server path if download isn't available.")
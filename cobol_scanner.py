@@ -0,0 +1,89 @@
+# cobol_scanner.py
+import re
+from typing import Dict, List, Tuple, Iterable, Pattern
+
+# One lexical pass over a COBOL/JCL chunk. A single anchor regex finds every keyword that can
+# start a statement of interest; the statement pattern of each event kind registered for that
+# keyword is then matched *at* the anchor. Each kind remembers where its last match ended and
+# ignores anchors before it, which reproduces re.finditer's non-overlapping semantics per
+# pattern, so consumers see exactly the matches the former per-pattern passes produced.
+
+# kind -> (anchor keyword, anchored statement pattern)
+PATTERNS: Dict[str, Tuple[str, Pattern]] = {
+    # file / VSAM operations (lineage)
+    "assign": ("SELECT", re.compile(r'SELECT\s+(\S+)\s+ASSIGN\b', re.IGNORECASE)),
+    "select_assign": ("SELECT", re.compile(r'SELECT\s+(\S+)\s+ASSIGN\s+TO\s+([A-Z0-9_\-\'"]+)', re.IGNORECASE)),
+    "fd": ("FD", re.compile(r'FD\s+(\S+)', re.IGNORECASE)),
+    "read": ("READ", re.compile(r'READ\s+(\S+)', re.IGNORECASE)),
+    "write": ("WRITE", re.compile(r'WRITE\s+(\S+)', re.IGNORECASE)),
+    "rewrite": ("REWRITE", re.compile(r'REWRITE\s+(\S+)', re.IGNORECASE)),
+    "delete": ("DELETE", re.compile(r'DELETE\s+(\S+)', re.IGNORECASE)),
+    "copy": ("COPY", re.compile(r'COPY\s+["\']?([A-Z0-9_.\-\/]+)["\']?', re.IGNORECASE)),
+    "cics": ("EXEC", re.compile(r'EXEC\s+CICS\s+(READ|REWRITE|WRITE|DELETE)\s+(FILE|QUEUE)\s*\(\s*([\w\-\.\']+)\s*\)', re.IGNORECASE)),
+    "mq": ("CALL", re.compile(r'CALL\s+["\']MQ(PUT|GET|OPEN|CLOSE)["\']', re.IGNORECASE)),
+    "xml_generate": ("XML", re.compile(r'XML\s+GENERATE\b\s+([A-Z0-9\-]+)', re.IGNORECASE)),
+    "xml_parse": ("XML", re.compile(r'XML\s+PARSE\b\s+([A-Z0-9\-]+)', re.IGNORECASE)),
+    "jcl_dd": ("//", re.compile(r'\s*//(?P<step>\S+)\s+DD\s+DSN=(?P<dsn>[^,]+)', re.IGNORECASE)),
+    # EXEC SQL ... END-EXEC. block body (lineage tables, field host variables)
+    "sql": ("EXEC", re.compile(r'EXEC\s+SQL(.*?)END-EXEC\.', re.IGNORECASE | re.DOTALL)),
+    # data flow (field usage)
+    "move": ("MOVE", re.compile(r'MOVE\s+([A-Z0-9\-]+)\s+TO\s+([A-Z0-9\-]+)', re.IGNORECASE)),
+    "compute": ("COMPUTE", re.compile(r'COMPUTE\s+([A-Z0-9\-]+)\s*=', re.IGNORECASE)),
+    "add": ("ADD", re.compile(r'ADD\s+.+\s+TO\s+([A-Z0-9\-]+)', re.IGNORECASE)),
+    "subtract": ("SUBTRACT", re.compile(r'SUBTRACT\s+.+\s+FROM\s+([A-Z0-9\-]+)', re.IGNORECASE)),
+    "multiply": ("MULTIPLY", re.compile(r'MULTIPLY\s+.+\s+BY\s+([A-Z0-9\-]+)', re.IGNORECASE)),
+    "divide": ("DIVIDE", re.compile(r'DIVIDE\s+.+\s+INTO\s+([A-Z0-9\-]+)', re.IGNORECASE)),
+    "if": ("IF", re.compile(r'IF\s+([^\.]+)\.', re.IGNORECASE | re.DOTALL)),
+    "write_rec": ("WRITE", re.compile(r'WRITE\s+([A-Z0-9\-]+)', re.IGNORECASE)),
+    "rewrite_rec": ("REWRITE", re.compile(r'REWRITE\s+([A-Z0-9\-]+)', re.IGNORECASE)),
+}
+
+LINEAGE_KINDS = ("assign", "fd", "read", "write", "rewrite", "delete", "sql", "copy", "cics", "mq",
+                 "xml_generate", "xml_parse", "select_assign", "jcl_dd")
+FIELD_KINDS = ("if", "move", "compute", "add", "subtract", "multiply", "divide", "sql", "write_rec", "rewrite_rec")
+
+# EXEC and CALL were matched without a leading \b; JCL DD lines start a line
+_UNBOUNDED = ("EXEC", "CALL")
+
+
+class Scanner:
+    """Single-pass event scanner for a fixed set of event kinds (see PATTERNS)."""
+    def __init__(self, kinds: Iterable[str]):
+        self.kinds = tuple(dict.fromkeys(kinds))
+        self._by_anchor: Dict[str, List[Tuple[str, Pattern]]] = {}
+        for kind in self.kinds:
+            anchor, pat = PATTERNS[kind]
+            self._by_anchor.setdefault(anchor, []).append((kind, pat))
+        words = sorted(a for a in self._by_anchor if a not in _UNBOUNDED and a != "//")
+        alts = []
+        if words:
+            alts.append(r'\b(?:' + "|".join(words) + r')\b')
+        alts += [a for a in _UNBOUNDED if a in self._by_anchor]
+        if "//" in self._by_anchor:
+            alts.append(r'^\s*//')
+        self._anchor = re.compile("|".join(f"({a})" for a in alts), re.IGNORECASE | re.MULTILINE)
+
+    def scan(self, content: str) -> Dict[str, List[Tuple[str, ...]]]:
+        """kind -> match groups, in text order."""
+        events: Dict[str, List[Tuple[str, ...]]] = {k: [] for k in self.kinds}
+        consumed = dict.fromkeys(self.kinds, 0)
+        by_anchor = self._by_anchor
+        for am in self._anchor.finditer(content):
+            word = am.group(0)
+            pos = am.start()
+            if word.endswith("//"):
+                key = "//"
+            else:
+                key = word.upper()
+            for kind, pat in by_anchor[key]:
+                if pos < consumed[kind]:
+                    continue
+                m = pat.match(content, pos)
+                if m:
+                    consumed[kind] = m.end()
+                    events[kind].append(m.groups())
+        return events
+
+
+lineage_scanner = Scanner(LINEAGE_KINDS)
+field_scanner = Scanner(FIELD_KINDS)
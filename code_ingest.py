@@ -1,35 +1,218 @@
 # code_ingest.py
 import re
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from storage import DB
 from retriever import VectorStore
 
 MAINFRAME_EXTS = (".cbl", ".cob", ".cpy", ".jcl", ".cics", ".pli", ".sql", ".asm", ".map")
+JCL_EXTS = (".jcl", ".proc", ".prc")
+
+# COBOL structure markers (matched against the source area, see _source_area)
+RE_DIVISION = re.compile(r'^\s*(IDENTIFICATION|ID|ENVIRONMENT|DATA|PROCEDURE)\s+DIVISION\b', re.IGNORECASE)
+RE_SECTION = re.compile(r'^\s*([A-Z0-9][A-Z0-9\-]*)\s+SECTION\s*\.', re.IGNORECASE)
+RE_PARAGRAPH = re.compile(r'^ {0,3}([A-Z0-9][A-Z0-9\-]*)\s*\.\s*$', re.IGNORECASE)
+RE_RECORD = re.compile(r'^\s*(01|FD|SD)\s+([A-Z0-9][A-Z0-9\-]*)', re.IGNORECASE)
+RE_EXEC_START = re.compile(r'\bEXEC\s+(SQL|CICS|DLI)\b', re.IGNORECASE)
+RE_END_EXEC = re.compile(r'\bEND-EXEC\b', re.IGNORECASE)
+NOT_PARAGRAPHS = {"EXIT", "GOBACK", "CONTINUE", "STOP", "ELSE"}
+
+# JCL structure markers
+RE_JCL_JOB = re.compile(r'^//([A-Z0-9@#$]+)\s+JOB\b', re.IGNORECASE)
+RE_JCL_STEP = re.compile(r'^//([A-Z0-9@#$]+)\s+EXEC\b', re.IGNORECASE)
+
+
+def _source_area(line: str) -> Optional[str]:
+    """Return the code part of a COBOL line, or None for comments.
+    Fixed-format lines (sequence area + indicator column) are cut down to Area A/B."""
+    if len(line) > 6 and all(ch.isdigit() or ch == " " for ch in line[:6]):
+        if line[6] in "*/":
+            return None
+        return line[7:72]
+    if line.lstrip().startswith("*>"):
+        return None
+    return line
+
+
+def _cobol_units(lines: List[str]) -> List[Dict[str, Any]]:
+    # One unit per structural element (division/section/paragraph/01-level record).
+    units: List[Dict[str, Any]] = []
+    cut_ok = [True] * len(lines)
+    division = section = None
+    in_exec = False
+    cur = {"start": 0, "division": None, "section": None, "kind": None, "name": None}
+
+    for i, raw in enumerate(lines):
+        code = _source_area(raw)
+        if code is None:
+            cut_ok[i] = not in_exec
+            continue
+
+        boundary = None
+        if not in_exec:
+            dm = RE_DIVISION.match(code)
+            sm = RE_SECTION.match(code)
+            if dm:
+                division = dm.group(1).upper()
+                division = "IDENTIFICATION" if division == "ID" else division
+                section = None
+                boundary = ("division", division)
+            elif sm:
+                section = sm.group(1).upper()
+                boundary = ("section", section)
+            elif division in (None, "DATA") and RE_RECORD.match(code):
+                boundary = ("record", RE_RECORD.match(code).group(2).upper())
+            elif division in (None, "PROCEDURE"):
+                pm = RE_PARAGRAPH.match(code)
+                if pm and pm.group(1).upper() not in NOT_PARAGRAPHS and not pm.group(1).upper().startswith("END-"):
+                    boundary = ("paragraph", pm.group(1).upper())
+
+        if boundary and i > cur["start"]:
+            cur["end"] = i
+            units.append(cur)
+        if boundary:
+            cur = {"start": i, "division": division, "section": section, "kind": boundary[0], "name": boundary[1]}
+
+        # Track EXEC ... END-EXEC so no chunk boundary ever lands inside one
+        pos = 0
+        while True:
+            if in_exec:
+                em = RE_END_EXEC.search(code, pos)
+                if not em:
+                    break
+                in_exec, pos = False, em.end()
+            else:
+                sm = RE_EXEC_START.search(code, pos)
+                if not sm:
+                    break
+                in_exec, pos = True, sm.end()
+        cut_ok[i] = not in_exec
+
+    if lines:
+        cur["end"] = len(lines)
+        units.append(cur)
+    for u in units:
+        u["cut_ok"] = cut_ok
+    return units
+
+
+def _jcl_units(lines: List[str]) -> List[Dict[str, Any]]:
+    units: List[Dict[str, Any]] = []
+    cut_ok = [True] * len(lines)
+    cur = {"start": 0, "division": None, "section": None, "kind": None, "name": None}
+    for i, line in enumerate(lines):
+        m = RE_JCL_STEP.match(line) or RE_JCL_JOB.match(line)
+        if not m:
+            continue
+        kind = "step" if RE_JCL_STEP.match(line) else "job"
+        if i > cur["start"]:
+            cur["end"] = i
+            units.append(cur)
+        cur = {"start": i, "division": None, "section": None, "kind": kind, "name": m.group(1).upper()}
+    if lines:
+        cur["end"] = len(lines)
+        units.append(cur)
+    for u in units:
+        u["cut_ok"] = cut_ok
+    return units
+
+
+def _split_unit(unit: Dict[str, Any], max_lines: int) -> List[Dict[str, Any]]:
+    # Split an oversized unit at line boundaries, never inside an EXEC block.
+    cut_ok = unit["cut_ok"]
+    pieces = []
+    start = unit["start"]
+    while unit["end"] - start > max_lines:
+        cut = None
+        for j in range(start + max_lines - 1, start - 1, -1):
+            if cut_ok[j]:
+                cut = j + 1
+                break
+        if cut is None:
+            # EXEC block longer than max_lines: keep it whole and cut right after it
+            cut = next((j + 1 for j in range(start + max_lines, unit["end"]) if cut_ok[j]), unit["end"])
+        pieces.append(dict(unit, start=start, end=cut))
+        start = cut
+    if start < unit["end"]:
+        pieces.append(dict(unit, start=start, end=unit["end"]))
+    return pieces
+
+
+def structured_chunks(filename: str, lines: List[str], max_lines: int = 120) -> List[Dict[str, Any]]:
+    """Split source lines into chunks aligned to divisions, sections, paragraphs,
+    01-level records and JCL steps. Whole units are packed together up to max_lines
+    (the PROCEDURE DIVISION is never packed with data/environment code) and
+    EXEC SQL/CICS/DLI blocks are never split. Returns dicts with 0-based
+    start/end line indexes and the structural names each chunk covers."""
+    is_jcl = filename.lower().endswith(JCL_EXTS)
+    units = _jcl_units(lines) if is_jcl else _cobol_units(lines)
+
+    chunks: List[Dict[str, Any]] = []
+    cur = None
+    for unit in units:
+        for piece in _split_unit(unit, max_lines):
+            is_proc = piece["division"] == "PROCEDURE"
+            mergeable = (
+                cur is not None
+                and cur["is_proc"] == is_proc
+                and (piece["end"] - cur["start"]) <= max_lines
+            )
+            if not mergeable:
+                if cur is not None:
+                    chunks.append(cur)
+                cur = {"start": piece["start"], "end": piece["end"], "is_proc": is_proc,
+                       "divisions": [], "sections": [], "paragraphs": [], "records": [], "steps": []}
+            cur["end"] = piece["end"]
+            named = {"division": piece["division"], "section": piece["section"]}
+            if piece["kind"] in ("paragraph", "record", "step"):
+                named[piece["kind"]] = piece["name"]
+            for kind, name in named.items():
+                if name and name not in cur[kind + "s"]:
+                    cur[kind + "s"].append(name)
+    if cur is not None:
+        chunks.append(cur)
+    for c in chunks:
+        c.pop("is_proc")
+    return chunks
+
 
 class CodeIngestor:
-    """Chunk code with line numbers preserved for better pinpointing."""
-    def __init__(self, db: DB, vector: VectorStore, lines_per_chunk: int = 120):
+    """Chunk code as raw text; 1-based start_line/end_line are kept in chunk metadata
+    for pinpointing and re-applied only when prompts/citations are built.
+    mode="structured" follows COBOL/JCL structure (see structured_chunks);
+    mode="fixed" cuts plain lines_per_chunk windows."""
+    def __init__(self, db: DB, vector: VectorStore, lines_per_chunk: int = 120, mode: str = "structured"):
         self.db = db
         self.vector = vector
         self.lines_per_chunk = lines_per_chunk
+        self.mode = mode
+
+    def _spans(self, filename: str, lines: List[str]) -> List[Dict[str, Any]]:
+        if self.mode == "structured":
+            return structured_chunks(filename, lines, max_lines=self.lines_per_chunk)
+        return [{"start": i, "end": min(len(lines), i + self.lines_per_chunk)}
+                for i in range(0, len(lines), self.lines_per_chunk)]
 
     def ingest_code(self, session_id: str, filename: str, code_text: str) -> int:
         lines = code_text.splitlines()
-        chunks: List[str] = []
-        for i in range(0, len(lines), self.lines_per_chunk):
-            block = lines[i:i + self.lines_per_chunk]
-            numbered = "\n".join(f"{i+1+j:05d}: {ln}" for j, ln in enumerate(block))
-            chunks.append(numbered)
-
+        spans = self._spans(filename, lines)
         metas: List[Dict[str, Any]] = []
-        for idx, chunk in enumerate(chunks):
-            cid = self.db.add_chunk(session_id, filename, idx, chunk)
-            metas.append({
+        for idx, sp in enumerate(spans):
+            chunk = "\n".join(lines[sp["start"]:sp["end"]])
+            start_line, end_line = sp["start"] + 1, sp["end"]
+            cid = self.db.add_chunk(session_id, filename, idx, chunk, start_line=start_line, end_line=end_line)
+            meta = {
                 "chunk_id": cid,
                 "session_id": session_id,
                 "filename": filename,
                 "text": chunk,
                 "kind": "code",
-            })
-        self.vector.add_texts([m["text"] for m in metas], metas)
-        return len(chunks)
+                "start_line": start_line,
+                "end_line": end_line,
+            }
+            for key in ("divisions", "sections", "paragraphs", "records", "steps"):
+                if sp.get(key):
+                    meta[key] = sp[key]
+            metas.append(meta)
+        if metas:
+            self.vector.add_texts([m["text"] for m in metas], metas)
+        return len(metas)
@@ -0,0 +1,161 @@
+# code_summarizer.py
+import os, time, hashlib, sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Tuple
+from storage import DB
+from llm_client import LLMClient
+from llm_scheduler import BATCH
+from prompts import SYSTEM_CODE_MAP, SYSTEM_CODE_REDUCE, code_map_messages, code_reduce_messages
+
+CODE_SUMMARY_WORKERS = int(os.getenv("CODE_SUMMARY_WORKERS", "4"))
+# members longer than this (chars) are summarized in parts; more summaries than fit in
+# CODE_SUMMARY_REDUCE_CHARS are reduced in rounds
+CODE_SUMMARY_MAP_CHARS = int(os.getenv("CODE_SUMMARY_MAP_CHARS", "12000"))
+CODE_SUMMARY_REDUCE_CHARS = int(os.getenv("CODE_SUMMARY_REDUCE_CHARS", "16000"))
+
+
+def _sha(*parts: str) -> str:
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(p.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _pack(items: List[Tuple[str, str]], limit: int) -> List[List[Tuple[str, str]]]:
+    # consecutive (name, text) items grouped up to limit chars; an oversized item gets its own group
+    groups, cur, size = [], [], 0
+    for name, text in items:
+        if cur and size + len(text) > limit:
+            groups.append(cur)
+            cur, size = [], 0
+        cur.append((name, text))
+        size += len(text)
+    if cur:
+        groups.append(cur)
+    return groups
+
+
+class CodeSummarizer:
+    """Map-reduce summary of the code in a session.
+
+    Map: every member (program, copybook, JCL...) is summarized on its own, in parallel
+    on up to `workers` threads; members over map_chars are summarized per chunk group and
+    merged. Member summaries are cached in `code_summaries` by a hash of the member text
+    (and the map prompt), so after a code change only changed members go to the LLM.
+    Reduce: member summaries are merged into the session summary, in rounds when they do
+    not fit in one prompt. All calls run in the scheduler's batch class."""
+    def __init__(self, db: DB, llm: LLMClient | None = None, workers: int = CODE_SUMMARY_WORKERS,
+                 map_chars: int = CODE_SUMMARY_MAP_CHARS, reduce_chars: int = CODE_SUMMARY_REDUCE_CHARS):
+        self.db = db
+        self.llm = llm or LLMClient(priority=BATCH)
+        self.workers = max(1, workers)
+        self.map_chars = map_chars
+        self.reduce_chars = reduce_chars
+        self._init()
+
+    def _init(self):
+        with sqlite3.connect(self.db.db_path) as con:
+            con.execute("""
+            CREATE TABLE IF NOT EXISTS code_summaries(
+                content_hash TEXT PRIMARY KEY,
+                kind TEXT,
+                filename TEXT,
+                summary TEXT,
+                created_at REAL
+            );
+            """)
+            con.commit()
+
+    def _cached(self, key: str) -> str | None:
+        with sqlite3.connect(self.db.db_path) as con:
+            row = con.execute("SELECT summary FROM code_summaries WHERE content_hash = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _store(self, key: str, kind: str, filename: str, summary: str):
+        with sqlite3.connect(self.db.db_path) as con:
+            con.execute(
+                "INSERT OR REPLACE INTO code_summaries(content_hash, kind, filename, summary, created_at) VALUES (?, ?, ?, ?, ?)",
+                (key, kind, filename, summary, time.time())
+            )
+            con.commit()
+
+    def _map_file(self, session_id: str, filename: str, chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        text = "\n".join(c["text"] or "" for c in chunks)
+        # the prompt names the member, so the name is part of the key, not just the text
+        key = _sha(SYSTEM_CODE_MAP, filename, text)
+        out = {"filename": filename, "hash": key[:16], "lines": chunks[-1].get("end_line") or 0,
+               "chunk_id": chunks[0]["chunk_id"]}
+        summary = self._cached(key)
+        if summary is not None:
+            return dict(out, summary=summary, cached=True)
+        t0 = time.perf_counter()
+        parts = _pack([(filename, c["text"] or "") for c in chunks], self.map_chars)
+        if len(parts) == 1:
+            summary = self.llm.chat(code_map_messages(filename, text), temperature=0.0, max_tokens=600,
+                                    session_id=session_id)
+        else:
+            pieces = []
+            for i, part in enumerate(parts, 1):
+                pieces.append({"name": f"{filename} part {i}/{len(parts)}", "summary": self.llm.chat(
+                    code_map_messages(filename, "\n".join(t for _, t in part), f"part {i}/{len(parts)}"),
+                    temperature=0.0, max_tokens=500, session_id=session_id)})
+            summary = self.llm.chat(code_reduce_messages(f"Merge these part summaries into one summary of {filename}.", pieces),
+                                    temperature=0.0, max_tokens=700, session_id=session_id)
+        self._store(key, "file", filename, summary)
+        return dict(out, summary=summary, cached=False, ms=round((time.perf_counter() - t0) * 1000, 1))
+
+    def _reduce(self, session_id: str, instruction: str, items: List[Dict[str, str]], pool: ThreadPoolExecutor) -> Tuple[str, int]:
+        """(summary, rounds): intermediate rounds merge groups that fit reduce_chars."""
+        rounds = 0
+        while len(items) > 1 and sum(len(i["summary"]) for i in items) > self.reduce_chars:
+            rounds += 1
+            groups = _pack([(i["name"], i["summary"]) for i in items], self.reduce_chars)
+            if len(groups) == len(items):  # every summary alone fills a prompt: nothing left to merge
+                break
+            merge = "Merge these summaries into one, keeping every member name and its key facts."
+            futures = [pool.submit(self.llm.chat, code_reduce_messages(merge, [{"name": n, "summary": s} for n, s in g]),
+                                   temperature=0.0, max_tokens=900, session_id=session_id) for g in groups]
+            items = [{"name": f"{g[0][0]} .. {g[-1][0]}" if len(g) > 1 else g[0][0], "summary": f.result()}
+                     for g, f in zip(groups, futures)]
+        final = self.llm.chat(code_reduce_messages(instruction, items), temperature=0.0, max_tokens=1200,
+                              session_id=session_id)
+        return final, rounds + 1
+
+    def summarize(self, session_id: str, instruction: str) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        files = self.db.get_file_chunks(session_id, code_only=True)
+        if not files:
+            return {"answer": "No code has been ingested in this session.", "citations": [], "files": [],
+                    "timings": {"total_ms": 0.0}}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="codesum") as pool:
+            futures = {name: pool.submit(self._map_file, session_id, name, chunks) for name, chunks in sorted(files.items())}
+            mapped, failed = [], []
+            for name, f in futures.items():
+                try:
+                    mapped.append(f.result())
+                except Exception as e:
+                    failed.append({"filename": name, "error": str(e)})
+            if not mapped:
+                raise futures[failed[0]["filename"]].exception()
+            map_ms = round((time.perf_counter() - t0) * 1000, 1)
+
+            # an unchanged set of members with the same instruction reuses the session summary too
+            t1 = time.perf_counter()
+            key = _sha(SYSTEM_CODE_REDUCE, instruction, *(m["hash"] for m in mapped))
+            answer, rounds = self._cached(key), 0
+            if answer is None:
+                answer, rounds = self._reduce(session_id, instruction,
+                                              [{"name": m["filename"], "summary": m["summary"]} for m in mapped], pool)
+                if not failed:
+                    self._store(key, "session", "", answer)
+        citations = [{"chunk_id": m["chunk_id"], "filename": m["filename"], "score": 1.0, "start_line": 1,
+                      "end_line": m["lines"]} for m in mapped]
+        return {
+            "answer": answer,
+            "citations": citations,
+            "files": [{k: m[k] for k in ("filename", "hash", "cached")} for m in mapped] + [dict(f, cached=False) for f in failed],
+            "timings": {"map_ms": map_ms, "reduce_ms": round((time.perf_counter() - t1) * 1000, 1), "reduce_rounds": rounds,
+                        "files": len(files), "files_cached": sum(m["cached"] for m in mapped), "files_failed": len(failed),
+                        "total_ms": round((time.perf_counter() - t0) * 1000, 1)},
+        }
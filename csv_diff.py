@@ -31,44 +31,88 @@ def schema_diff(db2_df: pd.DataFrame, csv_df: pd.DataFrame) -> Dict[str, Any]:
         "common": sorted(list(set_db2 & set_csv)),
     }
 
+def _key_tuples(df: pd.DataFrame, keys: List[str]) -> List[Tuple]:
+    return [tuple(r) for r in df[keys].itertuples(index=False, name=None)]
+
+def suggest_keys(db2_df: pd.DataFrame, csv_df: pd.DataFrame) -> List[str]:
+    """Pick the first common column that is unique and non-null on both sides (ID-like names first)."""
+    db2_cols = dict(zip(_normalize_colnames(db2_df.columns.tolist()), db2_df.columns))
+    csv_cols = dict(zip(_normalize_colnames(csv_df.columns.tolist()), csv_df.columns))
+    common = [c for c in db2_cols if c in csv_cols]
+    common = sorted(common, key=lambda c: not (c == "ID" or c.endswith(("_ID", "-ID", "KEY", "_NO", "_NUM"))))
+    for c in common:
+        a, b = db2_df[db2_cols[c]], csv_df[csv_cols[c]]
+        if a.notna().all() and b.notna().all() and a.is_unique and b.is_unique:
+            return [c]
+    return common[:1]
+
+def _neq(a: pd.Series, b: pd.Series):
+    # Same numeric dtype: compare values directly (NaN == NaN), which matches str() equality
+    # without formatting every cell; anything else is compared as str() like before.
+    if a.dtype == b.dtype and pd.api.types.is_numeric_dtype(a.dtype) and not pd.api.types.is_bool_dtype(a.dtype):
+        av, bv = a.to_numpy(), b.to_numpy()
+        return (av != bv) & ~(pd.isna(av) & pd.isna(bv))
+    return a.astype(str).to_numpy() != b.astype(str).to_numpy()
+
+def _restore(s: pd.Series, dtype) -> pd.Series:
+    return s if s.dtype == dtype else s.astype(dtype)
+
 def data_diff_on_key(db2_df: pd.DataFrame, csv_df: pd.DataFrame, key_cols: List[str], sample: int = 20) -> Dict[str, Any]:
-    db2 = db2_df.copy()
-    csv = csv_df.copy()
-    db2.columns = _normalize_colnames(db2.columns.tolist())
-    csv.columns = _normalize_colnames(csv.columns.tolist())
+    """Key-aligned comparison of every common key: one outer join on the (string-normalized)
+    keys, then one vectorized string comparison per column. Values compare as str(), as before."""
+    db2 = db2_df.set_axis(_normalize_colnames(db2_df.columns.tolist()), axis=1)
+    csv = csv_df.set_axis(_normalize_colnames(csv_df.columns.tolist()), axis=1)
     keys = [k.upper() for k in key_cols]
 
     for k in keys:
         if k not in db2.columns or k not in csv.columns:
             raise ValueError(f"Key column {k} missing in one of the sources")
 
-    db2.set_index(keys, inplace=True, drop=False)
-    csv.set_index(keys, inplace=True, drop=False)
+    common_cols = sorted(list(set(db2.columns) & set(csv.columns)))
+    value_cols = [c for c in common_cols if c not in keys]
+
+    # string keys so int/str/decimal key dtypes from the two sources still align
+    left = db2[common_cols].astype({k: str for k in keys})
+    right = csv[common_cols].astype({k: str for k in keys})
+    dup_db2 = int(left.duplicated(keys).sum())
+    dup_csv = int(right.duplicated(keys).sum())
+    if dup_db2:
+        left = left.drop_duplicates(keys)
+    if dup_csv:
+        right = right.drop_duplicates(keys)
 
-    db2_only_idx = db2.index.difference(csv.index)
-    csv_only_idx = csv.index.difference(db2.index)
-    both_idx = db2.index.intersection(csv.index)
+    merged = left.merge(right, on=keys, how="outer", suffixes=("\x00db2", "\x00csv"), indicator=True, sort=False)
+    side = merged["_merge"]
+    db2_only = merged.loc[side == "left_only", keys]
+    csv_only = merged.loc[side == "right_only", keys]
+    both = merged.loc[side == "both"]
+
+    # the outer join widens int/bool columns to float/object on a side with one-sided keys;
+    # matched rows hold no such NaNs, so restore each side's own dtype before comparing
+    dv = {c: _restore(both[c + "\x00db2"], left[c].dtype) for c in value_cols}
+    cv = {c: _restore(both[c + "\x00csv"], right[c].dtype) for c in value_cols}
+    mask = pd.DataFrame({c: _neq(dv[c], cv[c]) for c in value_cols}, index=both.index)
+    row_mask = mask.any(axis=1) if value_cols else pd.Series(False, index=both.index)
+    col_counts = {c: int(n) for c, n in mask.sum().items() if n}
 
     diffs = []
-    common_cols = sorted(list(set(db2.columns) & set(csv.columns)))
-    for idx in both_idx[:5000]:
-        row_db2 = db2.loc[idx, common_cols]
-        row_csv = csv.loc[idx, common_cols]
-        neq = (row_db2.astype(str).values != row_csv.astype(str).values)
-        if any(neq):
-            diffs.append({
-                "key": tuple(idx) if isinstance(idx, tuple) else (idx,),
-                "db2": {c: str(row_db2[c]) for c in common_cols},
-                "csv": {c: str(row_csv[c]) for c in common_cols},
-                "mismatch_cols": [c for i, c in enumerate(common_cols) if neq[i]]
-            })
-            if len(diffs) >= sample:
-                break
+    for idx in row_mask[row_mask].index[:sample]:
+        row = both.loc[idx]
+        diffs.append({
+            "key": tuple(row[k] for k in keys),
+            "db2": {**{k: str(row[k]) for k in keys}, **{c: str(dv[c].at[idx]) for c in value_cols}},
+            "csv": {**{k: str(row[k]) for k in keys}, **{c: str(cv[c].at[idx]) for c in value_cols}},
+            "mismatch_cols": [c for c in value_cols if mask.at[idx, c]],
+        })
 
     return {
-        "db2_only_count": int(len(db2_only_idx)),
-        "csv_only_count": int(len(csv_only_idx)),
-        "sample_db2_only_keys": [tuple(i) if isinstance(i, tuple) else (i,) for i in db2_only_idx[:sample]],
-        "sample_csv_only_keys": [tuple(i) if isinstance(i, tuple) else (i,) for i in csv_only_idx[:sample]],
+        "db2_only_count": int(len(db2_only)),
+        "csv_only_count": int(len(csv_only)),
+        "common_key_count": int(len(both)),
+        "mismatch_row_count": int(row_mask.sum()),
+        "mismatch_counts_by_column": col_counts,
+        "duplicate_keys": {"db2": dup_db2, "csv": dup_csv},
+        "sample_db2_only_keys": _key_tuples(db2_only.head(sample), keys),
+        "sample_csv_only_keys": _key_tuples(csv_only.head(sample), keys),
         "sample_row_mismatches": diffs,
     }
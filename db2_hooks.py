@@ -0,0 +1,153 @@
+# db2_hooks.py
+import os, time, threading
+from sqlalchemy import create_engine, text, inspect
+from sqlalchemy.engine import Engine, make_url
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB2_POOL_SIZE = int(os.getenv("DB2_POOL_SIZE", "5"))
+DB2_MAX_OVERFLOW = int(os.getenv("DB2_MAX_OVERFLOW", "10"))
+DB2_POOL_RECYCLE = int(os.getenv("DB2_POOL_RECYCLE", "1800"))
+DB2_META_TTL = float(os.getenv("DB2_META_TTL", "300"))
+
+class _TTLCache:
+    """Tiny thread-safe TTL cache for catalog lookups (schema, columns, keys)."""
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, loader):
+        now = time.monotonic()
+        with self._lock:
+            hit = self._data.get(key)
+            if hit and hit[0] > now:
+                return hit[1]
+        value = loader()
+        with self._lock:
+            self._data[key] = (now + self.ttl, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+_engine: Engine | None = None
+_engine_lock = threading.Lock()
+_meta_cache = _TTLCache(DB2_META_TTL)
+
+def _build_db2_url() -> str:
+    url = (os.getenv("DB2_URL") or "").strip()
+    if url:
+        return url
+    host = os.getenv("DB2_HOST", "").strip()
+    port = os.getenv("DB2_PORT", "50000").strip()
+    db   = os.getenv("DB2_DB", os.getenv("DB2_DATABASE","")).strip()
+    uid  = os.getenv("DB2_UID", os.getenv("DB2_USER","")).strip()
+    pwd  = os.getenv("DB2_PWD", os.getenv("DB2_PASSWORD","")).strip()
+    if not (host and db and uid and pwd):
+        raise ValueError("DB2 not configured. Set DB2_URL or DB2_HOST/DB2_DB(DB2_DATABASE)/DB2_UID(DB2_USER)/DB2_PWD(DB2_PASSWORD).")
+    return f"ibm_db_sa://{uid}:{pwd}@{host}:{port}/{db}"
+
+def get_engine() -> Engine:
+    """Process-wide pooled engine, created on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                url = _build_db2_url()
+                kwargs = {"pool_pre_ping": True}
+                if make_url(url).get_backend_name() != "sqlite":
+                    kwargs.update(pool_size=DB2_POOL_SIZE, max_overflow=DB2_MAX_OVERFLOW, pool_recycle=DB2_POOL_RECYCLE)
+                _engine = create_engine(url, **kwargs)
+    return _engine
+
+def dispose_engine():
+    """Close pooled connections and forget cached catalog metadata (e.g. after config changes)."""
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+        _engine = None
+    _meta_cache.clear()
+
+def clear_metadata_cache():
+    _meta_cache.clear()
+
+def list_tables(schema: str | None = None):
+    def load():
+        insp = inspect(get_engine())
+        return insp.get_table_names(schema=schema)
+    return list(_meta_cache.get_or_load(("tables", schema), load))
+
+def preview_table(table: str, schema: str | None = None, limit: int = 20):
+    eng = get_engine()
+    fq = f'"{schema}".{table}' if schema else table
+    with eng.connect() as con:
+        rows = con.execute(text(f"SELECT * FROM {fq}{_limit_clause(eng, limit)}")).mappings().all()
+    return [dict(r) for r in rows]
+
+def _limit_clause(eng: Engine, limit: int) -> str:
+    # DB2 syntax; local SQLite stand-in engines (tests/dev) need LIMIT instead
+    if eng.dialect.name == "sqlite":
+        return f" LIMIT {int(limit)}"
+    return f" FETCH FIRST {int(limit)} ROWS ONLY"
+
+def fetch_batches(table: str, schema: str | None = None, where: str | None = None, limit: int | None = None,
+                  batch_size: int = 1000, engine: Engine | None = None, order_by: str | None = None,
+                  params: dict | None = None):
+    """Yield lists of row dicts of at most batch_size rows, streamed through a
+    server-side cursor so the full table is never held in memory."""
+    eng = engine or get_engine()
+    fq = f'"{schema}".{table}' if schema else table
+    sql = f"SELECT * FROM {fq}"
+    if where:
+        sql += f" WHERE {where}"
+    if order_by:
+        sql += f" ORDER BY {order_by}"
+    if limit:
+        sql += _limit_clause(eng, limit)
+    with eng.connect() as con:
+        result = con.execution_options(stream_results=True, yield_per=batch_size).execute(text(sql), params or {})
+        for part in result.mappings().partitions(batch_size):
+            yield [dict(r) for r in part]
+
+def fetch_all(table: str, schema: str | None = None, where: str | None = None, limit: int | None = None,
+              batch_size: int = 1000, engine: Engine | None = None, order_by: str | None = None,
+              params: dict | None = None):
+    for batch in fetch_batches(table, schema=schema, where=where, limit=limit, batch_size=batch_size,
+                               engine=engine, order_by=order_by, params=params):
+        yield from batch
+
+# Nice-to-haves used elsewhere
+def current_schema() -> str:
+    def load():
+        with get_engine().connect() as con:
+            row = con.execute(text("SELECT CURRENT SCHEMA FROM SYSIBM.SYSDUMMY1")).fetchone()
+            return (row[0] if row and row[0] else "").strip()
+    return _meta_cache.get_or_load(("schema",), load)
+
+def table_columns(schema: str, table: str):
+    def load():
+        with get_engine().connect() as con:
+            rows = con.execute(text("""
+                SELECT COLNAME, TYPENAME, LENGTH, SCALE, NULLS
+                FROM SYSCAT.COLUMNS
+                WHERE TABSCHEMA = :s AND TABNAME = :t
+                ORDER BY COLNO
+            """), {"s": schema, "t": table}).mappings().all()
+        return [dict(r) for r in rows]
+    return [dict(c) for c in _meta_cache.get_or_load(("columns", schema, table), load)]
+
+def table_primary_keys(schema: str, table: str):
+    def load():
+        with get_engine().connect() as con:
+            rows = con.execute(text("""
+                SELECT COLNAME
+                FROM SYSCAT.COLUMNS
+                WHERE TABSCHEMA = :s AND TABNAME = :t AND KEYSEQ IS NOT NULL
+                ORDER BY KEYSEQ
+            """), {"s": schema, "t": table}).mappings().all()
+        return [r["COLNAME"] for r in rows]
+    return list(_meta_cache.get_or_load(("pk", schema, table), load))
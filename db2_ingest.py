@@ -0,0 +1,256 @@
+# db2_ingest.py
+import re, json, datetime
+from decimal import Decimal
+from typing import List, Dict, Any, Optional, Tuple
+from sqlalchemy.engine import Engine
+from storage import DB
+from retriever import VectorStore
+from db2_hooks import fetch_batches, table_primary_keys
+from table_store import TableStore, table_summary_text, group_summary_text
+
+RE_IDENT = re.compile(r'^[A-Za-z_][A-Za-z0-9_#$@]*$')
+
+
+def _enc(v: Any) -> Any:
+    # keep the value's type so the next run binds a timestamp/number, not a string
+    if isinstance(v, datetime.datetime):
+        return {"datetime": v.isoformat()}
+    if isinstance(v, datetime.date):
+        return {"date": v.isoformat()}
+    if isinstance(v, Decimal):
+        return {"decimal": str(v)}
+    return v
+
+
+def _dec(v: Any) -> Any:
+    if isinstance(v, dict):
+        if "datetime" in v:
+            return datetime.datetime.fromisoformat(v["datetime"])
+        if "date" in v:
+            return datetime.date.fromisoformat(v["date"])
+        if "decimal" in v:
+            return Decimal(v["decimal"])
+    return v
+
+
+def _dump_watermark(v: Any, key: Optional[List[Any]] = None) -> str:
+    # keyed imports store a keyset cursor: the watermark and key values of the last row read
+    return json.dumps(_enc(v) if key is None else {"wm": _enc(v), "key": [_enc(k) for k in key]}, default=str)
+
+
+def _load_watermark(s: Optional[str]) -> Tuple[Any, Optional[List[Any]]]:
+    """(watermark, cursor key values or None)."""
+    if s is None:
+        return None, None
+    v = json.loads(s)
+    if isinstance(v, dict) and "wm" in v:
+        return _dec(v["wm"]), [_dec(k) for k in v["key"]]
+    return _dec(v), None
+
+
+def _after(cols: List[str]) -> str:
+    # (c0, .., cn) > (:c0, .., :cn) spelled out: row-value comparisons are not available on every DB2
+    cond = f"{cols[-1]} > :c{len(cols) - 1}"
+    for i in range(len(cols) - 2, -1, -1):
+        cond = f"{cols[i]} > :c{i} OR ({cols[i]} = :c{i} AND ({cond}))"
+    return cond
+
+
+def _summary_lo(skey: str) -> Any:
+    # first watermark of an unkeyed row group summary key (rows:[lo, hi, seq]), else None
+    try:
+        return _dec(json.loads(skey[len("rows:"):])[0])
+    except (ValueError, TypeError, IndexError, KeyError):
+        return None
+
+
+class Db2Ingestor:
+    """Stream a DB2 table into the session batch by batch. Rows go to a local SQL
+    copy (TableStore) for exact filtering/aggregation; only one summary chunk per
+    fetched batch (row group) plus one table-level summary are embedded. Each batch
+    is committed before the next one is fetched and progress is recorded in the
+    imports table. Pass engine= to run against a local stand-in.
+
+    With watermark_col set, the import is incremental and resumes where the stored
+    cursor stopped. With key columns (key_cols, or the DB2 primary key) rows are read
+    in (watermark, key) order and paged by a keyset cursor, so rows sharing a watermark
+    are never skipped or re-read; re-imported keys replace their local copy. Without
+    keys the stored watermark only advances to a value whose rows have all been read:
+    a run cut by limit inside equal watermarks reads the rest of them, and rows a
+    failed run left beyond the watermark are dropped before they are read again. Row
+    group summaries are keyed by their watermark range. Without a watermark the import
+    is a full refresh that replaces the earlier copy and its summaries."""
+    def __init__(self, db: DB, vector: VectorStore, tables: TableStore, batch_size: int = 1000,
+                 engine: Optional[Engine] = None):
+        self.db = db
+        self.vector = vector
+        self.tables = tables
+        self.batch_size = batch_size
+        self.engine = engine
+
+    def _key_cols(self, schema: str | None, table: str, key_cols: Optional[List[str]]) -> List[str]:
+        if key_cols:
+            return key_cols
+        if self.engine is not None or not schema:
+            return []
+        try:
+            return table_primary_keys(schema.upper(), table.upper())
+        except Exception:
+            return []
+
+    def _drop_previous(self, session_id: str, source: str):
+        old = self.db.delete_file_chunks(session_id, source)
+        if old:
+            self.vector.remove_chunks(old)
+        self.tables.drop_table(session_id, source)
+
+    def _drop_beyond(self, session_id: str, source: str, watermark_col: str, safe: Any):
+        # unkeyed: rows past the stored watermark come from a run that stopped inside equal
+        # watermarks; they are read again, so drop them and their summaries first
+        t = next((t for t in self.tables.list_tables(session_id) if t["source"] == source), None)
+        col = next((c for c in t["columns"] if c.upper() == watermark_col.upper()), None) if t else None
+        if col:
+            self.tables.delete_rows(t["name"], col, ">", safe)
+        stale = []
+        for skey in self.db.source_keys(session_id, source, "rows:["):
+            lo = _summary_lo(skey)
+            try:
+                if lo is not None and lo > safe:
+                    stale.append(skey)
+            except TypeError:
+                pass
+        self._drop_summaries(session_id, source, stale)
+
+    def _drop_summaries(self, session_id: str, source: str, skeys: List[str]):
+        old = self.db.delete_source_keys(session_id, source, skeys) if skeys else []
+        if old:
+            self.vector.remove_chunks(old)
+
+    def _summarize(self, session_id: str, source: str, name: str, rows: List[Dict[str, Any]], skey: str, position: int):
+        text = group_summary_text(source, name, rows)
+        cids, old = self.db.upsert_chunks(session_id, source, [(skey, position, text)])
+        if old:
+            self.vector.remove_chunks(old)
+        self.vector.add_texts([text], [{"chunk_id": cids[0], "session_id": session_id, "filename": source,
+                                        "text": text, "kind": "db2_rows", "table": name}])
+
+    def ingest_table(self, session_id: str, table: str, schema: str | None = None, where: str | None = None,
+                     limit: int | None = None, batch_size: int | None = None, watermark_col: str | None = None,
+                     key_cols: Optional[List[str]] = None, reset_watermark: bool = False) -> Dict[str, Any]:
+        source = f"DB2:{schema+'.' if schema else ''}{table}"
+        batch_size = batch_size or self.batch_size
+        for col in [watermark_col, *(key_cols or [])]:
+            if col and not RE_IDENT.match(col):
+                raise ValueError(f"Invalid column name: {col}")
+        keys = self._key_cols(schema, table, key_cols)
+
+        base_where = where
+        params: Dict[str, Any] = {}
+        order_by = None
+        last, last_key = None, None
+        if watermark_col:
+            if reset_watermark:
+                self.db.reset_watermark(session_id, source)
+            last, last_key = _load_watermark(self.db.get_watermark(session_id, source, watermark_col))
+            order_by = ", ".join([watermark_col, *keys])
+            if last is not None:
+                if keys and last_key is not None and len(last_key) == len(keys):
+                    cond = _after([watermark_col, *keys])
+                    params.update({f"c{i}": v for i, v in enumerate([last, *last_key])})
+                else:
+                    # a cursor without key values (stored before keyset paging) re-reads its boundary
+                    # value with keys: those rows are upserted, not duplicated
+                    cond = f"{watermark_col} {'>=' if keys else '>'} :c0"
+                    params["c0"] = last
+                where = f"({where}) AND ({cond})" if where else cond
+        if last is None:
+            self._drop_previous(session_id, source)
+        elif not keys:
+            self._drop_beyond(session_id, source, watermark_col, last)
+        reread = bool(keys) and last is not None and last_key is None
+
+        self.db.start_import(session_id, source, watermark_col=watermark_col)
+        rows = groups = 0
+        name = wcol = None
+        kcols: List[str] = []
+        prev = cur = None  # unkeyed: the last two distinct watermarks read, prev is complete
+        seq: Dict[str, int] = {}
+        run_summaries: List[Tuple[str, Any]] = []
+
+        def add_group(batch: List[Dict[str, Any]]):
+            nonlocal groups
+            # boundary rows re-read for a key-less cursor were summarized by the previous run
+            fresh = [r for r in batch if r.get(wcol) != last] if reread else batch
+            if not fresh:
+                return
+            vals = [r for r in fresh if r.get(wcol) is not None] if wcol else []
+            if not wcol:
+                skey = f"rows:{groups + 1}"
+            elif not vals:
+                skey = "rows:null"
+            elif kcols:
+                skey = "rows:" + json.dumps([[_enc(r[c]) for c in (wcol, *kcols)] for r in (vals[0], vals[-1])], default=str)
+            else:
+                lo, hi = vals[0][wcol], vals[-1][wcol]
+                n = seq[repr(lo)] = seq.get(repr(lo), -1) + 1
+                skey = "rows:" + json.dumps([_enc(lo), _enc(hi), n], default=str)
+                run_summaries.append((skey, lo))
+            self._summarize(session_id, source, name, fresh, skey, groups + 1)
+            groups += 1
+
+        try:
+            for batch in fetch_batches(table, schema=schema, where=where, limit=limit, batch_size=batch_size,
+                                       engine=self.engine, order_by=order_by, params=params):
+                if name is None:
+                    cols = {c.upper(): c for c in batch[0].keys()}
+                    kcols = [cols.get(k.upper(), k) for k in keys]
+                    name = self.tables.ensure_table(session_id, source, batch, kcols)
+                    wcol = cols.get(watermark_col.upper(), watermark_col) if watermark_col else None
+                self.tables.upsert_rows(name, batch, replace=bool(keys))
+                rows += len(batch)
+                add_group(batch)
+
+                wm = None
+                if wcol and kcols:
+                    r = next((r for r in reversed(batch) if r.get(wcol) is not None), None)
+                    wm = _dump_watermark(r[wcol], [r[k] for k in kcols]) if r else None
+                elif wcol:
+                    for r in batch:
+                        v = r.get(wcol)
+                        if v is not None and v != cur:
+                            prev, cur = cur, v
+                    wm = _dump_watermark(prev) if prev is not None else None
+                self.db.update_import(session_id, source, rows, groups, watermark=wm)
+
+            if wcol and not kcols and cur is not None:
+                if limit is not None and rows >= limit:
+                    # cut inside equal watermarks: read every row of the last one again, so the
+                    # watermark can advance past it (unkeyed rows cannot be upserted)
+                    self.tables.delete_rows(name, wcol, "=", cur)
+                    self._drop_summaries(session_id, source, [k for k, lo in run_summaries if lo == cur])
+                    cond = f"{watermark_col} = :c0"
+                    for batch in fetch_batches(table, schema=schema, batch_size=batch_size, engine=self.engine,
+                                               where=f"({base_where}) AND {cond}" if base_where else cond,
+                                               params={"c0": cur}):
+                        self.tables.upsert_rows(name, batch)
+                        rows += len(batch)
+                        add_group(batch)
+                self.db.update_import(session_id, source, rows, groups, watermark=_dump_watermark(cur))
+
+            name = name or next((t["name"] for t in self.tables.list_tables(session_id) if t["source"] == source), None)
+            if name:
+                self._refresh_table_summary(session_id, source, name)
+        except Exception:
+            self.db.update_import(session_id, source, rows, groups, status="failed")
+            raise
+        self.db.update_import(session_id, source, rows, groups, status="done")
+        return {"ingested_chunks": groups + (1 if name else 0), "rows": rows, "row_groups": groups,
+                "table": name, "source": source, "watermark_col": watermark_col}
+
+    def _refresh_table_summary(self, session_id: str, source: str, name: str):
+        text = table_summary_text(source, name, self.tables.profile(name))
+        cids, old = self.db.upsert_chunks(session_id, source, [("__table__", 0, text)])
+        if old:
+            self.vector.remove_chunks(old)
+        self.vector.add_texts([text], [{"chunk_id": cids[0], "session_id": session_id, "filename": source,
+                                        "text": text, "kind": "db2_table", "table": name}])
@@ -1,22 +1,150 @@
 
-import os, json, datetime
-from typing import Dict, Any
+import os, csv, json, gzip, datetime, tempfile
+from typing import Dict, Any, List, Optional, TextIO, Iterable
+from xml.sax.saxutils import escape, quoteattr
 
-def export_markdown(session_id: str, lineage: Dict[str, Any], analysis_answer: str | None, base_dir: str) -> str:
-    ts = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
-    md = [f"# Session {session_id} Analysis ({ts})\n"]
-    md.append("## CRUD Map — Files\n")
-    for k,v in sorted(lineage.get("files",{}).items()):
-        md.append(f"- **{k}**: ops={sorted(list(v.get('ops',{}).keys()))}, programs={', '.join(v.get('programs',[]))}")
-    md.append("\n## CRUD Map — Tables\n")
-    for k,v in sorted(lineage.get("tables",{}).items()):
-        md.append(f"- **{k}**: ops={sorted(list(v.get('ops',{}).keys()))}, programs={', '.join(v.get('programs',[]))}")
+# Streaming exporter: every format writes subject by subject straight to the (optionally gzipped)
+# file, so memory stays bounded by the lineage dict that is already cached. Sections are emitted in
+# sorted key order, sorting keys only (not copies of the entries).
+EXPORT_FORMATS = {"md": "md", "csv": "csv", "jsonl": "jsonl", "graphml": "graphml"}
+
+
+def _sections(lineage: Dict[str, Any]) -> Iterable[tuple]:
+    for section, kind in (("files", "file"), ("tables", "table")):
+        d = lineage.get(section, {})
+        for k in sorted(d):
+            yield kind, k, d[k]
+
+
+def _write_md(f: TextIO, session_id: str, ts: str, lineage: Dict[str, Any], analysis_answer: Optional[str],
+              fields: List[Dict[str, Any]]):
+    f.write(f"# Session {session_id} Analysis ({ts})\n\n")
+    f.write("## CRUD Map — Files\n\n")
+    files = lineage.get("files", {})
+    for k in sorted(files):
+        v = files[k]
+        f.write(f"- **{k}**: ops={sorted(list(v.get('ops',{}).keys()))}, programs={', '.join(v.get('programs',[]))}\n")
+    f.write("\n## CRUD Map — Tables\n\n")
+    tables = lineage.get("tables", {})
+    for k in sorted(tables):
+        v = tables[k]
+        f.write(f"- **{k}**: ops={sorted(list(v.get('ops',{}).keys()))}, programs={', '.join(v.get('programs',[]))}\n")
+    for res in fields:
+        f.write(f"\n## Field Usage — {res.get('copybook_hint') or res.get('hint')}\n\n")
+        if "error" in res:
+            f.write(f"_{res['error']}_\n")
+            continue
+        for cat in ("input", "derived_or_updated", "static", "unused"):
+            f.write(f"- **{cat}** ({len(res['fields'][cat])}): {', '.join(res['fields'][cat])}\n")
     if analysis_answer:
-        md.append("\n## LLM Synthesis\n")
-        md.append(analysis_answer)
+        f.write("\n## LLM Synthesis\n\n")
+        f.write(analysis_answer)
+        f.write("\n")
+
+
+def _write_csv(f: TextIO, lineage: Dict[str, Any], fields: List[Dict[str, Any]]):
+    # long format: one row per (subject, op); field usage rows use op=<category>
+    w = csv.writer(f)
+    w.writerow(["section", "subject", "op", "count", "programs"])
+    for kind, k, v in _sections(lineage):
+        programs = ";".join(v.get("programs", []))
+        for op in sorted(v.get("ops", {})):
+            w.writerow([kind, k, op, v["ops"][op], programs])
+    for res in fields:
+        if "error" in res:
+            continue
+        hint = res.get("copybook_hint", "")
+        for cat in ("input", "derived_or_updated", "static", "unused"):
+            for name in res["fields"][cat]:
+                w.writerow([f"field:{hint}", name, cat, "", ""])
+
+
+def _write_jsonl(f: TextIO, session_id: str, ts: str, version: Optional[int], lineage: Dict[str, Any],
+                 analysis_answer: Optional[str], fields: List[Dict[str, Any]]):
+    def line(obj):
+        f.write(json.dumps(obj, ensure_ascii=False))
+        f.write("\n")
+    line({"type": "meta", "session_id": session_id, "generated_at": ts, "lineage_version": version})
+    for kind, k, v in _sections(lineage):
+        line({"type": kind, "subject": k, "ops": v.get("ops", {}), "programs": v.get("programs", [])})
+    for res in fields:
+        if "error" in res:
+            line({"type": "field_error", **res})
+            continue
+        cats: Dict[str, List[str]] = {}
+        for cat in ("input", "derived_or_updated", "static", "unused"):
+            for name in res["fields"][cat]:
+                cats.setdefault(name, []).append(cat)
+        for name in sorted(res.get("field_meta", {})):
+            line({**res["field_meta"][name], "type": "field", "copybook_hint": res.get("copybook_hint"),
+                  "name": name, "categories": cats.get(name, [])})
+    if analysis_answer:
+        line({"type": "synthesis", "text": analysis_answer})
+
+
+def _write_graphml(f: TextIO, session_id: str, lineage: Dict[str, Any]):
+    # same node keys / edge labels as graph_builder (PGM::, FILE::, TABLE::)
+    f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    f.write('<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+    f.write('  <key id="type" for="node" attr.name="type" attr.type="string"/>\n')
+    f.write('  <key id="label" for="node" attr.name="label" attr.type="string"/>\n')
+    f.write('  <key id="ops" for="edge" attr.name="ops" attr.type="string"/>\n')
+    f.write('  <key id="group" for="edge" attr.name="group" attr.type="string"/>\n')
+    f.write(f'  <graph id={quoteattr(session_id)} edgedefault="directed">\n')
+    programs = set()
+    for kind, k, v in _sections(lineage):
+        node = f"{'FILE' if kind == 'file' else 'TABLE'}::{k}"
+        f.write(f'    <node id={quoteattr(node)}><data key="type">{kind}</data><data key="label">{escape(k)}</data></node>\n')
+        programs.update(v.get("programs", []))
+    for p in sorted(programs):
+        f.write(f'    <node id={quoteattr("PGM::" + p)}><data key="type">program</data><data key="label">{escape(p)}</data></node>\n')
+    for kind, k, v in _sections(lineage):
+        node = f"{'FILE' if kind == 'file' else 'TABLE'}::{k}"
+        ops = escape(",".join(sorted(v.get("ops", {}).keys())))
+        for p in v.get("programs", []):
+            f.write(f'    <edge source={quoteattr("PGM::" + p)} target={quoteattr(node)}>'
+                    f'<data key="ops">{ops}</data><data key="group">{kind}</data></edge>\n')
+    f.write('  </graph>\n</graphml>\n')
+
+
+def export_report(session_id: str, lineage: Dict[str, Any], base_dir: str, fmt: str = "md", compress: bool = False,
+                  analysis_answer: str | None = None, fields: List[Dict[str, Any]] | None = None,
+                  version: int | None = None) -> str:
+    """Write the lineage (+ optional field usage results and synthesis) as md/csv/jsonl/graphml
+    under <base_dir>/exports, gzipped when compress; returns the file path."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    ts = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    fields = fields or []
     out_dir = os.path.join(base_dir, "exports")
     os.makedirs(out_dir, exist_ok=True)
-    path = os.path.join(out_dir, f"{session_id}_analysis.md")
-    with open(path, "w", encoding="utf-8") as f:
-        f.write("\n".join(md))
+    path = os.path.join(out_dir, f"{session_id}_analysis.{EXPORT_FORMATS[fmt]}" + (".gz" if compress else ""))
+    # unique temp file per call: concurrent exports of the same session must not share one
+    fd, tmp = tempfile.mkstemp(prefix=f".{session_id}_", suffix=".tmp", dir=out_dir)
+    os.close(fd)
+    os.chmod(tmp, 0o644)
+    # newline="" so csv writes its own \r\n and the other formats stay \n
+    if compress:
+        f = gzip.open(tmp, "wt", encoding="utf-8", newline="", compresslevel=6)
+    else:
+        f = open(tmp, "w", encoding="utf-8", newline="")
+    try:
+        with f:
+            if fmt == "md":
+                _write_md(f, session_id, ts, lineage, analysis_answer, fields)
+            elif fmt == "csv":
+                _write_csv(f, lineage, fields)
+            elif fmt == "jsonl":
+                _write_jsonl(f, session_id, ts, version, lineage, analysis_answer, fields)
+            else:
+                _write_graphml(f, session_id, lineage)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
     return path
+
+
+def export_markdown(session_id: str, lineage: Dict[str, Any], analysis_answer: str | None, base_dir: str) -> str:
+    return export_report(session_id, lineage, base_dir, fmt="md", analysis_answer=analysis_answer)
@@ -0,0 +1,224 @@
+# field_index.py
+import re, json, time, hashlib, sqlite3, threading
+from typing import Dict, Any, Tuple, Set, Optional
+from storage import DB
+import analysis_pool
+from field_lineage import (_collect_copybook_fields, _copybook_texts, _merge_layouts, _fields_result,
+                           _field_usage, _field_ids)
+
+# Inverted index identifier atom -> chunk ids per session. Identifiers are split on '-' / '_' into
+# alphanumeric atoms: every name the field scan can report (MOVE/COMPUTE targets, IF words, SQL host
+# variables, WRITE records) shows up in the upper-cased chunk with each of its atoms as a whole
+# [A-Z0-9]+ run, so the chunks holding the rarest atom of each field/record name are a superset of
+# the chunks that can contribute to a copybook's usage result; every other chunk is skipped.
+RE_ATOM = re.compile(r'[A-Z0-9]+')
+
+# SQLite's default bound-parameter limit is 999
+_IN_BATCH = 500
+
+
+def atoms(text: str) -> Set[str]:
+    return set(RE_ATOM.findall(text.upper()))
+
+
+def _sha(*parts: str) -> str:
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(p.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class FieldIndex:
+    """Field usage analysis backed by the atom index, a parsed copybook layout cache and a
+    per-(session, copybook hint) result cache.
+
+    The index follows the session's chunks by id (chunks are never edited in place): `refresh`
+    indexes new ids and drops removed ones. It runs after each ingest and again lazily before a
+    query when the session's chunk_version moved. A cached result is reused while the copybook
+    chunks and the candidate chunks (those sharing atoms with its names) are unchanged."""
+    def __init__(self, db: DB):
+        self.db = db
+        self._lock = threading.Lock()
+        self._session_locks: Dict[str, threading.Lock] = {}
+        self._indexed: Dict[str, int] = {}
+        self._layouts: Dict[str, Tuple[str, Dict[str, Dict[str, Any]]]] = {}
+        self.stats = {"refreshes": 0, "chunks_indexed": 0, "layout_hits": 0, "layout_parses": 0,
+                      "result_hits": 0, "scans": 0, "chunks_scanned": 0, "chunks_skipped": 0}
+        with sqlite3.connect(db.db_path) as con:
+            cur = con.cursor()
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS field_refs(
+                session_id TEXT,
+                atom TEXT,
+                chunk_id INTEGER,
+                PRIMARY KEY(session_id, atom, chunk_id)
+            ) WITHOUT ROWID;
+            """)
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS field_index_chunks(
+                session_id TEXT,
+                chunk_id INTEGER,
+                atoms TEXT,
+                PRIMARY KEY(session_id, chunk_id)
+            );
+            """)
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS copybook_layouts(
+                content_hash TEXT PRIMARY KEY,
+                record TEXT,
+                fields TEXT,
+                created_at REAL
+            );
+            """)
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS field_results(
+                session_id TEXT,
+                hint TEXT,
+                fingerprint TEXT,
+                result TEXT,
+                created_at REAL,
+                PRIMARY KEY(session_id, hint)
+            );
+            """)
+            con.commit()
+
+    def _count(self, key: str, n: int = 1):
+        with self._lock:
+            self.stats[key] += n
+
+    def _session_lock(self, session_id: str) -> threading.Lock:
+        with self._lock:
+            return self._session_locks.setdefault(session_id, threading.Lock())
+
+    # --- index ---
+    def refresh(self, session_id: str) -> int:
+        """Index the session's new chunks and drop removed ones; returns the chunk_version."""
+        version = self.db.chunk_version(session_id)
+        if self._indexed.get(session_id) == version:
+            return version
+        with self._session_lock(session_id):
+            if self._indexed.get(session_id) == version:
+                return version
+            self._count("refreshes")
+            with sqlite3.connect(self.db.db_path) as con:
+                current = {r[0] for r in con.execute("SELECT id FROM chunks WHERE session_id = ?", (session_id,))}
+                indexed = {r[0] for r in con.execute("SELECT chunk_id FROM field_index_chunks WHERE session_id = ?", (session_id,))}
+                gone = sorted(indexed - current)
+                for i in range(0, len(gone), _IN_BATCH):
+                    part = gone[i:i + _IN_BATCH]
+                    marks = ",".join("?" * len(part))
+                    rows = con.execute(f"SELECT chunk_id, atoms FROM field_index_chunks WHERE session_id = ? AND chunk_id IN ({marks})",
+                                       (session_id, *part)).fetchall()
+                    con.executemany("DELETE FROM field_refs WHERE session_id = ? AND atom = ? AND chunk_id = ?",
+                                    [(session_id, a, cid) for cid, text in rows for a in text.split()])
+                    con.execute(f"DELETE FROM field_index_chunks WHERE session_id = ? AND chunk_id IN ({marks})", (session_id, *part))
+                new = sorted(current - indexed)
+                for i in range(0, len(new), _IN_BATCH):
+                    part = new[i:i + _IN_BATCH]
+                    rows = con.execute(f"SELECT id, content FROM chunks WHERE id IN ({','.join('?' * len(part))})", part).fetchall()
+                    per_chunk = [(cid, sorted(atoms(content or ""))) for cid, content in rows]
+                    con.executemany("INSERT OR IGNORE INTO field_refs(session_id, atom, chunk_id) VALUES (?, ?, ?)",
+                                    [(session_id, a, cid) for cid, toks in per_chunk for a in toks])
+                    con.executemany("INSERT OR REPLACE INTO field_index_chunks(session_id, chunk_id, atoms) VALUES (?, ?, ?)",
+                                    [(session_id, cid, " ".join(toks)) for cid, toks in per_chunk])
+                con.commit()
+            self._count("chunks_indexed", len(new))
+            self._indexed[session_id] = version
+        return version
+
+    def candidates(self, con: sqlite3.Connection, session_id: str, names: Set[str]) -> Optional[Set[int]]:
+        """Chunk ids that may reference any of names; None when the index cannot narrow it."""
+        name_atoms = {n: set(RE_ATOM.findall(n.upper())) for n in names}
+        if any(not a for a in name_atoms.values()):
+            return None
+        wanted = sorted(set().union(*name_atoms.values())) if name_atoms else []
+        df: Dict[str, int] = {}
+        for i in range(0, len(wanted), _IN_BATCH):
+            part = wanted[i:i + _IN_BATCH]
+            df.update(con.execute(
+                f"SELECT atom, COUNT(*) FROM field_refs WHERE session_id = ? AND atom IN ({','.join('?' * len(part))}) GROUP BY atom",
+                (session_id, *part)).fetchall())
+        chosen: Set[str] = set()
+        for a in name_atoms.values():
+            if all(x in df for x in a):
+                # a name with an unseen atom occurs nowhere
+                chosen.add(min(a, key=lambda x: (df[x], x)))
+        ids: Set[int] = set()
+        chosen_l = sorted(chosen)
+        for i in range(0, len(chosen_l), _IN_BATCH):
+            part = chosen_l[i:i + _IN_BATCH]
+            ids.update(r[0] for r in con.execute(
+                f"SELECT chunk_id FROM field_refs WHERE session_id = ? AND atom IN ({','.join('?' * len(part))})",
+                (session_id, *part)))
+        return ids
+
+    # --- copybook layouts ---
+    def _layout(self, con: sqlite3.Connection, text: str) -> Tuple[str, Dict[str, Dict[str, Any]]]:
+        key = _sha(text)
+        hit = self._layouts.get(key)
+        if hit is None:
+            row = con.execute("SELECT record, fields FROM copybook_layouts WHERE content_hash = ?", (key,)).fetchone()
+            if row:
+                hit = (row[0], json.loads(row[1]))
+            else:
+                self._count("layout_parses")
+                hit = _collect_copybook_fields(text)
+                con.execute("INSERT OR REPLACE INTO copybook_layouts(content_hash, record, fields, created_at) VALUES (?, ?, ?, ?)",
+                            (key, hit[0], json.dumps(hit[1]), time.time()))
+            self._layouts[key] = hit
+        else:
+            self._count("layout_hits")
+        # callers merge with setdefault and never mutate the field dicts
+        return hit
+
+    # --- analysis ---
+    def analyze(self, session_id: str, copybook_hint: str) -> Dict[str, Any]:
+        """Same result as field_lineage.analyze_fields, scanning only candidate chunks."""
+        cb_hint = (copybook_hint or "").upper()
+        self.refresh(session_id)
+        with sqlite3.connect(self.db.db_path) as con:
+            rows = con.execute(
+                """SELECT id, filename, content FROM chunks WHERE session_id=?
+                AND (filename LIKE '%.cpy%' OR filename LIKE '%.copybook%') ORDER BY id ASC""", (session_id,)
+            ).fetchall()
+            cb_texts = _copybook_texts([(fn, content) for _, fn, content in rows], cb_hint)
+            if not cb_texts:
+                return {"error": "No copybook content found for hint", "hint": cb_hint}
+            record_names, fields = _merge_layouts([self._layout(con, text) for _, text in cb_texts])
+            names = set(fields)
+            cand = self.candidates(con, session_id, names | record_names)
+            total = con.execute("SELECT COUNT(*) FROM chunks WHERE session_id = ?", (session_id,)).fetchone()[0]
+            if cand is None:
+                ids = [r[0] for r in con.execute("SELECT id FROM chunks WHERE session_id = ? ORDER BY id ASC", (session_id,))]
+            else:
+                ids = sorted(cand)
+            # copybook candidate ids + scanned ids: any new/removed chunk that matters changes it
+            fingerprint = _sha(cb_hint, ",".join(str(r[0]) for r in rows), ",".join(map(str, ids)))
+            row = con.execute("SELECT fingerprint, result FROM field_results WHERE session_id = ? AND hint = ?",
+                              (session_id, cb_hint)).fetchone()
+            con.commit()
+        if row and row[0] == fingerprint:
+            self._count("result_hits")
+            return json.loads(row[1])
+
+        self._count("scans")
+        self._count("chunks_scanned", len(ids))
+        self._count("chunks_skipped", total - len(ids))
+        workers = analysis_pool.ANALYSIS_WORKERS
+        if workers > 1 and len(ids) >= analysis_pool.ANALYSIS_PARALLEL_MIN_CHUNKS:
+            input_use: Set[str] = set()
+            updated_use: Set[str] = set()
+            step = analysis_pool.ANALYSIS_BATCH_CHUNKS
+            jobs = [(self.db.db_path, session_id, ids[i:i + step], names, record_names) for i in range(0, len(ids), step)]
+            for inp, upd in analysis_pool.map_ordered(_field_ids, jobs, workers):
+                input_use |= inp
+                updated_use |= upd
+        else:
+            input_use, updated_use = _field_usage(analysis_pool.read_ids(self.db.db_path, session_id, ids), names, record_names)
+        result = _fields_result(cb_hint, record_names, fields, input_use, updated_use)
+        with sqlite3.connect(self.db.db_path) as con:
+            con.execute("INSERT OR REPLACE INTO field_results(session_id, hint, fingerprint, result, created_at) VALUES (?, ?, ?, ?, ?)",
+                        (session_id, cb_hint, fingerprint, json.dumps(result), time.time()))
+            con.commit()
+        return result
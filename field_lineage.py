@@ -3,6 +3,8 @@ import re
 from typing import Dict, Any, List, Tuple, Set
 import sqlite3
 from storage import DB
+from cobol_scanner import field_scanner
+import analysis_pool
 
 # --- Copybook field parser (very heuristic) ---
 # Matches lines like: "05  FIELD-NAME     PIC X(10) [VALUE 'ABC']."
@@ -16,16 +18,7 @@ RE_FIELD = re.compile(
 # Identify a 01-level record name to map WRITE/REWRITE targets
 RE_RECORD01 = re.compile(r'^\s*01\s+(?P<rec>[A-Z0-9\-]+)\b', re.IGNORECASE | re.MULTILINE)
 
-# MOVE and arithmetic patterns
-RE_MOVE = re.compile(r'\bMOVE\s+([A-Z0-9\-]+)\s+TO\s+([A-Z0-9\-]+)', re.IGNORECASE)
-RE_COMPUTE = re.compile(r'\bCOMPUTE\s+([A-Z0-9\-]+)\s*=', re.IGNORECASE)
-RE_ADD = re.compile(r'\bADD\s+.+\s+TO\s+([A-Z0-9\-]+)', re.IGNORECASE)
-RE_SUB = re.compile(r'\bSUBTRACT\s+.+\s+FROM\s+([A-Z0-9\-]+)', re.IGNORECASE)
-RE_MULT = re.compile(r'\bMULTIPLY\s+.+\s+BY\s+([A-Z0-9\-]+)', re.IGNORECASE)
-RE_DIV = re.compile(r'\bDIVIDE\s+.+\s+INTO\s+([A-Z0-9\-]+)', re.IGNORECASE)
-
-# IF conditions treat fields as inputs
-RE_IF = re.compile(r'\bIF\s+([^\.]+)\.', re.IGNORECASE | re.DOTALL)
+# MOVE/COMPUTE/ADD/.../IF, WRITE/REWRITE and EXEC SQL statements come from cobol_scanner
 
 # SQL host variables: :FIELD
 RE_SQL_HOST = re.compile(r':([A-Z0-9_\-]+)')
@@ -36,9 +29,6 @@ RE_SQL_INTO = re.compile(r'\bINTO\s+([A-Z0-9\:\,\s\-]+)', re.IGNORECASE)
 RE_SQL_SET = re.compile(r'\bSET\s+([A-Z0-9\:\=\s,\-]+)', re.IGNORECASE)
 RE_SQL_WHERE = re.compile(r'\bWHERE\s+([A-Z0-9\:\s=\<\>\,\-\+\*\/\(\)]+)', re.IGNORECASE)
 
-RE_WRITE = re.compile(r'\bWRITE\s+([A-Z0-9\-]+)', re.IGNORECASE)
-RE_REWRITE = re.compile(r'\bREWRITE\s+([A-Z0-9\-]+)', re.IGNORECASE)
-
 def _collect_copybook_fields(text: str) -> Tuple[str, Dict[str, Dict[str, Any]]]:
     rec = None
     m = RE_RECORD01.search(text)
@@ -56,117 +46,136 @@ def _collect_copybook_fields(text: str) -> Tuple[str, Dict[str, Dict[str, Any]]]
 def _wordset(s: str) -> Set[str]:
     return set(re.findall(r'\b[A-Z][A-Z0-9\-]+\b', s.upper()))
 
-def analyze_fields(db: DB, session_id: str, copybook_hint: str) -> Dict[str, Any]:
-    cb_hint = (copybook_hint or "").upper()
-    # Load all chunks for session
-    con = sqlite3.connect(db.db_path)
-    cur = con.cursor()
-    rows = cur.execute("SELECT filename, content FROM chunks WHERE session_id=? ORDER BY id ASC", (session_id,)).fetchall()
-    con.close()
-
-    # Find copybook chunk(s)
-    cb_texts = []
-    for fn, content in rows:
-        low = (fn or "").lower()
-        if ".cpy" in low or ".copybook" in low or "copybook:" in (fn or "").upper():
-            if cb_hint and cb_hint not in fn.upper() and cb_hint not in content.upper():
-                continue
-            cb_texts.append((fn, content))
-
-    if not cb_texts:
-        return {"error": "No copybook content found for hint", "hint": cb_hint}
-
-    # For now, merge copybook fields across all matches
-    record_names = set()
-    fields = {}
-    for fn, text in cb_texts:
-        rec, fdict = _collect_copybook_fields(text)
-        if rec: record_names.add(rec)
-        for k, v in fdict.items():
-            fields.setdefault(k, v)
-
-    # Initialize usage buckets
+def _field_usage(rows: List[Tuple[str, str]], fields: Set[str], record_names: Set[str]) -> Tuple[Set[str], Set[str]]:
+    """(input, derived_or_updated) field names referenced by the chunks in rows."""
     input_use: Set[str] = set()
     updated_use: Set[str] = set()
-    static_fields: Set[str] = set(k for k, v in fields.items() if v.get("static"))
-    referenced: Set[str] = set()
-
-    # Scan program chunks for references
+    # one scanner pass per chunk, no upper-cased copy
     for fn, content in rows:
-        u = content.upper()
-        words = _wordset(u)
-
-        # Only consider fields from this copybook (by name presence)
-        candidate_words = words.intersection(set(fields.keys()))
+        ev = field_scanner.scan(content)
 
-        # IF conditions -> input
-        for im in RE_IF.finditer(u):
-            cond = im.group(1)
-            cond_words = _wordset(cond)
-            input_use.update(cond_words.intersection(candidate_words))
+        # IF conditions -> input (condition words are a subset of the chunk's words)
+        for (cond,) in ev["if"]:
+            input_use.update(_wordset(cond).intersection(fields))
 
         # MOVE
-        for mm in RE_MOVE.finditer(u):
-            src, dest = mm.group(1).upper(), mm.group(2).upper()
+        for src, dest in ev["move"]:
+            src, dest = src.upper(), dest.upper()
             if src in fields: input_use.add(src)
             if dest in fields: updated_use.add(dest)
 
         # COMPUTE/ADD/SUB/MULT/DIV
-        for cm in RE_COMPUTE.finditer(u):
-            dest = cm.group(1).upper()
-            if dest in fields: updated_use.add(dest)
-        for am in RE_ADD.finditer(u):
-            dest = am.group(1).upper()
-            if dest in fields: updated_use.add(dest)
-        for sm in RE_SUB.finditer(u):
-            dest = sm.group(1).upper()
-            if dest in fields: updated_use.add(dest)
-        for mm in RE_MULT.finditer(u):
-            dest = mm.group(1).upper()
-            if dest in fields: updated_use.add(dest)
-        for dm in RE_DIV.finditer(u):
-            dest = dm.group(1).upper()
-            if dest in fields: updated_use.add(dest)
+        for kind in ("compute", "add", "subtract", "multiply", "divide"):
+            for (dest,) in ev[kind]:
+                dest = dest.upper()
+                if dest in fields: updated_use.add(dest)
 
         # EXEC SQL blocks: host variables
-        for block in re.findall(r'EXEC\s+SQL(.*?)END-EXEC\.', u, flags=re.IGNORECASE | re.DOTALL):
+        for (block,) in ev["sql"]:
+            block = block.upper()
             # INSERT/UPDATE -> treat host vars as input to DB2 (values written)
             if RE_SQL_INSERT.search(block) or RE_SQL_UPDATE.search(block):
                 # SET clause host variables
                 setm = RE_SQL_SET.search(block)
                 if setm:
                     for hv in RE_SQL_HOST.findall(setm.group(1)):
-                        hvu = hv.upper()
-                        if hvu in fields: input_use.add(hvu)
+                        if hv in fields: input_use.add(hv)
                 # VALUES/host vars
                 for hv in RE_SQL_HOST.findall(block):
-                    hvu = hv.upper()
-                    if hvu in fields: input_use.add(hvu)
+                    if hv in fields: input_use.add(hv)
             # SELECT INTO -> treat host vars in INTO as updated (receivers)
             if RE_SQL_SELECT.search(block):
                 for inm in RE_SQL_INTO.finditer(block):
                     for hv in RE_SQL_HOST.findall(inm.group(1)):
-                        hvu = hv.upper()
-                        if hvu in fields: updated_use.add(hvu)
+                        if hv in fields: updated_use.add(hv)
                 # WHERE host vars -> input
                 wm = RE_SQL_WHERE.search(block)
                 if wm:
                     for hv in RE_SQL_HOST.findall(wm.group(1)):
-                        hvu = hv.upper()
-                        if hvu in fields: input_use.add(hvu)
+                        if hv in fields: input_use.add(hv)
 
         # Record-level WRITE/REWRITE
-        for wr in RE_WRITE.finditer(u):
-            rec = wr.group(1).upper()
-            if rec in record_names:
-                updated_use.update(fields.keys())
-        for rw in RE_REWRITE.finditer(u):
-            rec = rw.group(1).upper()
-            if rec in record_names:
-                updated_use.update(fields.keys())
+        for (rec,) in ev["write_rec"] + ev["rewrite_rec"]:
+            if rec.upper() in record_names:
+                updated_use.update(fields)
+    return input_use, updated_use
+
+
+def _field_batch(db_path: str, session_id: str, lo: int, hi: int, fields: Set[str],
+                 record_names: Set[str]) -> Tuple[Set[str], Set[str]]:
+    """Pool worker: _field_usage of the chunks with lo <= id <= hi."""
+    return _field_usage(analysis_pool.read_batch(db_path, session_id, lo, hi), fields, record_names)
+
+
+def _field_ids(db_path: str, session_id: str, ids: List[int], fields: Set[str],
+               record_names: Set[str]) -> Tuple[Set[str], Set[str]]:
+    """Pool worker: _field_usage of the given chunk ids (field_index candidates)."""
+    return _field_usage(analysis_pool.read_ids(db_path, session_id, ids), fields, record_names)
 
-        referenced.update(candidate_words)
 
+def analyze_fields(db: DB, session_id: str, copybook_hint: str, workers: int = None) -> Dict[str, Any]:
+    cb_hint = (copybook_hint or "").upper()
+    workers, batches = analysis_pool.plan(db.db_path, session_id, workers)
+    con = sqlite3.connect(db.db_path)
+    cur = con.cursor()
+    if workers:
+        # only copybook candidates here; the program scan reads its batches in the pool workers
+        rows = cur.execute(
+            """SELECT filename, content FROM chunks WHERE session_id=?
+            AND (filename LIKE '%.cpy%' OR filename LIKE '%.copybook%') ORDER BY id ASC""", (session_id,)
+        ).fetchall()
+    else:
+        # Load all chunks for session
+        rows = cur.execute("SELECT filename, content FROM chunks WHERE session_id=? ORDER BY id ASC", (session_id,)).fetchall()
+    con.close()
+
+    # Find copybook chunk(s)
+    cb_texts = _copybook_texts(rows, cb_hint)
+    if not cb_texts:
+        return {"error": "No copybook content found for hint", "hint": cb_hint}
+    record_names, fields = _merge_layouts([_collect_copybook_fields(text) for _, text in cb_texts])
+
+    # Scan program chunks for references
+    names = set(fields)
+    if workers:
+        input_use: Set[str] = set()
+        updated_use: Set[str] = set()
+        jobs = [(db.db_path, session_id, lo, hi, names, record_names) for lo, hi in batches]
+        for inp, upd in analysis_pool.map_ordered(_field_batch, jobs, workers):
+            input_use |= inp
+            updated_use |= upd
+    else:
+        input_use, updated_use = _field_usage(rows, names, record_names)
+
+    return _fields_result(cb_hint, record_names, fields, input_use, updated_use)
+
+
+def _copybook_texts(rows: List[Tuple[str, str]], cb_hint: str) -> List[Tuple[str, str]]:
+    # (filename, content) of the copybook chunks matching the hint, in row order
+    cb_texts = []
+    for fn, content in rows:
+        low = (fn or "").lower()
+        if ".cpy" in low or ".copybook" in low or "copybook:" in (fn or "").upper():
+            if cb_hint and cb_hint not in fn.upper() and cb_hint not in content.upper():
+                continue
+            cb_texts.append((fn, content))
+    return cb_texts
+
+
+def _merge_layouts(layouts: List[Tuple[str, Dict[str, Dict[str, Any]]]]) -> Tuple[Set[str], Dict[str, Dict[str, Any]]]:
+    # For now, merge copybook fields across all matches
+    record_names = set()
+    fields = {}
+    for rec, fdict in layouts:
+        if rec: record_names.add(rec)
+        for k, v in fdict.items():
+            fields.setdefault(k, v)
+    return record_names, fields
+
+
+def _fields_result(cb_hint: str, record_names: Set[str], fields: Dict[str, Dict[str, Any]],
+                   input_use: Set[str], updated_use: Set[str]) -> Dict[str, Any]:
+    static_fields: Set[str] = set(k for k, v in fields.items() if v.get("static"))
     # Compute categories
     used = input_use.union(updated_use)
     unused = set(fields.keys()) - used
@@ -1,5 +1,5 @@
 
-import os, json
+import os, json, math
 from typing import Dict, Any, List, Tuple, Optional
 import networkx as nx
 from pyvis.network import Network
@@ -27,24 +27,41 @@ def _lineage_to_edges(lineage: Dict[str, Any]) -> Tuple[List[Tuple[str,str,dict]
 
     return edges, list(nodes)
 
+def _add_node(G: nx.DiGraph, n: str):
+    if n.startswith("PGM::"):
+        G.add_node(n, label=n.split("::",1)[1], type="program", color="#A3A3A3", shape="box")
+    elif n.startswith("FILE::"):
+        G.add_node(n, label=n.split("::",1)[1], type="file", color="#60A5FA", shape="ellipse")
+    elif n.startswith("TABLE::"):
+        G.add_node(n, label=n.split("::",1)[1], type="table", color="#34D399", shape="ellipse")
+    elif n.startswith("CLUSTER::"):
+        G.add_node(n, label=n.split("::",1)[1], type="cluster", color="#F59E0B", shape="dot")
+    else:
+        G.add_node(n, label=n)
+
 def build_crud_graph(lineage: Dict[str, Any]) -> nx.DiGraph:
     G = nx.DiGraph()
     edges, nodes = _lineage_to_edges(lineage)
     for n in nodes:
-        if n.startswith("PGM::"):
-            G.add_node(n, label=n.split("::",1)[1], type="program", color="#A3A3A3", shape="box")
-        elif n.startswith("FILE::"):
-            G.add_node(n, label=n.split("::",1)[1], type="file", color="#60A5FA", shape="ellipse")
-        elif n.startswith("TABLE::"):
-            G.add_node(n, label=n.split("::",1)[1], type="table", color="#34D399", shape="ellipse")
-        else:
-            G.add_node(n, label=n)
+        _add_node(G, n)
     for u,v,data in edges:
         G.add_edge(u, v, **data)
     return G
 
+def graph_from_result(result: Dict[str, Any]) -> nx.DiGraph:
+    # GraphStore query / graph_view result ({"nodes": [...], "edges": [...]}) -> styled DiGraph for
+    # to_pyvis_html; view labels, cluster sizes and precomputed x/y are carried over
+    G = nx.DiGraph()
+    for n in result.get("nodes", []):
+        _add_node(G, n["id"])
+        G.nodes[n["id"]].update({k: n[k] for k in ("label", "x", "y", "size") if k in n})
+    for e in result.get("edges", []):
+        G.add_edge(e["source"], e["target"], label=e["label"], group=e["group"])
+    return G
+
 def neighborhood_subgraph(G: nx.DiGraph, element: str, radius: int = 2) -> nx.DiGraph:
     # element can be raw like "ACCT_FILE" or "PGM::X". Match by suffix.
+    # (in-memory variant; the API answers from graph_store.GraphStore.neighborhood)
     target = None
     for n in G.nodes:
         if n == element or n.endswith("::"+element):
@@ -72,12 +89,24 @@ def neighborhood_subgraph(G: nx.DiGraph, element: str, radius: int = 2) -> nx.Di
     return G.subgraph(nodes).copy()
 
 def to_pyvis_html(G: nx.DiGraph, out_html_path: str, title: str = "CRUD Map") -> str:
-    net = Network(height="700px", width="100%", directed=True, notebook=False, bgcolor="#111111", font_color="#ffffff")
-    net.barnes_hut()
+    # in_line: vis.js is embedded, so the page works when served from /data and air-gapped
+    net = Network(height="700px", width="100%", directed=True, notebook=False, bgcolor="#111111", font_color="#ffffff",
+                  cdn_resources="in_line")
+    # precomputed positions (graph_view) render without physics; otherwise Barnes-Hut in the browser
+    laid_out = G.number_of_nodes() > 0 and all("x" in d for _, d in G.nodes(data=True))
+    if not laid_out:
+        net.barnes_hut()
     for n, data in G.nodes(data=True):
-        net.add_node(n, label=data.get("label", n), color=data.get("color"), shape=data.get("shape","dot"))
+        extra = {"x": data["x"], "y": data["y"], "physics": False} if laid_out else {}
+        if data.get("type") == "cluster":
+            extra.update(size=10 + 4 * math.sqrt(data.get("size", 1)), title=f"{data.get('size', 1)} nodes, expand to show")
+        net.add_node(n, label=data.get("label", n), color=data.get("color"), shape=data.get("shape","dot"), **extra)
     for u,v,data in G.edges(data=True):
         net.add_edge(u, v, title=data.get("label",""), label=data.get("label",""))
-    net.set_options('var options = { "nodes": { "borderWidth": 1 }, "edges": { "smooth": true }, "physics": { "stabilization": true } }')
-    net.show(out_html_path)
+    if laid_out:
+        net.set_options('var options = { "nodes": { "borderWidth": 1 }, "edges": { "smooth": false }, "physics": { "enabled": false } }')
+    else:
+        net.set_options('var options = { "nodes": { "borderWidth": 1 }, "edges": { "smooth": true }, "physics": { "stabilization": true } }')
+    # write_html, not show(): show() renders the notebook template, which is unset when notebook=False
+    net.write_html(out_html_path)
     return out_html_path
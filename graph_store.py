@@ -0,0 +1,334 @@
+# graph_store.py
+import os, sqlite3, threading
+from typing import Dict, Any, List, Tuple, Optional, Iterable, Set
+from storage import DB
+
+# Lineage graph persisted per session in indexed SQLite tables (same node keys and edge labels as
+# graph_builder: PGM::/FILE::/TABLE:: nodes, program -> data edges). The tables follow the session's
+# chunk_version; neighborhood / impact / path queries expand frontiers with indexed lookups instead of
+# rebuilding a networkx graph per request.
+GRAPH_MAX_NODES = int(os.getenv("GRAPH_MAX_NODES", "2000"))
+
+# edge ops that consume / produce the data node (impact analysis follows read -> write -> read)
+READ_OPS = {"READ", "SELECT", "CICS_READ", "MQGET", "XML_PARSE", "COPY"}
+WRITE_OPS = {"WRITE", "REWRITE", "DELETE", "INSERT", "UPDATE", "CICS_WRITE", "CICS_REWRITE",
+             "CICS_DELETE", "MQPUT", "XML_GENERATE"}
+
+KINDS = {"PGM": "program", "FILE": "file", "TABLE": "table"}
+
+# SQLite's default bound-parameter limit is 999
+_IN_BATCH = 500
+
+
+def lineage_graph(lineage: Dict[str, Any]) -> Tuple[Dict[str, str], Dict[Tuple[str, str], Tuple[str, str]]]:
+    """nodes {key: kind}, edges {(src, dst): (label, group)} of a lineage result."""
+    nodes: Dict[str, str] = {}
+    edges: Dict[Tuple[str, str], Tuple[str, str]] = {}
+    for section, prefix, group in (("files", "FILE", "file"), ("tables", "TABLE", "table")):
+        for name, meta in lineage.get(section, {}).items():
+            dst = f"{prefix}::{name}"
+            nodes[dst] = KINDS[prefix]
+            label = ",".join(sorted(meta.get("ops", {}).keys()))
+            for prog in meta.get("programs", []):
+                src = f"PGM::{prog}"
+                nodes[src] = "program"
+                edges[(src, dst)] = (label, group)
+    return nodes, edges
+
+
+def _ops(label: str) -> Set[str]:
+    return set(label.split(",")) if label else set()
+
+
+class GraphStore:
+    """Per-session lineage graph kept in `graph_nodes` / `graph_edges` (see module comment).
+
+    `sync` diffs the lineage of the current chunk_version against the stored rows, so a re-ingest
+    only writes the nodes/edges that changed. Queries return {"nodes": [...], "edges": [...]}."""
+    def __init__(self, db: DB, lineage_cache):
+        self.db = db
+        self.lineage_cache = lineage_cache
+        self._lock = threading.Lock()
+        self._session_locks: Dict[str, threading.Lock] = {}
+        self._synced: Dict[str, int] = {}
+        self.stats = {"syncs": 0, "nodes_written": 0, "edges_written": 0, "queries": 0}
+        with sqlite3.connect(db.db_path) as con:
+            cur = con.cursor()
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS graph_nodes(
+                session_id TEXT,
+                key TEXT,
+                kind TEXT,
+                name TEXT,
+                name_lower TEXT,
+                PRIMARY KEY(session_id, key)
+            );
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_graph_nodes_name ON graph_nodes(session_id, name_lower)")
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS graph_edges(
+                session_id TEXT,
+                src TEXT,
+                dst TEXT,
+                label TEXT,
+                grp TEXT,
+                PRIMARY KEY(session_id, src, dst)
+            );
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_graph_edges_dst ON graph_edges(session_id, dst)")
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS graph_versions(
+                session_id TEXT PRIMARY KEY,
+                version INTEGER
+            );
+            """)
+            con.commit()
+            self._synced = dict(con.execute("SELECT session_id, version FROM graph_versions").fetchall())
+
+    def _count(self, key: str, n: int = 1):
+        with self._lock:
+            self.stats[key] += n
+
+    def _session_lock(self, session_id: str) -> threading.Lock:
+        with self._lock:
+            return self._session_locks.setdefault(session_id, threading.Lock())
+
+    # --- sync ---
+    def ensure(self, session_id: str) -> int:
+        """Bring the session's graph up to its chunk_version; returns that version."""
+        version = self.db.chunk_version(session_id)
+        if self._synced.get(session_id) == version:
+            return version
+        with self._session_lock(session_id):
+            if self._synced.get(session_id) != version:
+                self.sync(session_id, self.lineage_cache.get(session_id), version)
+        return version
+
+    def sync(self, session_id: str, lineage: Dict[str, Any], version: int):
+        nodes, edges = lineage_graph(lineage)
+        with sqlite3.connect(self.db.db_path) as con:
+            old_nodes = dict(con.execute("SELECT key, kind FROM graph_nodes WHERE session_id = ?", (session_id,)))
+            old_edges = {(s, d): (l, g) for s, d, l, g in con.execute(
+                "SELECT src, dst, label, grp FROM graph_edges WHERE session_id = ?", (session_id,))}
+            con.executemany("DELETE FROM graph_edges WHERE session_id = ? AND src = ? AND dst = ?",
+                            [(session_id, s, d) for (s, d) in old_edges if (s, d) not in edges])
+            con.executemany("DELETE FROM graph_nodes WHERE session_id = ? AND key = ?",
+                            [(session_id, k) for k in old_nodes if k not in nodes])
+            new_nodes = [(session_id, k, kind, k.split("::", 1)[1], k.split("::", 1)[1].lower())
+                         for k, kind in nodes.items() if old_nodes.get(k) != kind]
+            new_edges = [(session_id, s, d, l, g) for (s, d), (l, g) in edges.items() if old_edges.get((s, d)) != (l, g)]
+            con.executemany("INSERT OR REPLACE INTO graph_nodes(session_id, key, kind, name, name_lower) VALUES (?, ?, ?, ?, ?)", new_nodes)
+            con.executemany("INSERT OR REPLACE INTO graph_edges(session_id, src, dst, label, grp) VALUES (?, ?, ?, ?, ?)", new_edges)
+            con.execute("INSERT OR REPLACE INTO graph_versions(session_id, version) VALUES (?, ?)", (session_id, version))
+            con.commit()
+        self._synced[session_id] = version
+        self._count("syncs")
+        self._count("nodes_written", len(new_nodes))
+        self._count("edges_written", len(new_edges))
+
+    # --- lookups ---
+    def resolve(self, session_id: str, element: str) -> Optional[str]:
+        """Node key for `element`: exact key, then exact name (PGM, FILE, TABLE order),
+        then case-insensitive name prefix, then substring. None if nothing matches."""
+        self.ensure(session_id)
+        el = (element or "").strip()
+        if not el:
+            return None
+        low = el.lower()
+        with sqlite3.connect(self.db.db_path) as con:
+            if con.execute("SELECT 1 FROM graph_nodes WHERE session_id = ? AND key = ?", (session_id, el)).fetchone():
+                return el
+            rows = con.execute("SELECT key, name FROM graph_nodes WHERE session_id = ? AND name_lower = ? ORDER BY key",
+                               (session_id, low)).fetchall()
+            exact = [k for k, name in rows if name == el]
+            order = {"PGM": 0, "FILE": 1, "TABLE": 2}
+            for cands in (exact, [k for k, _ in rows]):
+                if cands:
+                    return min(cands, key=lambda k: (order.get(k.split("::", 1)[0], 3), k))
+            row = con.execute(
+                "SELECT key FROM graph_nodes WHERE session_id = ? AND name_lower >= ? AND name_lower < ? ORDER BY name_lower, key LIMIT 1",
+                (session_id, low, low + "\U0010ffff")).fetchone()
+            if row:
+                return row[0]
+            # last resort, scans the session's node names
+            row = con.execute("SELECT key FROM graph_nodes WHERE session_id = ? AND instr(name_lower, ?) > 0 ORDER BY key LIMIT 1",
+                              (session_id, low)).fetchone()
+            return row[0] if row else None
+
+    def search(self, session_id: str, prefix: str, limit: int = 20) -> List[Dict[str, str]]:
+        """Nodes whose name starts with prefix (case-insensitive), for element pickers."""
+        self.ensure(session_id)
+        low = (prefix or "").lower()
+        with sqlite3.connect(self.db.db_path) as con:
+            rows = con.execute(
+                "SELECT key, kind, name FROM graph_nodes WHERE session_id = ? AND name_lower >= ? AND name_lower < ? ORDER BY name_lower, key LIMIT ?",
+                (session_id, low, low + "\U0010ffff", limit)).fetchall()
+        return [{"id": k, "type": kind, "label": name} for k, kind, name in rows]
+
+    @staticmethod
+    def _edges_into(con: sqlite3.Connection, session_id: str, keys: Iterable[str], col: str) -> List[Tuple[str, str, str, str]]:
+        # edges whose `col` (src or dst) is one of keys; indexed by the PK / idx_graph_edges_dst
+        keys = list(keys)
+        out = []
+        for i in range(0, len(keys), _IN_BATCH):
+            part = keys[i:i + _IN_BATCH]
+            out += con.execute(f"SELECT src, dst, label, grp FROM graph_edges WHERE session_id = ? AND {col} IN ({','.join('?' * len(part))})",
+                               (session_id, *part)).fetchall()
+        return out
+
+    def _edges_touching(self, con: sqlite3.Connection, session_id: str, keys: List[str]) -> List[Tuple[str, str, str, str]]:
+        return self._edges_into(con, session_id, keys, "src") + self._edges_into(con, session_id, keys, "dst")
+
+    def _result(self, con: sqlite3.Connection, session_id: str, keys: Set[str],
+                edges: Iterable[Tuple[str, str, str, str]], **extra) -> Dict[str, Any]:
+        meta: Dict[str, Tuple[str, str]] = {}
+        klist = sorted(keys)
+        for i in range(0, len(klist), _IN_BATCH):
+            part = klist[i:i + _IN_BATCH]
+            for k, kind, name in con.execute(
+                    f"SELECT key, kind, name FROM graph_nodes WHERE session_id = ? AND key IN ({','.join('?' * len(part))})",
+                    (session_id, *part)):
+                meta[k] = (kind, name)
+        nodes = [{"id": k, "type": meta[k][0], "label": meta[k][1]} for k in klist if k in meta]
+        seen: Set[Tuple[str, str]] = set()
+        out_edges = []
+        for s, d, label, grp in sorted(edges):
+            if (s, d) in seen or s not in keys or d not in keys:
+                continue
+            seen.add((s, d))
+            out_edges.append({"source": s, "target": d, "label": label, "group": grp})
+        return {"nodes": nodes, "edges": out_edges, **extra}
+
+    # --- queries ---
+    def neighborhood(self, session_id: str, element: str, radius: int = 2,
+                     max_nodes: int = GRAPH_MAX_NODES) -> Dict[str, Any]:
+        """Nodes within `radius` hops (either direction) of element, and the edges among them.
+        Expansion stops at max_nodes (truncated=True)."""
+        target = self.resolve(session_id, element)
+        self._count("queries")
+        if target is None:
+            return {"target": None, "nodes": [], "edges": [], "truncated": False}
+        seen = {target}
+        frontier = {target}
+        edges: List[Tuple[str, str, str, str]] = []
+        truncated = False
+        with sqlite3.connect(self.db.db_path) as con:
+            for _ in range(max(0, radius)):
+                if not frontier:
+                    break
+                nxt: Set[str] = set()
+                for e in self._edges_touching(con, session_id, sorted(frontier)):
+                    for n in (e[0], e[1]):
+                        if n not in seen and n not in nxt:
+                            if len(seen) + len(nxt) >= max_nodes:
+                                truncated = True
+                                continue
+                            nxt.add(n)
+                    edges.append(e)
+                seen |= nxt
+                frontier = nxt
+                if truncated:
+                    break
+            # edges among the last ring were not expanded yet
+            if frontier:
+                edges += self._edges_touching(con, session_id, sorted(frontier))
+            return self._result(con, session_id, seen, edges, target=target, radius=radius, truncated=truncated)
+
+    def users(self, session_id: str, element: str, mode: Optional[str] = None) -> Dict[str, Any]:
+        """Programs using a file/table: mode "read", "write" or None (any op)."""
+        target = self.resolve(session_id, element)
+        self._count("queries")
+        if target is None:
+            return {"target": None, "programs": []}
+        want = {"read": READ_OPS, "write": WRITE_OPS}.get(mode or "")
+        with sqlite3.connect(self.db.db_path) as con:
+            rows = con.execute("SELECT src, label FROM graph_edges WHERE session_id = ? AND dst = ? ORDER BY src",
+                               (session_id, target)).fetchall()
+        progs = [{"program": s.split("::", 1)[1], "ops": label.split(",") if label else []}
+                 for s, label in rows if want is None or _ops(label) & want]
+        return {"target": target, "mode": mode, "programs": progs}
+
+    def impact(self, session_id: str, element: str, depth: int = 3,
+               max_nodes: int = GRAPH_MAX_NODES) -> Dict[str, Any]:
+        """Downstream impact of a change to a data node (or program): its readers, the data
+        those programs write, their readers, ... up to `depth` reader levels. Stops after the
+        level on which max_nodes is reached (truncated=True)."""
+        target = self.resolve(session_id, element)
+        self._count("queries")
+        if target is None:
+            return {"target": None, "nodes": [], "edges": [], "levels": {}, "truncated": False}
+        levels: Dict[str, int] = {target: 0}
+        edges: List[Tuple[str, str, str, str]] = []
+        truncated = False
+        with sqlite3.connect(self.db.db_path) as con:
+            if target.startswith("PGM::"):
+                programs = {target}
+                data: Set[str] = set()
+            else:
+                programs = set()
+                data = {target}
+            for level in range(1, max(1, depth) + 1):
+                if data:
+                    programs = set()
+                    for e in self._edges_into(con, session_id, sorted(data), "dst"):
+                        if _ops(e[2]) & READ_OPS:
+                            edges.append(e)
+                            if e[0] not in levels:
+                                programs.add(e[0])
+                                levels[e[0]] = level
+                if len(levels) >= max_nodes:
+                    truncated = True
+                    break
+                data = set()
+                for e in self._edges_into(con, session_id, sorted(programs), "src"):
+                    if _ops(e[2]) & WRITE_OPS:
+                        edges.append(e)
+                        if e[1] not in levels:
+                            data.add(e[1])
+                            levels[e[1]] = level
+                if not data:
+                    break
+            return self._result(con, session_id, set(levels), edges, target=target, depth=depth,
+                                levels=levels, truncated=truncated)
+
+    def path(self, session_id: str, source: str, target: str, max_hops: int = 6) -> Dict[str, Any]:
+        """Shortest path between two elements, ignoring edge direction (bidirectional BFS)."""
+        src = self.resolve(session_id, source)
+        dst = self.resolve(session_id, target)
+        self._count("queries")
+        if src is None or dst is None:
+            return {"source": src, "target": dst, "path": [], "nodes": [], "edges": []}
+        parents: Tuple[Dict[str, Optional[str]], Dict[str, Optional[str]]] = ({src: None}, {dst: None})
+        frontiers: Tuple[Set[str], Set[str]] = ({src}, {dst})
+        meet = src if src == dst else None
+        with sqlite3.connect(self.db.db_path) as con:
+            hops = 0
+            while meet is None and hops < max_hops and frontiers[0] and frontiers[1]:
+                # expand the smaller side
+                side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+                mine, other = parents[side], parents[1 - side]
+                nxt: Set[str] = set()
+                for s, d, _, _ in self._edges_touching(con, session_id, sorted(frontiers[side])):
+                    for a, b in ((s, d), (d, s)):
+                        if a in frontiers[side] and b not in mine:
+                            mine[b] = a
+                            nxt.add(b)
+                            if b in other and meet is None:
+                                meet = b
+                frontiers = (nxt, frontiers[1]) if side == 0 else (frontiers[0], nxt)
+                hops += 1
+            if meet is None:
+                return {"source": src, "target": dst, "path": [], "nodes": [], "edges": []}
+            path = []
+            n: Optional[str] = meet
+            while n is not None:
+                path.append(n)
+                n = parents[0][n]
+            path.reverse()
+            n = parents[1][meet]
+            while n is not None:
+                path.append(n)
+                n = parents[1][n]
+            pairs = {frozenset(p) for p in zip(path, path[1:])}
+            edges = [e for e in self._edges_touching(con, session_id, path) if frozenset((e[0], e[1])) in pairs]
+            return self._result(con, session_id, set(path), edges, source=src, target=dst, path=path)
@@ -0,0 +1,296 @@
+# graph_view.py
+import os, glob, math, hashlib, threading
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Dict, Any, List, Tuple, Iterable
+import networkx as nx
+from graph_store import lineage_graph
+from graph_builder import graph_from_result, to_pyvis_html
+
+# Render-side views of the lineage graph. Views above GRAPH_CLUSTER_THRESHOLD nodes are collapsed
+# into clusters (programs by name prefix, datasets by HLQ, tables by schema) that expand on demand.
+# Positions are computed here (spring layout of the cluster graph, expanded members on a ring around
+# their cluster), so the browser renders with physics off. Views and HTML files are cached per
+# session chunk_version.
+GRAPH_CLUSTER_THRESHOLD = int(os.getenv("GRAPH_CLUSTER_THRESHOLD", "400"))
+GRAPH_CLUSTER_PREFIX = int(os.getenv("GRAPH_CLUSTER_PREFIX", "3"))
+# auto clustering shortens the prefix until there are at most this many clusters, then splits any
+# cluster above GRAPH_CLUSTER_MAX_SIZE members by a longer prefix, so expanding one stays readable
+GRAPH_MAX_CLUSTERS = int(os.getenv("GRAPH_MAX_CLUSTERS", "300"))
+GRAPH_CLUSTER_MAX_SIZE = int(os.getenv("GRAPH_CLUSTER_MAX_SIZE", "200"))
+# spring layout above this many anchors is too slow per request; larger views use a grid
+GRAPH_LAYOUT_MAX_NODES = int(os.getenv("GRAPH_LAYOUT_MAX_NODES", "400"))
+GRAPH_PAGE_SIZE = int(os.getenv("GRAPH_PAGE_SIZE", "2000"))
+GRAPH_VIEW_CACHE = int(os.getenv("GRAPH_VIEW_CACHE", "32"))
+# rendered HTML files kept per (session, kind, version); least recently served are removed
+GRAPH_HTML_CACHE = int(os.getenv("GRAPH_HTML_CACHE", "16"))
+
+
+def cluster_of(key: str, prefix_len: int) -> str:
+    """Cluster id of a node key: PGM by name prefix, DSN/dotted files by HLQ, tables by schema."""
+    kind, _, name = key.partition("::")
+    name = name.upper()
+    if kind == "PGM":
+        base = name.rsplit(".", 1)[0].rsplit("/", 1)[-1]
+        return f"PGM:{base[:prefix_len]}"
+    if kind == "TABLE":
+        return f"TABLE:{name.split('.', 1)[0] if '.' in name else name[:prefix_len]}"
+    tag, sep, rest = name.partition(":")
+    if sep and tag == "DSN":
+        return f"DSN:{rest.split('.', 1)[0]}"
+    if sep and tag == "COPYBOOK":
+        return "COPYBOOK"
+    if sep and tag == "LOGICAL":
+        return f"LOGICAL:{rest[:prefix_len]}"
+    return f"FILE:{name.split('.', 1)[0] if '.' in name else name[:prefix_len]}"
+
+
+def _member_name(key: str) -> str:
+    kind, _, name = key.partition("::")
+    name = name.upper()
+    return name.rsplit(".", 1)[0].rsplit("/", 1)[-1] if kind == "PGM" else name
+
+
+def _split(cid: str, keys: List[str], limit: int) -> Dict[str, List[str]]:
+    """Cluster -> sub-clusters "<cid>/<longer name prefix>" of at most limit members where the names
+    allow it: one more prefix character per level, recursing only into parts still too large."""
+    if len(keys) <= limit:
+        return {cid: keys}
+    names = {k: _member_name(k) for k in keys}
+    n = len(os.path.commonprefix(list(names.values()))) + 1
+    if n > max(len(v) for v in names.values()):
+        return {cid: keys}
+    parts: Dict[str, List[str]] = {}
+    for k in keys:
+        parts.setdefault(f"{cid}/{names[k][:n]}", []).append(k)
+    out: Dict[str, List[str]] = {}
+    for sub, ms in parts.items():
+        out.update(_split(sub, ms, limit))
+    return out
+
+
+def normalize_expand(expand: Iterable[str]) -> Tuple[str, ...]:
+    """Cluster ids to expand, with or without the CLUSTER:: prefix, deduplicated and sorted."""
+    return tuple(sorted({e[len("CLUSTER::"):] if e.startswith("CLUSTER::") else e for e in expand if e}))
+
+
+def _grid(keys: List[str], spacing: float) -> Dict[str, Tuple[float, float]]:
+    side = max(1, math.ceil(math.sqrt(len(keys))))
+    return {k: ((i % side) * spacing, (i // side) * spacing) for i, k in enumerate(keys)}
+
+
+def _anchor_layout(keys: List[str], edges: Iterable[Tuple[str, str]], spacing: float = 120.0) -> Dict[str, Tuple[float, float]]:
+    # deterministic: sorted keys, fixed seed
+    keys = sorted(keys)
+    if len(keys) > GRAPH_LAYOUT_MAX_NODES:
+        return _grid(keys, spacing)
+    G = nx.Graph()
+    G.add_nodes_from(keys)
+    G.add_edges_from(e for e in edges if e[0] != e[1])
+    pos = nx.spring_layout(G, seed=7, iterations=50)
+    scale = spacing * math.sqrt(len(keys))
+    return {k: (round(float(p[0]) * scale, 1), round(float(p[1]) * scale, 1)) for k, p in pos.items()}
+
+
+def _ring(center: Tuple[float, float], members: List[str], spacing: float = 40.0) -> Dict[str, Tuple[float, float]]:
+    # members on concentric rings around the cluster position
+    out: Dict[str, Tuple[float, float]] = {}
+    ring, i = 1, 0
+    while i < len(members):
+        cap = 6 * ring
+        part = members[i:i + cap]
+        for j, k in enumerate(part):
+            a = 2 * math.pi * j / len(part)
+            out[k] = (round(center[0] + ring * spacing * math.cos(a), 1), round(center[1] + ring * spacing * math.sin(a), 1))
+        i += cap
+        ring += 1
+    return out
+
+
+def build_view(nodes: Dict[str, str], edges: Dict[Tuple[str, str], Tuple[str, str]], cluster: str = "auto",
+               prefix_len: int = GRAPH_CLUSTER_PREFIX, expand: Iterable[str] = ()) -> Dict[str, Any]:
+    """Laid-out (optionally clustered) view of a graph: nodes {key: kind}, edges {(src, dst): (label, group)}.
+    cluster: "none", "prefix" (always) or "auto" (above GRAPH_CLUSTER_THRESHOLD nodes)."""
+    clustered = cluster == "prefix" or (cluster == "auto" and len(nodes) > GRAPH_CLUSTER_THRESHOLD)
+    if not clustered:
+        pos = _anchor_layout(list(nodes), edges.keys())
+        vnodes = [{"id": k, "label": k.split("::", 1)[1], "type": t, "x": pos[k][0], "y": pos[k][1]}
+                  for k, t in sorted(nodes.items())]
+        vedges = [{"source": s, "target": d, "label": l, "group": g} for (s, d), (l, g) in sorted(edges.items())]
+        return {"clustered": False, "prefix_len": None, "clusters": 0, "nodes": vnodes, "edges": vedges}
+
+    plen = max(1, prefix_len)
+    while True:
+        of = {k: cluster_of(k, plen) for k in nodes}
+        if cluster != "auto" or plen == 1 or len(set(of.values())) <= GRAPH_MAX_CLUSTERS:
+            break
+        plen -= 1
+    members: Dict[str, List[str]] = {}
+    for k in sorted(nodes):
+        members.setdefault(of[k], []).append(k)
+    if cluster == "auto":
+        members = {sub: ms for c, ms in members.items() for sub, ms in _split(c, ms, GRAPH_CLUSTER_MAX_SIZE).items()}
+        of = {k: c for c, ms in members.items() for k in ms}
+    expand = set(normalize_expand(expand))
+
+    # anchors: one per cluster, laid out on the collapsed cluster graph
+    cedges = {(of[s], of[d]) for (s, d) in edges}
+    anchor = _anchor_layout(list(members), cedges, spacing=160.0)
+
+    def shown(k: str) -> str:
+        c = of[k]
+        return k if (c in expand or len(members[c]) == 1) else f"CLUSTER::{c}"
+
+    vnodes = []
+    for c in sorted(members):
+        ms = members[c]
+        if c in expand or len(ms) == 1:
+            ring = _ring(anchor[c], ms) if len(ms) > 1 else {ms[0]: anchor[c]}
+            vnodes += [{"id": k, "label": k.split("::", 1)[1], "type": nodes[k], "cluster": c,
+                        "x": ring[k][0], "y": ring[k][1]} for k in ms]
+        else:
+            kinds = sorted({nodes[k] for k in ms})
+            vnodes.append({"id": f"CLUSTER::{c}", "label": f"{c} ({len(ms)})", "type": "cluster", "cluster": c,
+                           "size": len(ms), "kinds": kinds, "x": anchor[c][0], "y": anchor[c][1]})
+    agg: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for (s, d), (label, grp) in edges.items():
+        vs, vd = shown(s), shown(d)
+        e = agg.get((vs, vd))
+        if e is None:
+            e = agg[(vs, vd)] = {"source": vs, "target": vd, "ops": set(), "group": grp, "count": 0}
+        e["ops"].update(label.split(",") if label else [])
+        e["count"] += 1
+    vedges = []
+    for key in sorted(agg):
+        e = agg[key]
+        ops = ",".join(sorted(e.pop("ops")))
+        e["label"] = ops if e["count"] == 1 else f"{ops} ×{e['count']}"
+        vedges.append(e)
+    return {"clustered": True, "prefix_len": plen, "clusters": len(members), "nodes": vnodes, "edges": vedges}
+
+
+def page(view: Dict[str, Any], offset: int = 0, limit: int = GRAPH_PAGE_SIZE) -> Dict[str, Any]:
+    """Nodes [offset, offset+limit) and the edges whose later endpoint falls in that range,
+    so concatenating all pages yields every node and every edge exactly once."""
+    if "_edge_rank" not in view:
+        index = {n["id"]: i for i, n in enumerate(view["nodes"])}
+        ranked = sorted(((max(index[e["source"]], index[e["target"]]), i) for i, e in enumerate(view["edges"])))
+        view["_edge_rank"] = [r for r, _ in ranked]
+        view["_edge_order"] = [i for _, i in ranked]
+    offset = max(0, offset)
+    limit = max(1, limit)
+    end = min(offset + limit, len(view["nodes"]))
+    lo = bisect_right(view["_edge_rank"], offset - 1)
+    hi = bisect_right(view["_edge_rank"], end - 1)
+    return {
+        "clustered": view["clustered"], "prefix_len": view["prefix_len"], "clusters": view["clusters"],
+        "total_nodes": len(view["nodes"]), "total_edges": len(view["edges"]),
+        "offset": offset, "limit": limit, "next_offset": end if end < len(view["nodes"]) else None,
+        "nodes": view["nodes"][offset:end],
+        "edges": [view["edges"][i] for i in view["_edge_order"][lo:hi]],
+    }
+
+
+class GraphViews:
+    """Cached views and pyvis HTML keyed by the session's chunk_version (the lineage version)."""
+    def __init__(self, db, lineage_cache, graph_store, data_dir: str):
+        self.db = db
+        self.lineage_cache = lineage_cache
+        self.graph_store = graph_store
+        self.data_dir = data_dir
+        self._lock = threading.Lock()
+        self._views: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._file_locks: Dict[str, threading.Lock] = {}
+        self.stats = {"view_hits": 0, "view_builds": 0, "html_hits": 0, "html_renders": 0}
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def view(self, session_id: str, cluster: str = "auto", prefix_len: int = GRAPH_CLUSTER_PREFIX,
+             expand: Iterable[str] = ()) -> Tuple[int, Dict[str, Any]]:
+        """(version, laid-out CRUD map view); shared, callers must not mutate."""
+        version = self.db.chunk_version(session_id)
+        expand = normalize_expand(expand)
+        key = (session_id, version, cluster, prefix_len, expand)
+        with self._lock:
+            hit = self._views.get(key)
+            if hit is not None:
+                self._views.move_to_end(key)
+                self.stats["view_hits"] += 1
+                return version, hit
+        nodes, edges = lineage_graph(self.lineage_cache.get(session_id))
+        v = build_view(nodes, edges, cluster=cluster, prefix_len=prefix_len, expand=expand)
+        page(v, 0, 1)  # precompute the edge ranking while not shared yet
+        self._count("view_builds")
+        with self._lock:
+            self._views[key] = v
+            while len(self._views) > GRAPH_VIEW_CACHE:
+                self._views.popitem(last=False)
+        return version, v
+
+    def _touch(self, path: str) -> bool:
+        # served files get a fresh mtime: _evict keeps the most recently served ones
+        try:
+            os.utime(path)
+            return True
+        except OSError:
+            return False
+
+    def _evict(self, session_id: str, kind: str, version: int, keep: str):
+        # other versions of the kind go; within the version only the GRAPH_HTML_CACHE newest stay
+        current = []
+        for old in glob.glob(os.path.join(self.data_dir, f"{session_id}_{kind}_v*.html")):
+            if old == keep or old.endswith(".tmp.html"):
+                continue
+            try:
+                if os.path.basename(old).startswith(f"{session_id}_{kind}_v{version}_"):
+                    current.append((os.path.getmtime(old), old))
+                else:
+                    os.remove(old)
+            except OSError:
+                pass
+        for _, old in sorted(current, reverse=True)[max(0, GRAPH_HTML_CACHE - 1):]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+    def _html(self, session_id: str, kind: str, version: int, params: str, title: str, render) -> Tuple[str, bool]:
+        # <sid>_<kind>_v<version>_<params hash>.html, see _evict
+        tag = hashlib.sha1(params.encode("utf-8")).hexdigest()[:12]
+        path = os.path.join(self.data_dir, f"{session_id}_{kind}_v{version}_{tag}.html")
+        if self._touch(path):
+            self._count("html_hits")
+            return path, True
+        with self._lock:
+            lock = self._file_locks.setdefault(path, threading.Lock())
+        with lock:
+            if os.path.exists(path):
+                self._count("html_hits")
+                return path, True
+            tmp = path + ".tmp.html"
+            to_pyvis_html(graph_from_result(render()), tmp, title=title)
+            os.replace(tmp, path)
+            self._count("html_renders")
+            self._evict(session_id, kind, version, path)
+        with self._lock:
+            self._file_locks.pop(path, None)
+        return path, False
+
+    def crud_html(self, session_id: str, cluster: str = "auto", prefix_len: int = GRAPH_CLUSTER_PREFIX,
+                  expand: Iterable[str] = ()) -> Tuple[str, bool]:
+        expand = normalize_expand(expand)
+        version, v = self.view(session_id, cluster, prefix_len, expand)
+        params = f"{cluster}|{prefix_len}|{','.join(expand)}"
+        return self._html(session_id, "crud", version, params, "CRUD Map", lambda: v)
+
+    def dependency_html(self, session_id: str, element: str, radius: int = 2) -> Tuple[str, bool]:
+        version = self.graph_store.ensure(session_id)
+
+        def render():
+            res = self.graph_store.neighborhood(session_id, element, radius=radius)
+            nodes = {n["id"]: n["type"] for n in res["nodes"]}
+            edges = {(e["source"], e["target"]): (e["label"], e["group"]) for e in res["edges"]}
+            return build_view(nodes, edges, cluster="auto")
+        return self._html(session_id, "dep", version, f"{element}|{radius}", f"Dependency: {element}", render)
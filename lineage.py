@@ -1,38 +1,14 @@
 
-import re
+import re, json, sqlite3, threading
 from typing import Dict, Any, List, Tuple
 from storage import DB
+from cobol_scanner import lineage_scanner
+import analysis_pool
 
-# Regex heuristics for COBOL/VSAM/DB2/JCL/CICS/MQ/XML
-RE_FILE_ASSIGN = re.compile(r'\bSELECT\s+(\S+)\s+ASSIGN\b', re.IGNORECASE)
-RE_FD = re.compile(r'\bFD\s+(\S+)', re.IGNORECASE)
-RE_READ = re.compile(r'\bREAD\s+(\S+)', re.IGNORECASE)
-RE_WRITE = re.compile(r'\bWRITE\s+(\S+)', re.IGNORECASE)
-RE_REWRITE = re.compile(r'\bREWRITE\s+(\S+)', re.IGNORECASE)
-RE_DELETE = re.compile(r'\bDELETE\s+(\S+)', re.IGNORECASE)
-
-RE_EXEC_SQL = re.compile(r'EXEC\s+SQL(.*?)END-EXEC\.', re.IGNORECASE | re.DOTALL)
+# Statement matching lives in cobol_scanner (one pass per chunk); SQL bodies are parsed here
 RE_SQL_TABLE = re.compile(r'\bFROM\s+([A-Z0-9_."]+)|\bINTO\s+([A-Z0-9_."]+)', re.IGNORECASE)
 RE_SQL_VERB = re.compile(r'\b(SELECT|INSERT|UPDATE|DELETE)\b', re.IGNORECASE)
 
-RE_JCL_DD = re.compile(r'^\s*//(?P<step>\S+)\s+DD\s+DSN=(?P<dsn>[^,]+)', re.IGNORECASE | re.MULTILINE)
-
-# COPY statements (copybooks)
-RE_COPY = re.compile(r'\bCOPY\s+["\']?([A-Z0-9_.\-\/]+)["\']?', re.IGNORECASE)
-
-# CICS verbs (basic)
-RE_CICS = re.compile(r'EXEC\s+CICS\s+(READ|REWRITE|WRITE|DELETE)\s+(FILE|QUEUE)\s*\(\s*([\w\-\.\']+)\s*\)', re.IGNORECASE)
-
-# MQ calls
-RE_MQ_CALL = re.compile(r'CALL\s+["\']MQ(PUT|GET|OPEN|CLOSE)["\']', re.IGNORECASE)
-
-# XML verbs
-RE_XML_GEN = re.compile(r'\bXML\s+GENERATE\b\s+([A-Z0-9\-]+)', re.IGNORECASE)
-RE_XML_PARSE = re.compile(r'\bXML\s+PARSE\b\s+([A-Z0-9\-]+)', re.IGNORECASE)
-
-# Logical <- DDNAME mapping
-RE_SELECT_ASSIGN = re.compile(r'\bSELECT\s+(\S+)\s+ASSIGN\s+TO\s+([A-Z0-9_\-\'"]+)', re.IGNORECASE)
-
 def _add_op(d: Dict[str, Any], subject: str, op: str, program: str, line: int):
     subject = subject.strip().strip('.').strip('"').strip("'")
     if subject not in d:
@@ -48,91 +24,264 @@ def _norm_copy_name(name: str) -> Tuple[str, str]:
     physical = base if base.upper().endswith(('.CPY', '.COPYBOOK')) else (base + '.CPY')
     return (logical, physical.upper())
 
-def analyze_session(db: DB, session_id: str) -> Dict[str, Any]:
-    # Scan code chunks in a session to build CRUD map & lineage heuristics.
+RELEVANT = (".cbl", ".cob", ".cpy", ".jcl", ".cics", "db2:")
+
+
+def _scan(content: str, program: str, lineage_files: Dict[str, Any], lineage_tables: Dict[str, Any]):
+    ev = lineage_scanner.scan(content)
+    # events are applied kind by kind in the order the former per-regex passes ran,
+    # so subjects and ops keep the same insertion order
+    # VSAM/COBOL file ops
+    for (subject,) in ev["assign"]:
+        _add_op(lineage_files, subject, "ASSIGN", program, 0)
+    for (subject,) in ev["fd"]:
+        _add_op(lineage_files, subject, "FD", program, 0)
+    for (subject,) in ev["read"]:
+        _add_op(lineage_files, subject, "READ", program, 0)
+    for (subject,) in ev["write"]:
+        _add_op(lineage_files, subject, "WRITE", program, 0)
+    for (subject,) in ev["rewrite"]:
+        _add_op(lineage_files, subject, "REWRITE", program, 0)
+    for (subject,) in ev["delete"]:
+        _add_op(lineage_files, subject, "DELETE", program, 0)
+
+    # DB2/SQL
+    for (block,) in ev["sql"]:
+        verb = None
+        vm = RE_SQL_VERB.search(block)
+        if vm:
+            verb = vm.group(1).upper()
+        for tm in RE_SQL_TABLE.finditer(block):
+            tbl = tm.group(1) or tm.group(2)
+            if not tbl:
+                continue
+            subj = tbl.replace('\n',' ').strip()
+            if verb:
+                _add_op(lineage_tables, subj, verb, program, 0)
+
+    # COPY usage
+    for (name,) in ev["copy"]:
+        logical, physical = _norm_copy_name(name.upper())
+        _add_op(lineage_files, f"COPYBOOK:{logical}", "COPY", program, 0)
+        _add_op(lineage_files, f"COPYBOOK:{physical}", "COPY", program, 0)
+
+    # CICS
+    for verb, _, obj in ev["cics"]:
+        _add_op(lineage_files, obj.strip(" '\""), f"CICS_{verb.upper()}", program, 0)
+
+    # MQ
+    for (verb,) in ev["mq"]:
+        _add_op(lineage_files, "MQ", f"MQ{verb.upper()}", program, 0)
+
+    # XML
+    for (subject,) in ev["xml_generate"]:
+        _add_op(lineage_files, subject, "XML_GENERATE", program, 0)
+    for (subject,) in ev["xml_parse"]:
+        _add_op(lineage_files, subject, "XML_PARSE", program, 0)
+
+    # Logical ↔ DDNAME mapping
+    for logical, ddname in ev["select_assign"]:
+        ddname = ddname.strip("'\" ")
+        _add_op(lineage_files, f"LOGICAL:{logical}", f"ASSIGN:{ddname}", program, 0)
+
+    # JCL: DSN capture
+    for _, dsn in ev["jcl_dd"]:
+        _add_op(lineage_files, f"DSN:{dsn}", "JCL_DD", program, 0)
+
+
+def _finalize(d: Dict[str, Any]) -> Dict[str, Any]:
+    out = {}
+    for k, v in d.items():
+        out[k] = {"ops": v["ops"], "programs": sorted(list(v["programs"]))}
+    return out
+
+
+def _merge_into(dest: Dict[str, Any], src: Dict[str, Any]):
+    # batch partials merged in batch order keep first-seen subject/op order
+    for subject, v in src.items():
+        entry = dest.get(subject)
+        if entry is None:
+            entry = dest[subject] = {"ops": {}, "programs": set()}
+        for op, n in v["ops"].items():
+            entry["ops"][op] = entry["ops"].get(op, 0) + n
+        entry["programs"].update(v["programs"])
+
+
+def _scan_batch(db_path: str, session_id: str, lo: int, hi: int) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Pool worker: unfinalized (files, tables) of the chunks with lo <= id <= hi."""
+    files: Dict[str, Any] = {}
+    tables: Dict[str, Any] = {}
+    for filename, content in analysis_pool.read_batch(db_path, session_id, lo, hi):
+        if any(x in (filename or "").lower() for x in RELEVANT):
+            _scan(content, filename, files, tables)
+    return files, tables
+
+
+def analyze_session(db: DB, session_id: str, workers: int = None) -> Dict[str, Any]:
+    # Scan code chunks in a session to build CRUD map & lineage heuristics (full rescan;
+    # request handlers go through LineageCache instead).
     lineage_files: Dict[str, Any] = {}
     lineage_tables: Dict[str, Any] = {}
 
+    workers, batches = analysis_pool.plan(db.db_path, session_id, workers)
+    if workers:
+        jobs = [(db.db_path, session_id, lo, hi) for lo, hi in batches]
+        for files, tables in analysis_pool.map_ordered(_scan_batch, jobs, workers):
+            _merge_into(lineage_files, files)
+            _merge_into(lineage_tables, tables)
+        return {"files": _finalize(lineage_files), "tables": _finalize(lineage_tables)}
+
     # pull all chunks from this session
-    import sqlite3
     con = sqlite3.connect(db.db_path)
     cur = con.cursor()
     rows = cur.execute("SELECT filename, content FROM chunks WHERE session_id=? ORDER BY id ASC", (session_id,)).fetchall()
     con.close()
 
     for filename, content in rows:
-        fname = (filename or "").lower()
-        program = filename
-
         # Only scan relevant files
-        if not any(x in fname for x in [".cbl",".cob",".cpy",".jcl",".cics","db2:"]):
-            continue
-
-        # VSAM/COBOL file ops
-        for m in RE_FILE_ASSIGN.finditer(content):
-            _add_op(lineage_files, m.group(1), "ASSIGN", program, 0)
-        for m in RE_FD.finditer(content):
-            _add_op(lineage_files, m.group(1), "FD", program, 0)
-        for m in RE_READ.finditer(content):
-            _add_op(lineage_files, m.group(1), "READ", program, 0)
-        for m in RE_WRITE.finditer(content):
-            _add_op(lineage_files, m.group(1), "WRITE", program, 0)
-        for m in RE_REWRITE.finditer(content):
-            _add_op(lineage_files, m.group(1), "REWRITE", program, 0)
-        for m in RE_DELETE.finditer(content):
-            _add_op(lineage_files, m.group(1), "DELETE", program, 0)
-
-        # DB2/SQL
-        for block in RE_EXEC_SQL.findall(content):
-            verb = None
-            vm = RE_SQL_VERB.search(block)
-            if vm:
-                verb = vm.group(1).upper()
-            for tm in RE_SQL_TABLE.finditer(block):
-                tbl = tm.group(1) or tm.group(2)
-                if not tbl:
-                    continue
-                subj = tbl.replace('\n',' ').strip()
-                if verb:
-                    _add_op(lineage_tables, subj, verb, program, 0)
-
-        # COPY usage
-        for m in RE_COPY.finditer(content):
-            logical, physical = _norm_copy_name(m.group(1).upper())
-            _add_op(lineage_files, f"COPYBOOK:{logical}", "COPY", program, 0)
-            _add_op(lineage_files, f"COPYBOOK:{physical}", "COPY", program, 0)
-
-        # CICS
-        for m in RE_CICS.finditer(content):
-            obj = m.group(3).strip(" '\"")
-            _add_op(lineage_files, obj, f"CICS_{m.group(1).upper()}", program, 0)
-
-        # MQ
-        for m in RE_MQ_CALL.finditer(content):
-            _add_op(lineage_files, "MQ", f"MQ{m.group(1).upper()}", program, 0)
-
-        # XML
-        for m in RE_XML_GEN.finditer(content):
-            _add_op(lineage_files, m.group(1), "XML_GENERATE", program, 0)
-        for m in RE_XML_PARSE.finditer(content):
-            _add_op(lineage_files, m.group(1), "XML_PARSE", program, 0)
-
-        # Logical ↔ DDNAME mapping
-        for m in RE_SELECT_ASSIGN.finditer(content):
-            logical = m.group(1)
-            ddname = m.group(2).strip("'\" ")
-            _add_op(lineage_files, f"LOGICAL:{logical}", f"ASSIGN:{ddname}", program, 0)
-
-        # JCL: DSN capture
-        for jm in RE_JCL_DD.finditer(content):
-            dsn = jm.group('dsn')
-            _add_op(lineage_files, f"DSN:{dsn}", "JCL_DD", program, 0)
-
-    # finalize sets
-    def finalize(d: Dict[str, Any]):
-        out = {}
-        for k, v in d.items():
-            out[k] = {"ops": v["ops"], "programs": sorted(list(v["programs"]))}
-        return out
-
-    return {"files": finalize(lineage_files), "tables": finalize(lineage_tables)}
+        if any(x in (filename or "").lower() for x in RELEVANT):
+            _scan(content, filename, lineage_files, lineage_tables)
+
+    return {"files": _finalize(lineage_files), "tables": _finalize(lineage_tables)}
+
+
+def analyze_file(filename: str, contents: List[str]) -> Dict[str, Any]:
+    """Partial result of one file (all its chunks); the program of every op is the file itself."""
+    files: Dict[str, Any] = {}
+    tables: Dict[str, Any] = {}
+    if any(x in (filename or "").lower() for x in RELEVANT):
+        for content in contents:
+            _scan(content, filename, files, tables)
+    return {"files": {k: v["ops"] for k, v in files.items()}, "tables": {k: v["ops"] for k, v in tables.items()}}
+
+
+def merge_partials(partials: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, Any]:
+    """[(filename, partial)] in scan order -> the analyze_session result shape."""
+    out: Dict[str, Any] = {"files": {}, "tables": {}}
+    for filename, part in partials:
+        for kind in ("files", "tables"):
+            dest = out[kind]
+            for subject, ops in part[kind].items():
+                entry = dest.get(subject)
+                if entry is None:
+                    entry = dest[subject] = {"ops": {}, "programs": set()}
+                for op, n in ops.items():
+                    entry["ops"][op] = entry["ops"].get(op, 0) + n
+                entry["programs"].add(filename)
+    return {"files": _finalize(out["files"]), "tables": _finalize(out["tables"])}
+
+
+def _scan_files(db_path: str, session_id: str, filenames: List[str]) -> List[Dict[str, Any]]:
+    """Pool worker: analyze_file of each file, read straight from SQLite."""
+    con = sqlite3.connect(db_path)
+    try:
+        return [analyze_file(filename, [r[0] for r in con.execute(
+            "SELECT content FROM chunks WHERE session_id = ? AND filename = ? ORDER BY id ASC",
+            (session_id, filename)
+        )]) for filename in filenames]
+    finally:
+        con.close()
+
+
+class LineageCache:
+    """Materialized analyze_session results per session.
+
+    Per-file partials are stored in `lineage_partials` with a fingerprint of the file's chunk
+    ids (chunks are never edited in place, so new/re-ingested/deleted chunks change it).
+    A read compares the session's chunk_version with the cached one: unchanged sessions are
+    a dict lookup, otherwise only files whose fingerprint changed are re-read and rescanned
+    and the partials are merged again. Returned dicts are shared; callers must not mutate."""
+    def __init__(self, db: DB):
+        self.db = db
+        self._lock = threading.Lock()
+        self._merged: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        self._session_locks: Dict[str, threading.Lock] = {}
+        self.stats = {"hits": 0, "refreshes": 0, "files_scanned": 0}
+        with sqlite3.connect(db.db_path) as con:
+            con.execute("""
+            CREATE TABLE IF NOT EXISTS lineage_partials(
+                session_id TEXT,
+                filename TEXT,
+                fingerprint TEXT,
+                first_chunk INTEGER,
+                partial TEXT,
+                PRIMARY KEY(session_id, filename)
+            );
+            """)
+            con.commit()
+
+    def _session_lock(self, session_id: str) -> threading.Lock:
+        with self._lock:
+            return self._session_locks.setdefault(session_id, threading.Lock())
+
+    def _count(self, key: str, n: int = 1):
+        with self._lock:
+            self.stats[key] += n
+
+    def get(self, session_id: str) -> Dict[str, Any]:
+        version = self.db.chunk_version(session_id)
+        cached = self._merged.get(session_id)
+        if cached and cached[0] == version:
+            self._count("hits")
+            return cached[1]
+        with self._session_lock(session_id):
+            cached = self._merged.get(session_id)
+            if cached and cached[0] == version:
+                self._count("hits")
+                return cached[1]
+            result = self._refresh(session_id)
+            self._merged[session_id] = (version, result)
+            return result
+
+    def _refresh(self, session_id: str) -> Dict[str, Any]:
+        self._count("refreshes")
+        with sqlite3.connect(self.db.db_path) as con:
+            current = {r[0]: (f"{r[1]}:{r[2]}:{r[3]}", r[4], r[1]) for r in con.execute(
+                """SELECT filename, COUNT(*), MAX(id), SUM(id), MIN(id) FROM chunks
+                WHERE session_id = ? GROUP BY filename""", (session_id,)
+            ).fetchall()}
+            stored = {r[0]: (r[1], r[2], r[3]) for r in con.execute(
+                "SELECT filename, fingerprint, first_chunk, partial FROM lineage_partials WHERE session_id = ?",
+                (session_id,)
+            ).fetchall()}
+        partials: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        changed: List[str] = []
+        for filename, (fp, first, _) in current.items():
+            old = stored.get(filename)
+            if old and old[0] == fp:
+                partials[filename] = (first, json.loads(old[2]))
+            else:
+                changed.append(filename)
+        for filename, part in zip(changed, self._scan_changed(session_id, changed, current)):
+            partials[filename] = (current[filename][1], part)
+        self._count("files_scanned", len(changed))
+        with sqlite3.connect(self.db.db_path) as con:
+            con.executemany(
+                "INSERT OR REPLACE INTO lineage_partials(session_id, filename, fingerprint, first_chunk, partial) VALUES (?, ?, ?, ?, ?)",
+                [(session_id, f, current[f][0], current[f][1], json.dumps(partials[f][1])) for f in changed]
+            )
+            gone = [f for f in stored if f not in current]
+            con.executemany("DELETE FROM lineage_partials WHERE session_id = ? AND filename = ?",
+                            [(session_id, f) for f in gone])
+            con.commit()
+        ordered = sorted(partials.items(), key=lambda kv: kv[1][0])
+        return merge_partials([(f, p) for f, (_, p) in ordered])
+
+    def _scan_changed(self, session_id: str, changed: List[str], current: Dict[str, Tuple[str, int, int]]) -> List[Dict[str, Any]]:
+        # many changed chunks (first load, bulk re-ingest) are spread over the analysis pool
+        # in groups of ~ANALYSIS_BATCH_CHUNKS chunks
+        workers = analysis_pool.ANALYSIS_WORKERS
+        chunks = sum(current[f][2] for f in changed)
+        if workers <= 1 or chunks < analysis_pool.ANALYSIS_PARALLEL_MIN_CHUNKS:
+            return _scan_files(self.db.db_path, session_id, changed)
+        groups, cur, size = [], [], 0
+        for f in changed:
+            cur.append(f)
+            size += current[f][2]
+            if size >= analysis_pool.ANALYSIS_BATCH_CHUNKS:
+                groups.append(cur)
+                cur, size = [], 0
+        if cur:
+            groups.append(cur)
+        jobs = [(self.db.db_path, session_id, g) for g in groups]
+        return [part for parts in analysis_pool.map_ordered(_scan_files, jobs, workers) for part in parts]
@@ -1,20 +1,153 @@
 
-import os, requests, json
-from typing import List, Dict, Any, Optional
+import os, requests, json, time, random, threading, collections, asyncio, contextvars
+from typing import List, Dict, Any, Optional, Tuple, Iterator, AsyncIterator
+from requests.adapters import HTTPAdapter
+from llm_scheduler import LLMScheduler, llm_scheduler, INTERACTIVE
 from dotenv import load_dotenv
 load_dotenv()
 
 LLM_BASE_URL = os.getenv("LLM_BASE_URL", "http://localhost:8001/v1")
 LLM_API_KEY = os.getenv("LLM_API_KEY", "changeme")
 LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+# Connection pool / timeouts / retries (seconds)
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF = float(os.getenv("LLM_BACKOFF", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class LLMStats:
+    """Process-wide call counters, token usage (from the response `usage` field) and latencies."""
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=window)
+        self._ttft = collections.deque(maxlen=window)
+        self.calls = self.errors = self.retries = 0
+        self.prompt_tokens = self.completion_tokens = 0
+
+    def record(self, latency_s: float, usage: Dict[str, Any] | None, retries: int, ok: bool = True,
+               ttft_s: float | None = None):
+        with self._lock:
+            self.calls += 1
+            self.retries += retries
+            if not ok:
+                self.errors += 1
+                return
+            self._latencies.append(latency_s)
+            if ttft_s is not None:
+                self._ttft.append(ttft_s)
+            if usage:
+                self.prompt_tokens += int(usage.get("prompt_tokens") or 0)
+                self.completion_tokens += int(usage.get("completion_tokens") or 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            lat = sorted(self._latencies)
+            ttft = sorted(self._ttft)
+            out = {"calls": self.calls, "errors": self.errors, "retries": self.retries,
+                   "prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens}
+        pick = lambda xs, p: round(xs[min(len(xs) - 1, int(p * len(xs)))] * 1000, 1)
+        if lat:
+            out.update(latency_ms_p50=pick(lat, 0.50), latency_ms_p95=pick(lat, 0.95), latency_ms_max=round(lat[-1] * 1000, 1))
+        if ttft:
+            out.update(ttft_ms_p50=pick(ttft, 0.50), ttft_ms_p95=pick(ttft, 0.95))
+        return out
+
+
+llm_stats = LLMStats()
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+
+def _shared_session() -> requests.Session:
+    # one keep-alive pool for every LLMClient, so turns reuse TCP/TLS connections
+    global _session
+    with _session_lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=LLM_MAX_CONNECTIONS, max_retries=0)
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+            _session = s
+    return _session
+
+
+def _backoff(attempt: int, retry_after: Optional[str] = None) -> float:
+    # full jitter; a numeric Retry-After from the server wins
+    if retry_after:
+        try:
+            return min(float(retry_after), LLM_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF * (2 ** attempt)))
+
+
+def _sse_delta(line: str) -> Tuple[Optional[str], Optional[Dict[str, Any]], bool]:
+    """(text delta, usage, done) of one `data: {...}` line of an OpenAI-style stream."""
+    if not line or not line.startswith("data:"):
+        return None, None, False
+    data = line[5:].strip()
+    if data == "[DONE]":
+        return None, None, True
+    try:
+        js = json.loads(data)
+    except ValueError:
+        return None, None, False
+    choices = js.get("choices") or []
+    text = (choices[0].get("delta") or {}).get("content") if choices else None
+    return text, js.get("usage"), False
+
+
+def _content(data: Dict[str, Any]) -> str:
+    try:
+        return data["choices"][0]["message"]["content"]
+    except Exception:
+        return str(data)
+
+
+# (client id, latency_s, usage) of the latest call made in the current thread / asyncio task: one client
+# is shared by concurrent requests, so per-instance attributes would mix up their usage
+_last_call: contextvars.ContextVar[Tuple[int, float | None, Dict[str, Any]]] = \
+    contextvars.ContextVar("llm_last_call", default=(0, None, {}))
+
 
 class LLMClient:
-    def __init__(self, base_url: str = LLM_BASE_URL, api_key: str = LLM_API_KEY, model: str = LLM_MODEL):
+    """OpenAI-compatible chat client on a shared pooled session. Connect and read
+    timeouts are separate; 429/5xx and connection errors are retried with jittered
+    exponential backoff (LLM_MAX_RETRIES). Every call first takes a slot from the
+    scheduler in its priority class (may raise LLMBusy), is recorded in llm_stats, and
+    last_usage / last_latency_s report the caller's own latest call (per thread / task)."""
+    def __init__(self, base_url: str = LLM_BASE_URL, api_key: str = LLM_API_KEY, model: str = LLM_MODEL,
+                 priority: int = INTERACTIVE, scheduler: LLMScheduler = llm_scheduler):
         self.base_url = base_url.rstrip("/")
         self.api_key = api_key
         self.model = model
+        self.priority = priority
+        self.scheduler = scheduler
+        self.timeout = (LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT)
+        self.max_retries = LLM_MAX_RETRIES
+
+    @property
+    def last_usage(self) -> Dict[str, Any]:
+        cid, _, usage = _last_call.get()
+        return usage if cid == id(self) else {}
 
-    def chat(self, messages: List[Dict[str, str]], temperature: float = 0.2, max_tokens: int = 800) -> str:
+    @property
+    def last_latency_s(self) -> float | None:
+        cid, latency, _ = _last_call.get()
+        return latency if cid == id(self) else None
+
+    def _finish(self, t0: float, usage: Optional[Dict[str, Any]], attempt: int, ok: bool = True,
+                ttft_s: float | None = None):
+        latency = time.perf_counter() - t0
+        _last_call.set((id(self), latency, usage or {}))
+        llm_stats.record(latency, usage or {}, attempt, ok=ok, ttft_s=ttft_s)
+
+    def _request(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int, stream: bool = False):
         url = f"{self.base_url}/chat/completions"
         headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
         payload = {
@@ -23,10 +156,175 @@ class LLMClient:
             "temperature": temperature,
             "max_tokens": max_tokens,
         }
-        r = requests.post(url, headers=headers, json=payload, timeout=120)
-        r.raise_for_status()
-        data = r.json()
+        if stream:
+            payload.update(stream=True, stream_options={"include_usage": True})
+        return url, headers, payload
+
+    def _post(self, url: str, headers: Dict[str, str], payload: Dict[str, Any], t0: float,
+              stream: bool = False) -> Tuple[requests.Response, int]:
+        # retries happen before any output is consumed, so a stream is never replayed mid-answer
+        attempt = 0
+        while True:
+            try:
+                r = _shared_session().post(url, headers=headers, json=payload, timeout=self.timeout, stream=stream)
+                if r.status_code in RETRY_STATUS and attempt < self.max_retries:
+                    r.close()
+                    time.sleep(_backoff(attempt, r.headers.get("Retry-After")))
+                    attempt += 1
+                    continue
+                r.raise_for_status()
+                return r, attempt
+            except (requests.ConnectionError, requests.exceptions.ConnectTimeout):
+                if attempt >= self.max_retries:
+                    llm_stats.record(time.perf_counter() - t0, None, attempt, ok=False)
+                    raise
+                time.sleep(_backoff(attempt))
+                attempt += 1
+            except Exception:
+                llm_stats.record(time.perf_counter() - t0, None, attempt, ok=False)
+                raise
+
+    def chat(self, messages: List[Dict[str, str]], temperature: float = 0.2, max_tokens: int = 800,
+             stream: bool = False, session_id: str | None = None) -> str | Iterator[str]:
+        """Completion text, or with stream=True an iterator of text deltas as they arrive.
+        session_id is only used for fair queuing in the scheduler."""
+        url, headers, payload = self._request(messages, temperature, max_tokens, stream)
+        if stream:
+            return self._stream(url, headers, payload, session_id)
+        with self.scheduler.slot(self.priority, session_id):
+            t0 = time.perf_counter()  # queue wait is reported by the scheduler, not here
+            r, attempt = self._post(url, headers, payload, t0)
+            data = r.json()
+        self._finish(t0, data.get("usage") if isinstance(data, dict) else None, attempt)
+        return _content(data)
+
+    def _stream(self, url: str, headers: Dict[str, str], payload: Dict[str, Any], session_id: str | None) -> Iterator[str]:
+        # the slot is taken on first iteration and held until the stream is drained or closed
+        self.scheduler.acquire(self.priority, session_id)
         try:
-            return data["choices"][0]["message"]["content"]
+            t0 = time.perf_counter()
+            r, attempt = self._post(url, headers, payload, t0, stream=True)
         except Exception:
-            return str(data)
+            self.scheduler.release(self.priority)
+            raise
+        usage, ttft, ok = None, None, False
+        try:
+            for line in r.iter_lines(chunk_size=None, decode_unicode=True):
+                text, u, done = _sse_delta(line)
+                usage = u or usage
+                if done:
+                    break
+                if text:
+                    if ttft is None:
+                        ttft = time.perf_counter() - t0
+                    yield text
+            ok = True
+        finally:
+            r.close()
+            self.scheduler.release(self.priority)
+            self._finish(t0, usage, attempt, ok=ok, ttft_s=ttft)
+
+
+class AsyncLLMClient(LLMClient):
+    """Same interface as LLMClient for asyncio callers (`await client.chat(...)`; with
+    stream=True it returns an async iterator of deltas), on an httpx.AsyncClient with the
+    same pool limits, timeouts, retries and stats."""
+    def __init__(self, base_url: str = LLM_BASE_URL, api_key: str = LLM_API_KEY, model: str = LLM_MODEL,
+                 priority: int = INTERACTIVE, scheduler: LLMScheduler = llm_scheduler):
+        super().__init__(base_url, api_key, model, priority, scheduler)
+        self._client = None
+
+    def _http(self):
+        if self._client is None:
+            import httpx  # only needed by async callers
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+            )
+        return self._client
+
+    async def _post(self, url: str, headers: Dict[str, str], payload: Dict[str, Any], t0: float,
+                    stream: bool = False):
+        import httpx
+        client = self._http()
+        attempt = 0
+        while True:
+            try:
+                r = await client.send(client.build_request("POST", url, headers=headers, json=payload), stream=stream)
+                if r.status_code in RETRY_STATUS and attempt < self.max_retries:
+                    await r.aclose()
+                    await asyncio.sleep(_backoff(attempt, r.headers.get("Retry-After")))
+                    attempt += 1
+                    continue
+                if r.is_error:
+                    await r.aread()
+                r.raise_for_status()
+                return r, attempt
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                if attempt >= self.max_retries:
+                    llm_stats.record(time.perf_counter() - t0, None, attempt, ok=False)
+                    raise
+                await asyncio.sleep(_backoff(attempt))
+                attempt += 1
+            except Exception:
+                llm_stats.record(time.perf_counter() - t0, None, attempt, ok=False)
+                raise
+
+    async def _acquire(self, session_id: str | None):
+        # the scheduler blocks on a threading.Event, so wait for the slot off the event loop.
+        # Cancelling the caller cannot stop that thread: a slot it is granted later is handed back.
+        fut = asyncio.ensure_future(asyncio.to_thread(self.scheduler.acquire, self.priority, session_id))
+        try:
+            await asyncio.shield(fut)
+        except asyncio.CancelledError:
+            fut.add_done_callback(self._release_granted)
+            raise
+
+    def _release_granted(self, fut: "asyncio.Future"):
+        if not fut.cancelled() and fut.exception() is None:
+            self.scheduler.release(self.priority)
+
+    async def chat(self, messages: List[Dict[str, str]], temperature: float = 0.2, max_tokens: int = 800,
+                   stream: bool = False, session_id: str | None = None) -> str | AsyncIterator[str]:
+        url, headers, payload = self._request(messages, temperature, max_tokens, stream)
+        if stream:
+            return self._stream(url, headers, payload, session_id)
+        await self._acquire(session_id)
+        try:
+            t0 = time.perf_counter()
+            r, attempt = await self._post(url, headers, payload, t0)
+            data = r.json()
+        finally:
+            self.scheduler.release(self.priority)
+        self._finish(t0, data.get("usage") if isinstance(data, dict) else None, attempt)
+        return _content(data)
+
+    async def _stream(self, url: str, headers: Dict[str, str], payload: Dict[str, Any], session_id: str | None) -> AsyncIterator[str]:
+        await self._acquire(session_id)
+        try:
+            t0 = time.perf_counter()
+            r, attempt = await self._post(url, headers, payload, t0, stream=True)
+        except BaseException:
+            self.scheduler.release(self.priority)
+            raise
+        usage, ttft, ok = None, None, False
+        try:
+            async for line in r.aiter_lines():
+                text, u, done = _sse_delta(line)
+                usage = u or usage
+                if done:
+                    break
+                if text:
+                    if ttft is None:
+                        ttft = time.perf_counter() - t0
+                    yield text
+            ok = True
+        finally:
+            await r.aclose()
+            self.scheduler.release(self.priority)
+            self._finish(t0, usage, attempt, ok=ok, ttft_s=ttft)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,155 @@
+# llm_scheduler.py
+import os, time, math, threading, collections
+from contextlib import contextmanager
+from typing import Dict, Any, Deque
+from dotenv import load_dotenv
+load_dotenv()
+
+# Admission control for the shared LLM endpoint (0 = no limit for the caps below)
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "8"))
+LLM_BATCH_MAX_INFLIGHT = int(os.getenv("LLM_BATCH_MAX_INFLIGHT", "4"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+
+# priority classes, lower is served first
+INTERACTIVE = 0
+BATCH = 1
+CLASS_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+
+class LLMBusy(Exception):
+    """The scheduler queue is full (or the wait timed out); callers map this to HTTP 429."""
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("event", "granted", "enqueued")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+        self.enqueued = time.perf_counter()
+
+
+class LLMScheduler:
+    """Process-wide gate in front of every LLMClient call.
+
+    At most max_inflight requests run at once; batch work (code summaries) is further capped
+    at batch_max_inflight so interactive turns always find a free slot quickly. Waiting
+    requests are served interactive first, and within a class round-robin across sessions,
+    so one session's burst cannot starve the others. A class whose queue already holds
+    max_queue waiters rejects new requests immediately with LLMBusy."""
+    def __init__(self, max_inflight: int = LLM_MAX_INFLIGHT, batch_max_inflight: int = LLM_BATCH_MAX_INFLIGHT,
+                 max_queue: int = LLM_MAX_QUEUE, queue_timeout: float = LLM_QUEUE_TIMEOUT, window: int = 1000):
+        self.max_inflight = max_inflight
+        self.batch_max_inflight = batch_max_inflight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout if queue_timeout > 0 else None
+        self._lock = threading.Lock()
+        self._inflight = {INTERACTIVE: 0, BATCH: 0}
+        # per class: session -> FIFO of waiters; dict order is the round-robin order
+        self._queues: Dict[int, "collections.OrderedDict[str, Deque[_Waiter]]"] = {
+            INTERACTIVE: collections.OrderedDict(), BATCH: collections.OrderedDict()}
+        self._depth = {INTERACTIVE: 0, BATCH: 0}
+        self._waits = {INTERACTIVE: collections.deque(maxlen=window), BATCH: collections.deque(maxlen=window)}
+        self._counts = {p: {"admitted": 0, "rejected": 0, "timeouts": 0} for p in CLASS_NAMES}
+        self._max_depth = {INTERACTIVE: 0, BATCH: 0}
+
+    def _has_capacity(self, priority: int) -> bool:
+        if self.max_inflight and sum(self._inflight.values()) >= self.max_inflight:
+            return False
+        if priority == BATCH and self.batch_max_inflight and self._inflight[BATCH] >= self.batch_max_inflight:
+            return False
+        return True
+
+    def _retry_after(self) -> float:
+        # rough hint: one average wait, at least a second
+        waits = [w for q in self._waits.values() for w in q]
+        return max(1.0, math.ceil(sum(waits) / len(waits))) if waits else 1.0
+
+    def admit(self, priority: int = INTERACTIVE):
+        """Fail fast before doing any work for a request whose LLM calls would be rejected."""
+        with self._lock:
+            if self.max_queue and self._depth[priority] >= self.max_queue:
+                self._counts[priority]["rejected"] += 1
+                raise LLMBusy(f"LLM queue full ({CLASS_NAMES[priority]})", self._retry_after())
+
+    def acquire(self, priority: int = INTERACTIVE, session_id: str | None = None):
+        key = session_id or ""
+        with self._lock:
+            # queued work of this class (or any interactive work) goes first
+            if self._has_capacity(priority) and not self._depth[INTERACTIVE] and not self._depth[priority]:
+                self._grant(priority, 0.0)
+                return
+            if self.max_queue and self._depth[priority] >= self.max_queue:
+                self._counts[priority]["rejected"] += 1
+                raise LLMBusy(f"LLM queue full ({CLASS_NAMES[priority]})", self._retry_after())
+            waiter = _Waiter()
+            self._queues[priority].setdefault(key, collections.deque()).append(waiter)
+            self._depth[priority] += 1
+            self._max_depth[priority] = max(self._max_depth[priority], self._depth[priority])
+        if waiter.event.wait(self.queue_timeout):
+            return
+        with self._lock:
+            if waiter.granted:  # granted while timing out
+                return
+            q = self._queues[priority].get(key)
+            q.remove(waiter)
+            if not q:
+                del self._queues[priority][key]
+            self._depth[priority] -= 1
+            self._counts[priority]["timeouts"] += 1
+        raise LLMBusy(f"LLM queue wait exceeded {self.queue_timeout:g}s ({CLASS_NAMES[priority]})", self._retry_after())
+
+    def release(self, priority: int = INTERACTIVE):
+        with self._lock:
+            self._inflight[priority] -= 1
+            self._dispatch()
+
+    def _grant(self, priority: int, wait_s: float):
+        self._inflight[priority] += 1
+        self._counts[priority]["admitted"] += 1
+        self._waits[priority].append(wait_s)
+
+    def _dispatch(self):
+        # called with the lock held: hand freed slots to waiters, interactive first
+        for priority in (INTERACTIVE, BATCH):
+            queues = self._queues[priority]
+            while queues and self._has_capacity(priority):
+                key, q = next(iter(queues.items()))
+                waiter = q.popleft()
+                del queues[key]
+                if q:
+                    queues[key] = q  # session goes to the back of the round-robin
+                self._depth[priority] -= 1
+                waiter.granted = True
+                self._grant(priority, time.perf_counter() - waiter.enqueued)
+                waiter.event.set()
+
+    @contextmanager
+    def slot(self, priority: int = INTERACTIVE, session_id: str | None = None):
+        self.acquire(priority, session_id)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def snapshot(self) -> Dict[str, Any]:
+        pick = lambda xs, p: round(xs[min(len(xs) - 1, int(p * len(xs)))] * 1000, 1)
+        with self._lock:
+            out: Dict[str, Any] = {"max_inflight": self.max_inflight, "batch_max_inflight": self.batch_max_inflight,
+                                   "max_queue": self.max_queue}
+            for p, name in CLASS_NAMES.items():
+                waits = sorted(self._waits[p])
+                cls = {"inflight": self._inflight[p], "queued": self._depth[p], "max_queued": self._max_depth[p],
+                       "sessions_waiting": len(self._queues[p]), **self._counts[p]}
+                if waits:
+                    cls.update(wait_ms_p50=pick(waits, 0.50), wait_ms_p95=pick(waits, 0.95),
+                               wait_ms_max=round(waits[-1] * 1000, 1))
+                out[name] = cls
+        return out
+
+
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,223 @@
+# load_test.py — end-to-end load test of the API (pair with mock_llm.py to keep the shared vLLM free).
+# Usage:
+#   python mock_llm.py --port 8001 &
+#   LLM_BASE_URL=http://localhost:8001/v1 uvicorn app:app --port 5173 &
+#   python load_test.py --base http://localhost:5173/api --concurrency 8 --duration 60 \
+#       [--mix chat=60,chat_stream=10,upload=10,lineage=10,crud=5,fields=5] [--json report.json]
+# Seeds a fresh session with generated COBOL members and copybooks, then drives the endpoints in --mix proportions
+# from --concurrency workers and reports throughput, p50/p95/p99 latency and error rates per endpoint.
+import argparse, json, random, threading, time, collections
+from typing import Callable, Dict, List, Any, Tuple
+import requests
+
+QUESTIONS = [
+    "What does PGM{n:02d} write to OUT-REC?",
+    "Which files does PGM{n:02d} read?",
+    "What is CUST-REC-{n}?",
+    "Compare PGM{n:02d} and PGM{m:02d} and trace where ACCT-BAL is updated",
+    "Walk me through the error handling in PGM{n:02d}",
+]
+
+
+def cobol_member(n: int, lines: int = 80) -> str:
+    out = [f"       IDENTIFICATION DIVISION.", f"       PROGRAM-ID. PGM{n:02d}.",
+           "       ENVIRONMENT DIVISION.", "       INPUT-OUTPUT SECTION.", "       FILE-CONTROL.",
+           f"           SELECT IN-FILE ASSIGN TO INFILE{n:02d}.", f"           SELECT OUT-FILE ASSIGN TO OUTFL{n:02d}.",
+           "       DATA DIVISION.", "       FILE SECTION.", "       FD IN-FILE.", f"       01 CUST-REC-{n}.",
+           "          05 ACCT-NO PIC X(10).", "          05 ACCT-BAL PIC S9(9)V99 COMP-3.",
+           "       FD OUT-FILE.", f"       01 OUT-REC PIC X(80).", "       PROCEDURE DIVISION.",
+           "       MAIN-PARA.", "           OPEN INPUT IN-FILE OUTPUT OUT-FILE.",
+           f"           COPY CPY{n % 5:02d}.",
+           f"           EXEC SQL SELECT BAL INTO :ACCT-BAL FROM ACCT{n % 3} WHERE NO = :ACCT-NO END-EXEC."]
+    for i in range(lines):
+        out.append(f"           MOVE ACCT-BAL TO OUT-REC-{i}.")
+    out += ["           WRITE OUT-REC.", "           CLOSE IN-FILE OUT-FILE.", "           GOBACK."]
+    return "\n".join(out)
+
+
+def copybook_member(n: int) -> str:
+    return "\n".join([f"       01 CPY{n:02d}-REC.", "          05 ACCT-NO PIC X(10).", "          05 ACCT-BAL PIC S9(9)V99 COMP-3.",
+                      f"          05 CUST-NAME-{n} PIC X(30).", "          05 OPEN-DATE PIC 9(8)."])
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.lat: Dict[str, List[float]] = collections.defaultdict(list)
+        self.ttft: Dict[str, List[float]] = collections.defaultdict(list)
+        self.errors: Dict[str, collections.Counter] = collections.defaultdict(collections.Counter)
+
+    def add(self, name: str, seconds: float, error: str | None = None, ttft: float | None = None):
+        with self._lock:
+            if error:
+                self.errors[name][error] += 1
+            else:
+                self.lat[name].append(seconds)
+                if ttft is not None:
+                    self.ttft[name].append(ttft)
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        def pct(xs: List[float], p: float) -> float:
+            return round(xs[min(len(xs) - 1, int(p * len(xs)))] * 1000, 1) if xs else 0.0
+        out: Dict[str, Any] = {"elapsed_s": round(elapsed, 2), "endpoints": {}}
+        total_ok = total_err = 0
+        for name in sorted(set(self.lat) | set(self.errors)):
+            lat = sorted(self.lat[name])
+            errs = sum(self.errors[name].values())
+            n = len(lat) + errs
+            total_ok, total_err = total_ok + len(lat), total_err + errs
+            row = {"requests": n, "ok": len(lat), "rps": round(n / elapsed, 2),
+                   "error_rate": round(errs / n, 4) if n else 0.0, "errors": dict(self.errors[name]),
+                   "p50_ms": pct(lat, 0.50), "p95_ms": pct(lat, 0.95), "p99_ms": pct(lat, 0.99),
+                   "max_ms": round(lat[-1] * 1000, 1) if lat else 0.0}
+            if self.ttft[name]:
+                ttft = sorted(self.ttft[name])
+                row.update(ttft_p50_ms=pct(ttft, 0.50), ttft_p95_ms=pct(ttft, 0.95))
+            out["endpoints"][name] = row
+        n = total_ok + total_err
+        out["total"] = {"requests": n, "rps": round(n / elapsed, 2), "error_rate": round(total_err / n, 4) if n else 0.0}
+        return out
+
+
+class LoadTest:
+    """Endpoint scenarios; each returns (ttft seconds or None) and raises on an error response."""
+    def __init__(self, base: str, session_id: str, members: int, timeout: float):
+        self.base = base.rstrip("/")
+        self.sid = session_id
+        self.members = members
+        self.timeout = timeout
+        self.uploads = 0
+        self._lock = threading.Lock()
+
+    def _question(self) -> str:
+        return random.choice(QUESTIONS).format(n=random.randrange(self.members), m=random.randrange(self.members))
+
+    @staticmethod
+    def _check(r: requests.Response):
+        if r.status_code >= 400:
+            raise RuntimeError(f"HTTP {r.status_code}")
+
+    def chat(self, s: requests.Session):
+        self._check(s.post(f"{self.base}/chat", json={"session_id": self.sid, "message": self._question()}, timeout=self.timeout))
+
+    def chat_stream(self, s: requests.Session):
+        t0, ttft = time.perf_counter(), None
+        with s.post(f"{self.base}/chat/stream", json={"session_id": self.sid, "message": self._question()},
+                    timeout=self.timeout, stream=True) as r:
+            self._check(r)
+            event = None
+            for line in r.iter_lines(chunk_size=None, decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                    if event == "token" and ttft is None:
+                        ttft = time.perf_counter() - t0
+                    elif event == "error":
+                        raise RuntimeError("SSE error")
+        return ttft
+
+    def upload(self, s: requests.Session):
+        with self._lock:
+            self.uploads += 1
+            n = self.members + self.uploads
+        files = [("files", (f"PGM{n:02d}.cbl", cobol_member(n).encode("utf-8"), "text/plain"))]
+        self._check(s.post(f"{self.base}/upload", data={"session_id": self.sid}, files=files, timeout=self.timeout))
+
+    def lineage(self, s: requests.Session):
+        self._check(s.get(f"{self.base}/analysis/lineage/{self.sid}", timeout=self.timeout))
+
+    def crud(self, s: requests.Session):
+        self._check(s.get(f"{self.base}/analysis/crud-map/{self.sid}", timeout=self.timeout))
+
+    def fields(self, s: requests.Session):
+        self._check(s.get(f"{self.base}/analysis/fields/{self.sid}", params={"copybook": f"CPY{random.randrange(5):02d}"},
+                          timeout=self.timeout))
+
+    def graph(self, s: requests.Session):
+        self._check(s.get(f"{self.base}/analysis/graph/crud/{self.sid}", timeout=self.timeout))
+
+
+def parse_mix(spec: str) -> List[Tuple[str, float]]:
+    mix = []
+    for part in spec.split(","):
+        name, _, w = part.partition("=")
+        mix.append((name.strip(), float(w or 1)))
+    return mix
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--base", default="http://localhost:5173/api")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--duration", type=float, default=30, help="seconds of load (after seeding)")
+    ap.add_argument("--requests", type=int, default=0, help="stop after this many requests instead")
+    ap.add_argument("--mix", default="chat=60,chat_stream=10,upload=10,lineage=10,crud=5,fields=5")
+    ap.add_argument("--members", type=int, default=20, help="COBOL members seeded into the session")
+    ap.add_argument("--session", help="reuse an existing session instead of seeding a new one")
+    ap.add_argument("--timeout", type=float, default=120)
+    ap.add_argument("--json", help="also write the report to this file")
+    args = ap.parse_args()
+
+    base = args.base.rstrip("/")
+    sid = args.session
+    if not sid:
+        sid = requests.post(f"{base}/session/create", json={"session_name": f"loadtest-{int(time.time())}"}, timeout=30).json()["session_id"]
+        files = [("files", (f"PGM{n:02d}.cbl", cobol_member(n).encode("utf-8"), "text/plain")) for n in range(args.members)]
+        files += [("files", (f"CPY{n:02d}.cpy", copybook_member(n).encode("utf-8"), "text/plain")) for n in range(5)]
+        requests.post(f"{base}/upload", data={"session_id": sid}, files=files, timeout=300).raise_for_status()
+    test = LoadTest(base, sid, args.members, args.timeout)
+    mix = parse_mix(args.mix)
+    for name, _ in mix:
+        if not callable(getattr(test, name, None)) or name.startswith("_"):
+            raise SystemExit(f"unknown scenario: {name}")
+    names, weights = [n for n, _ in mix], [w for _, w in mix]
+
+    rec = Recorder()
+    stop_at = time.perf_counter() + args.duration
+    issued = 0
+    issued_lock = threading.Lock()
+
+    def worker():
+        nonlocal issued
+        s = requests.Session()
+        while time.perf_counter() < stop_at or args.requests:
+            with issued_lock:
+                if args.requests and issued >= args.requests:
+                    return
+                issued += 1
+            name = random.choices(names, weights)[0]
+            fn: Callable = getattr(test, name)
+            t0 = time.perf_counter()
+            try:
+                ttft = fn(s)
+                rec.add(name, time.perf_counter() - t0, ttft=ttft)
+            except requests.RequestException as e:
+                rec.add(name, time.perf_counter() - t0, error=type(e).__name__)
+            except RuntimeError as e:
+                rec.add(name, time.perf_counter() - t0, error=str(e))
+
+    print(f"session={sid} concurrency={args.concurrency} mix={args.mix}")
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    report = rec.report(time.perf_counter() - t0)
+    try:
+        report["server_metrics"] = requests.get(f"{base}/metrics", timeout=10).json()
+    except Exception:
+        pass
+
+    print(f"{'endpoint':12} {'reqs':>6} {'rps':>7} {'err%':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ttft p50':>9}")
+    for name, row in report["endpoints"].items():
+        print(f"{name:12} {row['requests']:>6} {row['rps']:>7} {row['error_rate'] * 100:>6.1f} {row['p50_ms']:>9} "
+              f"{row['p95_ms']:>9} {row['p99_ms']:>9} {row.get('ttft_p50_ms', ''):>9}")
+    tot = report["total"]
+    print(f"{'total':12} {tot['requests']:>6} {tot['rps']:>7} {tot['error_rate'] * 100:>6.1f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# mock_llm.py — local OpenAI-compatible stand-in for /v1/chat/completions (load tests, laptops, CI).
+# Usage: python mock_llm.py [--port 8001] [--ttft 0.2] [--tps 60] [--jitter 0.2] [--error-rate 0.0]
+#        then LLM_BASE_URL=http://localhost:8001/v1 uvicorn app:app ...
+# Replies are shaped by the system prompt (prompts.py): planner JSON for SYSTEM_PLAN, {"sql": null}
+# for SYSTEM_SQL, a short query for SYSTEM_REFINE and a cited filler answer for everything else.
+# Latency = ttft + completion_tokens / tps (± jitter); stream=true sends one SSE delta per token.
+import argparse, json, random, re, time, uuid, threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import List, Dict, Any, Tuple
+from prompts import SYSTEM_PLAN, SYSTEM_SQL, SYSTEM_REFINE
+
+RE_CITE = re.compile(r"^\[([^\]\n]+#[^\]\s]+)", re.MULTILINE)
+RE_QUESTION = re.compile(r"(?:QUESTION:\n|Question: )(.+)", re.DOTALL)
+WORDS = ("the program reads the input file and validates each record before updating the master file; "
+         "rejected records are written to the error report with a reason code and totals are logged").split()
+
+
+def _tokens(text: str) -> int:
+    # rough prompt size, ~4 chars per token
+    return max(1, len(text) // 4)
+
+
+def reply_for(messages: List[Dict[str, str]], max_tokens: int, answer_tokens: int) -> str:
+    system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+    user = messages[-1].get("content", "") if messages else ""
+    m = RE_QUESTION.search(user)
+    question = (m.group(1) if m else user).strip().split("\n")[0]
+    if system == SYSTEM_PLAN:
+        parts = [p.strip() for p in re.split(r"\band\b|,|;|\?", question) if p.strip()] or [question]
+        return json.dumps({"subqueries": parts[:4], "notes": "mock plan"})
+    if system == SYSTEM_SQL:
+        return json.dumps({"sql": None})
+    if system == SYSTEM_REFINE:
+        return " ".join(question.split()[:8])
+    cites = RE_CITE.findall(user)[:3]
+    n = min(max_tokens, answer_tokens)
+    body = " ".join(WORDS[i % len(WORDS)] for i in range(max(1, n - len(cites))))
+    return body + "".join(f" [{c}]" for c in cites)
+
+
+class MockLLM(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so the app's pooled client reuses connections
+    cfg: argparse.Namespace
+    lock = threading.Lock()
+    served = 0
+
+    def log_message(self, fmt, *args):
+        if self.cfg.verbose:
+            super().log_message(fmt, *args)
+
+    def _json(self, status: int, data: Dict[str, Any], headers: Dict[str, str] | None = None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _chunk(self, text: str):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _delays(self, completion_tokens: int) -> Tuple[float, float]:
+        j = 1 + random.uniform(-self.cfg.jitter, self.cfg.jitter)
+        return self.cfg.ttft * j, (1.0 / self.cfg.tps * j) if self.cfg.tps > 0 else 0.0
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            return self._json(200, {"object": "list", "data": [{"id": self.cfg.model, "object": "model"}]})
+        self._json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._json(404, {"error": {"message": "not found"}})
+        with MockLLM.lock:
+            MockLLM.served += 1
+        if self.cfg.error_rate and random.random() < self.cfg.error_rate:
+            return self._json(503, {"error": {"message": "mock overload"}}, {"Retry-After": "1"})
+        req = json.loads(body or b"{}")
+        messages = req.get("messages") or []
+        text = reply_for(messages, int(req.get("max_tokens") or 800), self.cfg.answer_tokens)
+        pieces = re.findall(r"\S+\s*", text) or [text]
+        usage = {"prompt_tokens": sum(_tokens(m.get("content", "")) for m in messages),
+                 "completion_tokens": len(pieces)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        ttft, per_token = self._delays(len(pieces))
+        rid, created = f"chatcmpl-{uuid.uuid4().hex[:12]}", int(time.time())
+
+        if not req.get("stream"):
+            time.sleep(ttft + per_token * len(pieces))
+            return self._json(200, {"id": rid, "object": "chat.completion", "created": created, "model": self.cfg.model,
+                                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                                                 "finish_reason": "stop"}],
+                                    "usage": usage})
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(ttft)
+        frame = lambda d: "data: " + json.dumps(dict({"id": rid, "object": "chat.completion.chunk", "created": created,
+                                                        "model": self.cfg.model}, **d)) + "\n\n"
+        for p in pieces:
+            self._chunk(frame({"choices": [{"index": 0, "delta": {"content": p}, "finish_reason": None}]}))
+            time.sleep(per_token)
+        if (req.get("stream_options") or {}).get("include_usage"):
+            self._chunk(frame({"choices": [], "usage": usage}))
+        self._chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8001)
+    ap.add_argument("--ttft", type=float, default=0.2, help="seconds before the first token")
+    ap.add_argument("--tps", type=float, default=60, help="completion tokens per second (0 = instant)")
+    ap.add_argument("--jitter", type=float, default=0.2, help="± fraction applied to both delays")
+    ap.add_argument("--answer-tokens", type=int, default=120)
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 503")
+    ap.add_argument("--model", default="mock")
+    ap.add_argument("--verbose", action="store_true")
+    args = ap.parse_args()
+    MockLLM.cfg = args
+    srv = ThreadingHTTPServer((args.host, args.port), MockLLM)
+    srv.daemon_threads = True
+    print(f"mock LLM on http://{args.host}:{args.port}/v1 (ttft={args.ttft}s tps={args.tps} error_rate={args.error_rate})")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        print(f"served {MockLLM.served} requests")
+
+
+if __name__ == "__main__":
+    main()
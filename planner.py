@@ -0,0 +1,99 @@
+# planner.py
+import re, threading, collections
+from typing import List, Dict, Any, Optional
+import numpy as np
+from answer_cache import normalize_question, identifiers
+
+RE_WORD = re.compile(r"[A-Za-z0-9][A-Za-z0-9\-_#@$]*")
+# wording that signals a multi-part question worth decomposing
+RE_MULTI = re.compile(
+    r"\b(compare|comparison|versus|vs\.?|differences?|between|as well as|step[- ]by[- ]step|end[- ]to[- ]end|"
+    r"trace|impact|lineage|each|every|all of|walk me through)\b"
+)
+
+
+def needs_planning(question: str) -> bool:
+    """Local, LLM-free check whether a question is worth an LLM decomposition. Short
+    identifier lookups ("what is ACCT-FILE?", "ACCTUPD") go straight to retrieval."""
+    low = question.strip().lower()
+    words = RE_WORD.findall(low)
+    if len(words) <= 3:
+        return False
+    if RE_MULTI.search(low) or question.count("?") > 1 or ";" in question:
+        return True
+    if len(identifiers(question)) >= 3:
+        return True
+    if (" and " in low or " or " in low) and len(words) > 8:
+        return True
+    return len(words) > 20
+
+
+class PlanCache:
+    """Per-session decompositions, matched by normalized text or (with embed) by
+    embedding similarity among questions naming the same identifiers. Plans depend only
+    on the question, so entries are not tied to ingests; each session keeps the last
+    max_per_session."""
+    def __init__(self, embed=None, threshold: float = 0.95, max_per_session: int = 200):
+        self.embed = embed
+        self.threshold = threshold
+        self.max_per_session = max_per_session
+        self._lock = threading.Lock()
+        self._plans: Dict[str, "collections.OrderedDict[str, Dict[str, Any]]"] = {}
+
+    def get(self, session_id: str, question: str) -> Optional[List[str]]:
+        key = normalize_question(question)
+        with self._lock:
+            entries = self._plans.get(session_id)
+            if not entries:
+                return None
+            if key in entries:
+                entries.move_to_end(key)
+                return list(entries[key]["subqueries"])
+            idents = identifiers(question)
+            candidates = [e for e in entries.values() if e["idents"] == idents and e["emb"] is not None]
+        if not candidates or self.embed is None:
+            return None
+        q = self.embed([question])[0]
+        sims = np.stack([e["emb"] for e in candidates]) @ q
+        best = int(np.argmax(sims))
+        return list(candidates[best]["subqueries"]) if sims[best] >= self.threshold else None
+
+    def put(self, session_id: str, question: str, subqueries: List[str]):
+        emb = self.embed([question])[0] if self.embed is not None else None
+        with self._lock:
+            entries = self._plans.setdefault(session_id, collections.OrderedDict())
+            entries[normalize_question(question)] = {"subqueries": list(subqueries), "idents": identifiers(question),
+                                                     "emb": emb}
+            while len(entries) > self.max_per_session:
+                entries.popitem(last=False)
+
+
+class PlannerStats:
+    """How each turn was planned: skipped (fast path), cache, llm, fallback (timeout/bad JSON)."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"skipped": 0, "cache": 0, "llm": 0, "fallback": 0}
+        self.llm_ms = 0.0
+
+    def record(self, source: str, ms: float):
+        with self._lock:
+            self.counts[source] += 1
+            if source in ("llm", "fallback"):
+                self.llm_ms += ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self.counts)
+            llm_ms = self.llm_ms
+        turns = sum(counts.values())
+        calls = counts["llm"] + counts["fallback"]
+        avg = llm_ms / calls if calls else 0.0
+        avoided = counts["skipped"] + counts["cache"]
+        return {"turns": turns, **counts,
+                "skip_rate": round(avoided / turns, 4) if turns else 0.0,
+                "avg_llm_plan_ms": round(avg, 1),
+                # estimate: every avoided call would have cost an average planner round-trip
+                "saved_ms_est": round(avoided * avg, 1)}
+
+
+planner_stats = PlannerStats()
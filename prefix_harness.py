@@ -0,0 +1,138 @@
+# prefix_harness.py — offline measure of prompt-prefix reuse (vLLM automatic prefix caching)
+# for the previous message layout vs. prompts.py, over a recorded conversation.
+# Usage:
+#   python prefix_harness.py --session S1700000000000 [--db ./data/rag.sqlite]
+#   python prefix_harness.py --recording turns.jsonl   # {"question": ..., "contexts": [{chunk_id, filename, text, ...}]}
+#   python prefix_harness.py --demo 30                 # synthetic conversation
+#   add --tokenizer <hf name/path> to count real model tokens instead of the regex approximation
+import argparse, json, os, re, random, sqlite3, collections
+from typing import List, Dict, Any, Callable
+from prompts import SYSTEM_SYNTH, plan_messages, synth_messages, cite_label, numbered
+
+RE_TOKEN = re.compile(r"\s*\w+|\s*[^\w\s]")
+
+
+def legacy_synth_messages(question: str, contexts: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    # layout before prompts.py: question first, context in retrieval-score order
+    block = "\n\n".join(f"[{cite_label(c)}]\n{numbered(c)}" for c in contexts) or "(no context)"
+    return [
+        {"role": "system", "content": SYSTEM_SYNTH},
+        {"role": "user", "content": f"QUESTION:\n{question}\n\nCONTEXT:\n{block}"}
+    ]
+
+
+def make_tokenizer(name: str | None) -> Callable[[List[Dict[str, str]]], List[int]]:
+    if name:
+        from transformers import AutoTokenizer
+        tok = AutoTokenizer.from_pretrained(name)
+        if getattr(tok, "chat_template", None):
+            return lambda msgs: tok.apply_chat_template(msgs, tokenize=True, add_generation_prompt=True)
+        return lambda msgs: tok.encode("".join(f"<|{m['role']}|>\n{m['content']}\n" for m in msgs))
+    return lambda msgs: [hash(t) for m in msgs for t in RE_TOKEN.findall(f"<|{m['role']}|>\n{m['content']}\n")]
+
+
+class PrefixCacheSim:
+    """Block-level prefix cache like vLLM's: a block of block_size tokens is reused only when
+    it and every block before it are identical to a cached prompt. LRU over max_blocks."""
+    def __init__(self, block_size: int = 16, max_blocks: int = 100_000):
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.blocks: "collections.OrderedDict[int, None]" = collections.OrderedDict()
+
+    def request(self, tokens: List[int]) -> int:
+        """Returns the number of prompt tokens served from cache, then caches this prompt."""
+        h, cached, hit_run = 0, 0, True
+        for i in range(0, len(tokens) - self.block_size + 1, self.block_size):
+            h = hash((h, tuple(tokens[i:i + self.block_size])))
+            if hit_run and h in self.blocks:
+                cached += self.block_size
+                self.blocks.move_to_end(h)
+            else:
+                hit_run = False
+                self.blocks[h] = None
+                if len(self.blocks) > self.max_blocks:
+                    self.blocks.popitem(last=False)
+        return cached
+
+
+def turns_from_session(db_path: str, session_id: str) -> List[Dict[str, Any]]:
+    # each user message + the chunks cited by the assistant reply that followed it
+    con = sqlite3.connect(db_path)
+    msgs = con.execute("SELECT role, content, citations FROM messages WHERE session_id = ? ORDER BY id", (session_id,)).fetchall()
+    turns, question = [], None
+    for role, content, citations in msgs:
+        if role == "user":
+            question = content
+        elif role == "assistant" and question:
+            contexts = []
+            for c in json.loads(citations or "[]"):
+                row = con.execute("SELECT filename, content, start_line, end_line FROM chunks WHERE id = ?",
+                                  (c.get("chunk_id"),)).fetchone() if isinstance(c.get("chunk_id"), int) else None
+                if row:
+                    contexts.append({"chunk_id": c["chunk_id"], "filename": row[0], "text": row[1],
+                                     "start_line": row[2], "end_line": row[3], "score": c.get("score", 0)})
+            turns.append({"question": question, "contexts": contexts})
+            question = None
+    con.close()
+    return turns
+
+
+def demo_turns(n: int, seed: int = 3) -> List[Dict[str, Any]]:
+    # a session drilling into one program: consecutive turns retrieve mostly the same chunks
+    rng = random.Random(seed)
+    chunks = [{"chunk_id": i, "filename": f"PGM{i % 7:02d}.cbl", "start_line": 1 + 120 * (i // 7), "end_line": 120 * (i // 7 + 1),
+               "text": "\n".join(f"       MOVE WS-FIELD-{i}-{j} TO OUT-REC-{j}." for j in range(40))} for i in range(60)]
+    turns, focus = [], rng.sample(range(60), 8)
+    for t in range(n):
+        if t % 5 == 4:
+            focus = rng.sample(range(60), 8)
+        picked = focus[:6] + rng.sample(range(60), 2)
+        rng.shuffle(picked)  # retrieval scores reorder the same chunks from turn to turn
+        turns.append({"question": f"Question {t}: what does PGM{rng.randrange(7):02d} write to OUT-REC?",
+                      "contexts": [dict(chunks[i], score=rng.random()) for i in picked]})
+    return turns
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--session")
+    src.add_argument("--recording")
+    src.add_argument("--demo", type=int)
+    ap.add_argument("--db", default=os.getenv("DB_PATH", "./data/rag.sqlite"))
+    ap.add_argument("--tokenizer")
+    ap.add_argument("--block-size", type=int, default=16)
+    args = ap.parse_args()
+
+    if args.session:
+        turns = turns_from_session(args.db, args.session)
+    elif args.recording:
+        with open(args.recording, encoding="utf-8") as f:
+            turns = [json.loads(line) for line in f if line.strip()]
+    else:
+        turns = demo_turns(args.demo)
+    if not turns:
+        raise SystemExit("no turns found")
+    tokenize = make_tokenizer(args.tokenizer)
+
+    layouts = {
+        "legacy": lambda q, ctx: [plan_messages(q), legacy_synth_messages(q, ctx)],
+        "stable": lambda q, ctx: [plan_messages(q), synth_messages(q, ctx)],
+    }
+    print(f"turns={len(turns)} block_size={args.block_size} tokenizer={args.tokenizer or 'regex approx.'}")
+    print(f"{'layout':8} {'prompt tokens':>14} {'cached tokens':>14} {'reuse':>7} {'synth reuse':>12}")
+    for name, build in layouts.items():
+        sim = PrefixCacheSim(args.block_size)
+        total = cached = synth_total = synth_cached = 0
+        for t in turns:
+            for i, msgs in enumerate(build(t["question"], t["contexts"])):
+                toks = tokenize(msgs)
+                hit = sim.request(toks)
+                total, cached = total + len(toks), cached + hit
+                if i == 1:
+                    synth_total, synth_cached = synth_total + len(toks), synth_cached + hit
+        print(f"{name:8} {total:>14,} {cached:>14,} {cached / total:>7.1%} {synth_cached / max(synth_total, 1):>12.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# prompts.py
+from typing import List, Dict, Any
+
+# Message layout is prefix-cache friendly (vLLM --enable-prefix-caching reuses the KV cache
+# of an identical token prefix): fixed system prompt first, then context in a deterministic
+# order, and the volatile question last. Keep these strings byte-stable.
+
+SYSTEM_PLAN = """You are an analysis planner. Break the user question into 2-5 bite-size sub-queries.
+Return strict JSON:
+{"subqueries": ["...","..."], "notes": "short rationale"}
+"""
+
+SYSTEM_SYNTH = """You are a careful banking analyst. Use the provided CONTEXT passages to answer.
+- Cite using [filename#chunk_id] footnotes.
+- If unsure, say what is missing.
+- Be concise, accurate, and safe for a private bank environment.
+"""
+
+SYSTEM_SQL = """You write ONE read-only SQLite SELECT that answers the question from the tables below.
+Return strict JSON:
+{"sql": "SELECT ..."}
+Use {"sql": null} if the tables cannot answer the question.
+"""
+
+SYSTEM_REFINE = "Suggest a sharper search query for RAG given the user's question."
+
+SYSTEM_CODE_MAP = """You summarize ONE mainframe source member (COBOL program, copybook, JCL, CICS map) for a
+code inventory. Report only what the code shows, in short bullets under these headings:
+Purpose; Entry points / paragraphs called; Files, DB2 tables and copybooks used (with read/write);
+Key business rules and conditions; Outputs and side effects.
+"""
+
+SYSTEM_CODE_REDUCE = """You combine per-file summaries of a mainframe code base into one structured summary.
+Keep program, file, table and copybook names exactly as written and say which member each fact comes from.
+"""
+
+
+def numbered(c: Dict[str, Any]) -> str:
+    # Code chunks are stored raw; line numbers are only re-applied for the prompt.
+    text = c.get("text") or ""
+    start = c.get("start_line")
+    if not start:
+        return text
+    return "\n".join(f"{start+i:05d}: {ln}" for i, ln in enumerate(text.split("\n")))
+
+
+def cite_label(c: Dict[str, Any]) -> str:
+    label = f"{c['filename']}#{c['chunk_id']}"
+    if c.get("start_line"):
+        label += f" L{c['start_line']}-{c['end_line']}"
+    return label
+
+
+def stable_order(contexts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Stored chunks by ascending chunk id (the same chunks always render in the same order
+    and position, turn after turn); per-turn passages such as SQL results go last."""
+    def key(c):
+        cid = c.get("chunk_id")
+        return (0, cid, "") if isinstance(cid, int) else (1, 0, str(cid))
+    return sorted(contexts, key=key)
+
+
+def context_block(contexts: List[Dict[str, Any]]) -> str:
+    return "\n\n".join(f"[{cite_label(c)}]\n{numbered(c)}" for c in stable_order(contexts)) or "(no context)"
+
+
+def plan_messages(question: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": SYSTEM_PLAN},
+        {"role": "user", "content": f"Question: {question}"}
+    ]
+
+
+def refine_messages(question: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": SYSTEM_REFINE},
+        {"role": "user", "content": question}
+    ]
+
+
+def sql_messages(schema_lines: List[str], question: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": SYSTEM_SQL},
+        {"role": "user", "content": "\n".join(sorted(schema_lines)) + f"\n\nQuestion: {question}"}
+    ]
+
+
+def synth_messages(question: str, contexts: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": SYSTEM_SYNTH},
+        {"role": "user", "content": f"CONTEXT:\n{context_block(contexts)}\n\nQUESTION:\n{question}"}
+    ]
+
+
+def code_map_messages(filename: str, text: str, part: str = "") -> List[Dict[str, str]]:
+    # part: "" for a whole member, "part 2/3" when an oversized member is summarized in pieces
+    head = f"MEMBER: {filename}" + (f" ({part})" if part else "")
+    return [
+        {"role": "system", "content": SYSTEM_CODE_MAP},
+        {"role": "user", "content": f"{head}\n\n{text}"}
+    ]
+
+
+def code_reduce_messages(instruction: str, summaries: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """summaries: [{"name", "summary"}] in a stable (name) order; the instruction goes last."""
+    block = "\n\n".join(f"=== {s['name']} ===\n{s['summary']}" for s in summaries)
+    return [
+        {"role": "system", "content": SYSTEM_CODE_REDUCE},
+        {"role": "user", "content": f"SUMMARIES:\n{block}\n\nTASK:\n{instruction}"}
+    ]
@@ -30,6 +30,7 @@
     const chatBox = document.getElementById('chatBox');
     chatBox.appendChild(div);
     chatBox.scrollTop = chatBox.scrollHeight;
+    return div;
   }
 
   async function newSession() {
@@ -169,9 +170,36 @@
     if (!msg) return;
     addMsg('user', msg);
     inp.value = "";
-    const r = await fetch(`${API}/chat`, { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ session_id: sid, message: msg }) });
-    const js = await r.json();
-    addMsg('assistant', js.answer || "(no answer)");
+    // Server-Sent Events from /chat/stream: citations, then tokens, then done
+    const r = await fetch(`${API}/chat/stream`, { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify({ session_id: sid, message: msg }) });
+    if (!r.ok || !r.body) {
+      addMsg('assistant', `(error ${r.status})`);
+      return;
+    }
+    const div = addMsg('assistant', "");
+    const reader = r.body.getReader();
+    const decoder = new TextDecoder();
+    let buf = "", text = "";
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buf += decoder.decode(value, { stream: true });
+      let cut;
+      while ((cut = buf.indexOf("\n\n")) >= 0) {
+        const block = buf.slice(0, cut);
+        buf = buf.slice(cut + 2);
+        const ev = (block.match(/^event: (.*)$/m) || [])[1];
+        const data = (block.match(/^data: (.*)$/m) || [])[1];
+        if (!ev || !data) continue;
+        const js = JSON.parse(data);
+        if (ev === 'token') text += js.text;
+        else if (ev === 'done') text = js.answer || text || "(no answer)";
+        else if (ev === 'error') text += `\n(error: ${js.detail})`;
+        div.textContent = text;
+        const chatBox = document.getElementById('chatBox');
+        chatBox.scrollTop = chatBox.scrollHeight;
+      }
+    }
     refreshDashboard();
   };
 
@@ -204,6 +232,7 @@
     if (schema) fd.append('schema', schema);
     fd.append('key_cols', keys || "");
     fd.append('db2_limit', String(+db2limit));
+    fd.append('mode', document.getElementById('diffFull').checked ? 'full' : 'sample');
     fd.append('csv_file', csv);
     const js = await upload('/db2/csv-diff', fd);
     document.getElementById('diffResult').textContent = JSON.stringify(js, null, 2);
@@ -270,11 +299,14 @@
     const include = document.getElementById('includeLLM').checked;
     const fd = new FormData();
     fd.append('session_id', sid); fd.append('include_llm', include ? 'true' : 'false');
+    fd.append('format', document.getElementById('exportFormat').value);
+    fd.append('gzip', document.getElementById('exportGzip').checked ? 'true' : 'false');
+    fd.append('copybooks', document.getElementById('exportCopybooks').value.trim());
     const js = await upload('/export/session', fd);
-    const p = js.md_path || "";
+    const p = js.path || js.md_path || "";
     const name = p.split('/').pop();
     const link = document.createElement('a');
-    link.href = `/data/exports/${name}`;
+    link.href = js.url || `/data/exports/${name}`;
     link.download = name;
     link.textContent = `Download ${name}`;
     const box = document.getElementById('exportLinks');
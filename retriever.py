@@ -1,5 +1,5 @@
 
-import os, json
+import os, json, threading
 from typing import List, Dict, Any, Tuple
 import numpy as np
 import faiss
@@ -19,6 +19,9 @@ class VectorStore:
         self.model = SentenceTransformer(self.model_name)
         self.index = None
         self.metadata: List[Dict[str, Any]] = []
+        # index and metadata are positionally aligned; readers and writers (uploads, DB2 imports,
+        # agent searches) run on different threads, so every access holds the lock
+        self._lock = threading.Lock()
         self._load()
 
     def _load(self):
@@ -40,21 +43,46 @@ class VectorStore:
     def add_texts(self, texts: List[str], metadatas: List[Dict[str, Any]]):
         embeddings = self.model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
         d = embeddings.shape[1]
-        if self.index is None:
-            self.index = faiss.IndexFlatIP(d)
-        self.index.add(embeddings.astype(np.float32))
-        self.metadata.extend(metadatas)
-        self._save()
+        with self._lock:
+            if self.index is None:
+                self.index = faiss.IndexFlatIP(d)
+            self.index.add(embeddings.astype(np.float32))
+            self.metadata.extend(metadatas)
+            self._save()
+
+    def remove_chunks(self, chunk_ids) -> int:
+        """Drop the vectors of the given chunk ids (used when imported rows are upserted)."""
+        drop = set(chunk_ids)
+        if not drop:
+            return 0
+        with self._lock:
+            if self.index is None:
+                return 0
+            positions = [i for i, m in enumerate(self.metadata) if m.get("chunk_id") in drop]
+            if not positions:
+                return 0
+            # IndexFlat keeps the remaining vectors in order, so metadata stays aligned
+            self.index.remove_ids(np.array(positions, dtype=np.int64))
+            gone = set(positions)
+            self.metadata = [m for i, m in enumerate(self.metadata) if i not in gone]
+            self._save()
+        return len(positions)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Normalized float32 embeddings (same model as the index), for similarity outside FAISS."""
+        return self.model.encode(texts, convert_to_numpy=True, normalize_embeddings=True).astype(np.float32)
 
     def search(self, query: str, k: int = 6) -> List[Tuple[float, Dict[str, Any]]]:
         q_emb = self.model.encode([query], convert_to_numpy=True, normalize_embeddings=True).astype(np.float32)
-        if self.index is None or self.index.ntotal == 0:
-            return []
-        scores, idxs = self.index.search(q_emb, k)
+        with self._lock:
+            if self.index is None or self.index.ntotal == 0:
+                return []
+            scores, idxs = self.index.search(q_emb, k)
+            metadata = self.metadata
         results = []
         for score, idx in zip(scores[0], idxs[0]):
             if idx == -1: 
                 continue
-            meta = self.metadata[idx]
+            meta = metadata[idx]
             results.append((float(score), meta))
         return results
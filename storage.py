@@ -1,6 +1,6 @@
 
 import os, time, sqlite3
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
 def ensure_dirs(path: str):
     os.makedirs(path, exist_ok=True)
@@ -36,9 +36,42 @@ class DB:
                 session_id TEXT,
                 filename TEXT,
                 position INTEGER,
-                content TEXT
+                content TEXT,
+                start_line INTEGER,
+                end_line INTEGER
             );
             """)
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS imports(
+                session_id TEXT,
+                source TEXT,
+                status TEXT,
+                rows INTEGER,
+                chunks INTEGER,
+                watermark_col TEXT,
+                watermark TEXT,
+                started_at REAL,
+                updated_at REAL,
+                PRIMARY KEY(session_id, source)
+            );
+            """)
+            cur.execute("""
+            CREATE TABLE IF NOT EXISTS chunk_versions(
+                session_id TEXT PRIMARY KEY,
+                version INTEGER,
+                updated_at REAL
+            );
+            """)
+            # databases created before line offsets were tracked
+            cols = {r[1] for r in cur.execute("PRAGMA table_info(chunks)").fetchall()}
+            for col, typ in (("start_line", "INTEGER"), ("end_line", "INTEGER"), ("source_key", "TEXT")):
+                if col not in cols:
+                    cur.execute(f"ALTER TABLE chunks ADD COLUMN {col} {typ}")
+            cols = {r[1] for r in cur.execute("PRAGMA table_info(imports)").fetchall()}
+            for col in ("watermark_col", "watermark"):
+                if col not in cols:
+                    cur.execute(f"ALTER TABLE imports ADD COLUMN {col} TEXT")
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_chunks_source_key ON chunks(session_id, filename, source_key)")
             con.commit()
 
     def create_session(self, name: str) -> str:
@@ -77,18 +110,183 @@ class DB:
             ).fetchall()
         return [{"role": r[0], "content": r[1], "citations": r[2], "created_at": r[3]} for r in rows]
 
-    def add_chunk(self, session_id: str, filename: str, position: int, content: str) -> int:
+    @staticmethod
+    def _bump_version(cur: sqlite3.Cursor, session_id: str):
+        # every chunk write bumps the session's chunk_version, in the same transaction
+        cur.execute(
+            """INSERT INTO chunk_versions(session_id, version, updated_at) VALUES (?, 1, ?)
+            ON CONFLICT(session_id) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at""",
+            (session_id, time.time())
+        )
+
+    def chunk_version(self, session_id: str) -> int:
+        """Counter of chunk writes (add/upsert/delete) in the session; caches key on it."""
+        with sqlite3.connect(self.db_path) as con:
+            row = con.execute("SELECT version FROM chunk_versions WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def add_chunk(self, session_id: str, filename: str, position: int, content: str,
+                  start_line: Optional[int] = None, end_line: Optional[int] = None) -> int:
         with sqlite3.connect(self.db_path) as con:
             cur = con.cursor()
             cur.execute(
-                "INSERT INTO chunks(session_id, filename, position, content) VALUES (?, ?, ?, ?)",
-                (session_id, filename, position, content)
+                "INSERT INTO chunks(session_id, filename, position, content, start_line, end_line) VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, filename, position, content, start_line, end_line)
             )
+            # before the version bump: its upsert would move lastrowid to chunk_versions
+            cid = cur.lastrowid
+            self._bump_version(cur, session_id)
             con.commit()
-            return cur.lastrowid
+            return cid
+
+    def get_file_chunks(self, session_id: str, code_only: bool = False) -> Dict[str, List[Dict[str, Any]]]:
+        """Chunks per file in position order, latest ingest only (a re-ingested file restarts
+        at position 0). code_only keeps files ingested as code (chunks with line offsets)."""
+        sql = "SELECT id, filename, position, content, start_line, end_line FROM chunks WHERE session_id = ?"
+        if code_only:
+            sql += " AND start_line IS NOT NULL"
+        with sqlite3.connect(self.db_path) as con:
+            rows = con.execute(sql + " ORDER BY id ASC", (session_id,)).fetchall()
+        files: Dict[str, List[Dict[str, Any]]] = {}
+        for cid, filename, position, content, start, end in rows:
+            if position == 0 or filename not in files:
+                files[filename] = []
+            files[filename].append({"chunk_id": cid, "position": position, "text": content,
+                                    "start_line": start, "end_line": end})
+        return files
 
     def get_chunk(self, chunk_id: int) -> str:
         with sqlite3.connect(self.db_path) as con:
             cur = con.cursor()
             row = cur.execute("SELECT content FROM chunks WHERE id = ?", (chunk_id,)).fetchone()
             return row[0] if row else ""
+
+    def add_chunks(self, session_id: str, filename: str, items: List[Tuple[int, str]]) -> List[int]:
+        """Insert (position, content) chunks of one file in a single transaction."""
+        ids = []
+        with sqlite3.connect(self.db_path) as con:
+            cur = con.cursor()
+            for position, content in items:
+                cur.execute(
+                    "INSERT INTO chunks(session_id, filename, position, content) VALUES (?, ?, ?, ?)",
+                    (session_id, filename, position, content)
+                )
+                ids.append(cur.lastrowid)
+            if ids:
+                self._bump_version(cur, session_id)
+            con.commit()
+        return ids
+
+    def upsert_chunks(self, session_id: str, filename: str, items: List[Tuple[str, int, str]]) -> Tuple[List[int], List[int]]:
+        """Insert (source_key, position, content) chunks, replacing chunks of the same file
+        that carry the same source_key. Returns (new_ids, replaced_ids)."""
+        ids, replaced = [], []
+        with sqlite3.connect(self.db_path) as con:
+            cur = con.cursor()
+            keys = [k for k, _, _ in items]
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                marks = ",".join("?" * len(part))
+                replaced += [r[0] for r in cur.execute(
+                    f"SELECT id FROM chunks WHERE session_id = ? AND filename = ? AND source_key IN ({marks})",
+                    (session_id, filename, *part)
+                ).fetchall()]
+            for i in range(0, len(replaced), 500):
+                part = replaced[i:i + 500]
+                cur.execute(f"DELETE FROM chunks WHERE id IN ({','.join('?' * len(part))})", part)
+            for key, position, content in items:
+                cur.execute(
+                    "INSERT INTO chunks(session_id, filename, position, content, source_key) VALUES (?, ?, ?, ?, ?)",
+                    (session_id, filename, position, content, key)
+                )
+                ids.append(cur.lastrowid)
+            if ids or replaced:
+                self._bump_version(cur, session_id)
+            con.commit()
+        return ids, replaced
+
+    def source_keys(self, session_id: str, filename: str, prefix: str = "") -> List[str]:
+        with sqlite3.connect(self.db_path) as con:
+            return [r[0] for r in con.execute(
+                "SELECT source_key FROM chunks WHERE session_id = ? AND filename = ? AND source_key LIKE ? ESCAPE '\\'",
+                (session_id, filename, prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%")
+            ).fetchall()]
+
+    def delete_source_keys(self, session_id: str, filename: str, keys: List[str]) -> List[int]:
+        """Delete the file's chunks carrying any of keys; returns the removed ids."""
+        ids: List[int] = []
+        with sqlite3.connect(self.db_path) as con:
+            cur = con.cursor()
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                marks = ",".join("?" * len(part))
+                ids += [r[0] for r in cur.execute(
+                    f"SELECT id FROM chunks WHERE session_id = ? AND filename = ? AND source_key IN ({marks})",
+                    (session_id, filename, *part)
+                ).fetchall()]
+                cur.execute(f"DELETE FROM chunks WHERE session_id = ? AND filename = ? AND source_key IN ({marks})",
+                            (session_id, filename, *part))
+            if ids:
+                self._bump_version(cur, session_id)
+            con.commit()
+        return ids
+
+    def delete_file_chunks(self, session_id: str, filename: str) -> List[int]:
+        """Delete every chunk of one file/source in the session; returns the removed ids."""
+        with sqlite3.connect(self.db_path) as con:
+            cur = con.cursor()
+            ids = [r[0] for r in cur.execute(
+                "SELECT id FROM chunks WHERE session_id = ? AND filename = ?", (session_id, filename)
+            ).fetchall()]
+            cur.execute("DELETE FROM chunks WHERE session_id = ? AND filename = ?", (session_id, filename))
+            if ids:
+                self._bump_version(cur, session_id)
+            con.commit()
+        return ids
+
+    def start_import(self, session_id: str, source: str, watermark_col: Optional[str] = None):
+        # keeps the stored watermark so incremental imports resume where they stopped; a watermark
+        # of another column is cleared, even if this run never writes a batch
+        now = time.time()
+        with sqlite3.connect(self.db_path) as con:
+            con.execute(
+                """INSERT INTO imports(session_id, source, status, rows, chunks, watermark_col, started_at, updated_at)
+                VALUES (?, ?, 'running', 0, 0, ?, ?, ?)
+                ON CONFLICT(session_id, source) DO UPDATE SET status = 'running', rows = 0, chunks = 0,
+                    watermark = CASE WHEN imports.watermark_col IS excluded.watermark_col THEN imports.watermark END,
+                    watermark_col = excluded.watermark_col, started_at = excluded.started_at, updated_at = excluded.updated_at""",
+                (session_id, source, watermark_col, now, now)
+            )
+            con.commit()
+
+    def update_import(self, session_id: str, source: str, rows: int, chunks: int, status: str = "running",
+                      watermark: Optional[str] = None):
+        with sqlite3.connect(self.db_path) as con:
+            con.execute(
+                "UPDATE imports SET status = ?, rows = ?, chunks = ?, watermark = COALESCE(?, watermark), updated_at = ? WHERE session_id = ? AND source = ?",
+                (status, rows, chunks, watermark, time.time(), session_id, source)
+            )
+            con.commit()
+
+    def get_watermark(self, session_id: str, source: str, watermark_col: str) -> Optional[str]:
+        with sqlite3.connect(self.db_path) as con:
+            row = con.execute(
+                "SELECT watermark FROM imports WHERE session_id = ? AND source = ? AND watermark_col = ?",
+                (session_id, source, watermark_col)
+            ).fetchone()
+        return row[0] if row else None
+
+    def reset_watermark(self, session_id: str, source: str):
+        with sqlite3.connect(self.db_path) as con:
+            con.execute("UPDATE imports SET watermark = NULL WHERE session_id = ? AND source = ?", (session_id, source))
+            con.commit()
+
+    def get_imports(self, session_id: str) -> List[Dict[str, Any]]:
+        with sqlite3.connect(self.db_path) as con:
+            cur = con.cursor()
+            rows = cur.execute(
+                "SELECT source, status, rows, chunks, watermark_col, watermark, started_at, updated_at FROM imports WHERE session_id = ? ORDER BY started_at DESC",
+                (session_id,)
+            ).fetchall()
+        return [{"source": r[0], "status": r[1], "rows": r[2], "chunks": r[3], "watermark_col": r[4], "watermark": r[5],
+                 "started_at": r[6], "updated_at": r[7]} for r in rows]
@@ -0,0 +1,223 @@
+# stream_diff.py
+import os, time, tempfile, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Any, List, Optional, IO
+import pandas as pd
+from sqlalchemy.engine import Engine
+from db2_hooks import fetch_batches
+from csv_diff import suggest_keys, _key_tuples
+
+STREAM_DIFF_BUCKETS = int(os.getenv("STREAM_DIFF_BUCKETS", "64"))
+STREAM_DIFF_CHUNK = int(os.getenv("STREAM_DIFF_CHUNK", "50000"))
+
+RE_NUMBER = r'[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?'
+RE_CANON = r'-?(0|[1-9]\d*)(\.\d*[1-9])?'
+DIGEST = "\x00digest"
+
+
+def _canon_number(s: str) -> str:
+    try:
+        d = Decimal(s)
+    except InvalidOperation:
+        return s
+    if d == 0:
+        return "0"
+    out = format(d.normalize(), "f")
+    return out.rstrip("0").rstrip(".") if "." in out else out
+
+
+def _text(v: Any) -> str:
+    if v is None or (isinstance(v, float) and v != v):
+        return ""
+    if isinstance(v, datetime.datetime):
+        return v.isoformat(sep=" ")
+    if isinstance(v, (datetime.date, datetime.time)):
+        return v.isoformat()
+    if isinstance(v, (bytes, bytearray, memoryview)):
+        return bytes(v).hex()
+    return str(v)
+
+
+def _canon_numbers(s: pd.Series) -> pd.Series:
+    # "+007.50" -> "7.5", ".5" -> "0.5", "1e3" -> "1000": same text as Decimal(...).normalize().
+    # Most values are already canonical, so only the remainder goes through Decimal.
+    rest = s[~s.str.fullmatch(RE_CANON)]
+    if rest.empty:
+        return s
+    num = rest[rest.str.fullmatch(RE_NUMBER)]
+    if num.empty:
+        return s
+    out = s.copy()
+    out[num.index] = num.map(_canon_number)
+    return out
+
+
+def canonical_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Text form of every cell, so a DB2 row and a CSV row compare equal when they hold
+    the same data: numbers numerically (1.50 == 1.5), text trimmed, NULL == empty."""
+    out = {}
+    for col in df.columns:
+        s = df[col]
+        if pd.api.types.is_bool_dtype(s.dtype):
+            out[col] = s.astype(str)
+            continue
+        if pd.api.types.is_datetime64_any_dtype(s.dtype):
+            out[col] = s.astype(str).where(s.notna(), "")
+            continue
+        if pd.api.types.is_integer_dtype(s.dtype):
+            out[col] = s.astype(str)
+            continue
+        if pd.api.types.is_float_dtype(s.dtype):
+            whole = s.notna() & (s % 1 == 0) & (s.abs() < 1e15)
+            s = s.astype(object).where(~whole, s.where(whole, 0).astype("int64"))
+        if s.dtype == object and not all(isinstance(v, str) for v in s.head(64)):
+            s = s.map(_text)
+        else:
+            s = s.astype(str).where(s.notna(), "")
+        out[col] = _canon_numbers(s.str.strip())
+    return pd.DataFrame(out, index=df.index)
+
+
+class _Buckets:
+    """On-disk partitions of one side: CSV files of (keys, values, row digest), one per key-hash bucket."""
+    def __init__(self, root: str, side: str, n: int, keys: List[str], values: List[str]):
+        self.paths = [os.path.join(root, f"{side}_{i:04d}.csv") for i in range(n)]
+        self.files = [open(p, "w", encoding="utf-8", newline="") for p in self.paths]
+        self.keys, self.values = keys, values
+        self.rows = 0
+
+    def add(self, frame: pd.DataFrame):
+        frame = canonical_frame(frame)
+        frame[DIGEST] = pd.util.hash_pandas_object(frame[self.values], index=False).astype(str) \
+            if self.values else "0"
+        bucket = pd.util.hash_pandas_object(frame[self.keys], index=False) % len(self.files)
+        for b, part in frame.groupby(bucket.to_numpy(), sort=False):
+            part.to_csv(self.files[b], header=False, index=False)
+        self.rows += len(frame)
+
+    def read(self, i: int) -> pd.DataFrame:
+        return pd.read_csv(self.paths[i], header=None, names=self.keys + self.values + [DIGEST],
+                           dtype=str, keep_default_na=False)
+
+    def close(self):
+        for f in self.files:
+            f.close()
+
+
+def _chain(first, rest):
+    yield first
+    yield from rest
+
+
+def stream_diff(csv_src: str | IO, table: str, schema: Optional[str] = None, key_cols: Optional[List[str]] = None,
+                sample: int = 20, buckets: int | None = None, chunk_rows: int | None = None,
+                engine: Optional[Engine] = None, workdir: Optional[str] = None) -> Dict[str, Any]:
+    """Reconcile a full DB2 table with a CSV of any size in bounded memory.
+
+    Both sides are read in chunks (CSV via pandas chunksize, DB2 via fetch_batches),
+    canonicalized and hash-partitioned by key into on-disk bucket files that carry a
+    digest of each row. Buckets are then compared one at a time, digests first, so
+    only one bucket per side is ever in memory. Counts cover every row; samples are
+    capped at `sample`. Returns the same schema_diff/data_diff shape as the
+    in-memory diff, plus row counts per side."""
+    buckets = buckets or STREAM_DIFF_BUCKETS
+    chunk_rows = chunk_rows or STREAM_DIFF_CHUNK
+    t0 = time.time()
+
+    # everything as text: pandas would otherwise guess int/float per chunk
+    csv_iter = iter(pd.read_csv(csv_src, chunksize=chunk_rows, dtype=str, keep_default_na=False))
+    db2_iter = fetch_batches(table, schema=schema, batch_size=chunk_rows, engine=engine)
+    csv_first = next(csv_iter, None)
+    db2_first = next(db2_iter, None)
+    if csv_first is None or not db2_first:
+        raise ValueError("CSV file or DB2 table is empty")
+
+    db2_cols = {c.strip().upper(): c for c in db2_first[0].keys()}
+    csv_cols = {c.strip().upper(): c for c in csv_first.columns}
+    sdiff = {
+        "only_in_db2": sorted(set(db2_cols) - set(csv_cols)),
+        "only_in_csv": sorted(set(csv_cols) - set(db2_cols)),
+        "common": sorted(set(db2_cols) & set(csv_cols)),
+    }
+    keys = [k.strip().upper() for k in (key_cols or [])] or suggest_keys(pd.DataFrame(db2_first), csv_first)
+    for k in keys:
+        if k not in db2_cols or k not in csv_cols:
+            raise ValueError(f"Key column {k} missing in one of the sources")
+    value_cols = [c for c in sdiff["common"] if c not in keys]
+    cols = keys + value_cols
+
+    with tempfile.TemporaryDirectory(prefix="csvdiff_", dir=workdir) as root:
+        left = _Buckets(root, "db2", buckets, keys, value_cols)
+        right = _Buckets(root, "csv", buckets, keys, value_cols)
+        try:
+            for batch in _chain(db2_first, db2_iter):
+                left.add(pd.DataFrame(batch)[[db2_cols[c] for c in cols]].set_axis(cols, axis=1))
+            for chunk in _chain(csv_first, csv_iter):
+                right.add(chunk[[csv_cols[c] for c in cols]].set_axis(cols, axis=1))
+        finally:
+            left.close()
+            right.close()
+        out = _compare_buckets(left, right, keys, value_cols, sample)
+
+    out.update({"mode": "full", "rows": {"db2": left.rows, "csv": right.rows}, "buckets": buckets,
+                "elapsed_s": round(time.time() - t0, 3)})
+    return {"schema_diff": sdiff, "data_diff": out}
+
+
+def _compare_buckets(left: _Buckets, right: _Buckets, keys: List[str], value_cols: List[str],
+                     sample: int) -> Dict[str, Any]:
+    totals = {"db2_only": 0, "csv_only": 0, "common": 0, "mismatch": 0, "dup_db2": 0, "dup_csv": 0}
+    col_counts = {c: 0 for c in value_cols}
+    db2_only_keys: List[tuple] = []
+    csv_only_keys: List[tuple] = []
+    diffs: List[Dict[str, Any]] = []
+
+    for i in range(len(left.paths)):
+        l, r = left.read(i), right.read(i)
+        # duplicates keep the first row, like the in-memory diff
+        dl, dr = l.duplicated(keys), r.duplicated(keys)
+        totals["dup_db2"] += int(dl.sum())
+        totals["dup_csv"] += int(dr.sum())
+        l, r = l[~dl], r[~dr]
+
+        m = l.merge(r, on=keys, how="outer", suffixes=("\x00db2", "\x00csv"), indicator=True, sort=False)
+        side = m["_merge"]
+        only_l, only_r = m.loc[side == "left_only", keys], m.loc[side == "right_only", keys]
+        both = m.loc[side == "both"]
+        totals["db2_only"] += len(only_l)
+        totals["csv_only"] += len(only_r)
+        totals["common"] += len(both)
+        db2_only_keys += _key_tuples(only_l.head(sample - len(db2_only_keys)), keys)
+        csv_only_keys += _key_tuples(only_r.head(sample - len(csv_only_keys)), keys)
+
+        # column-by-column comparison only where the row digests differ
+        changed = both[both[DIGEST + "\x00db2"] != both[DIGEST + "\x00csv"]]
+        if changed.empty:
+            continue
+        mask = pd.DataFrame({c: changed[c + "\x00db2"].to_numpy() != changed[c + "\x00csv"].to_numpy()
+                             for c in value_cols}, index=changed.index)
+        rows = mask.any(axis=1)
+        totals["mismatch"] += int(rows.sum())
+        for c, n in mask.sum().items():
+            col_counts[c] += int(n)
+        for idx in rows[rows].index[:max(0, sample - len(diffs))]:
+            row = changed.loc[idx]
+            keyd = {k: row[k] for k in keys}
+            diffs.append({
+                "key": tuple(keyd.values()),
+                "db2": {**keyd, **{c: row[c + "\x00db2"] for c in value_cols}},
+                "csv": {**keyd, **{c: row[c + "\x00csv"] for c in value_cols}},
+                "mismatch_cols": [c for c in value_cols if mask.at[idx, c]],
+            })
+
+    return {
+        "db2_only_count": totals["db2_only"],
+        "csv_only_count": totals["csv_only"],
+        "common_key_count": totals["common"],
+        "mismatch_row_count": totals["mismatch"],
+        "mismatch_counts_by_column": {c: n for c, n in col_counts.items() if n},
+        "duplicate_keys": {"db2": totals["dup_db2"], "csv": totals["dup_csv"]},
+        "sample_db2_only_keys": db2_only_keys,
+        "sample_csv_only_keys": csv_only_keys,
+        "sample_row_mismatches": diffs,
+    }
@@ -0,0 +1,222 @@
+# table_store.py
+import os, re, time, sqlite3, hashlib, datetime
+from decimal import Decimal
+from typing import List, Dict, Any, Tuple
+
+RE_SELECT_ONLY = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+# seconds a query() may run before it is interrupted (0 = no limit)
+TABLE_QUERY_TIMEOUT = float(os.getenv("TABLE_QUERY_TIMEOUT", "15"))
+
+
+def _sql_value(v: Any) -> Any:
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, (datetime.datetime, datetime.date, datetime.time)):
+        return v.isoformat(sep=" ") if isinstance(v, datetime.datetime) else v.isoformat()
+    if isinstance(v, (bytes, bytearray, memoryview)):
+        return bytes(v).hex()
+    return v
+
+
+def _sql_type(v: Any) -> str:
+    if v is None:
+        # no declared type (BLOB affinity): later values are stored as given, numbers stay numbers
+        return ""
+    if isinstance(v, bool) or isinstance(v, int):
+        return "INTEGER"
+    if isinstance(v, (float, Decimal)):
+        return "REAL"
+    return "TEXT"
+
+
+def _ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class TableStore:
+    """Local SQLite copy of imported DB2 tables, so questions like "transactions over
+    $10k last month" are answered by exact SQL instead of vector similarity.
+    Tables are registered per session; query() only lets a session read its own tables."""
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._init()
+
+    def _init(self):
+        with sqlite3.connect(self.db_path) as con:
+            con.execute("""
+            CREATE TABLE IF NOT EXISTS imported_tables(
+                session_id TEXT,
+                source TEXT,
+                name TEXT,
+                columns TEXT,
+                key_cols TEXT,
+                updated_at REAL,
+                PRIMARY KEY(session_id, source)
+            );
+            """)
+            con.commit()
+
+    @staticmethod
+    def table_name(session_id: str, source: str) -> str:
+        base = re.sub(r'[^A-Za-z0-9]+', '_', source.split(":", 1)[-1]).strip("_").lower()
+        # the readable part folds "." and "_" together (PROD.DW_ACCT vs PROD_DW.ACCT): the hash keeps names unique
+        h = hashlib.sha1(f"{session_id}\0{source}".encode("utf-8")).hexdigest()[:8]
+        return f"t_{re.sub(r'[^A-Za-z0-9]+', '_', session_id).lower()}_{base}_{h}"
+
+    def ensure_table(self, session_id: str, source: str, sample_rows: List[Dict[str, Any]], key_cols: List[str]) -> str:
+        """Create the local table; each column's type comes from its first non-NULL value in sample_rows."""
+        name = self.table_name(session_id, source)
+        cols = list(sample_rows[0].keys())
+        firsts = {c: next((r[c] for r in sample_rows if r.get(c) is not None), None) for c in cols}
+        defs = ", ".join(f"{_ident(c)} {_sql_type(firsts[c])}".rstrip() for c in cols)
+        with sqlite3.connect(self.db_path) as con:
+            con.execute(f"CREATE TABLE IF NOT EXISTS {_ident(name)} ({defs})")
+            if key_cols:
+                keys = ", ".join(_ident(k) for k in key_cols)
+                con.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {_ident(name + '_key')} ON {_ident(name)} ({keys})")
+            con.execute(
+                "INSERT OR REPLACE INTO imported_tables(session_id, source, name, columns, key_cols, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, source, name, ",".join(cols), ",".join(key_cols), time.time())
+            )
+            con.commit()
+        return name
+
+    def drop_table(self, session_id: str, source: str):
+        with sqlite3.connect(self.db_path) as con:
+            # the registered name too: tables imported before names carried a hash
+            names = {self.table_name(session_id, source)} | {r[0] for r in con.execute(
+                "SELECT name FROM imported_tables WHERE session_id = ? AND source = ?", (session_id, source))}
+            for name in names:
+                con.execute(f"DROP TABLE IF EXISTS {_ident(name)}")
+            con.execute("DELETE FROM imported_tables WHERE session_id = ? AND source = ?", (session_id, source))
+            con.commit()
+
+    def upsert_rows(self, name: str, rows: List[Dict[str, Any]], replace: bool = False) -> int:
+        if not rows:
+            return 0
+        cols = list(rows[0].keys())
+        verb = "INSERT OR REPLACE" if replace else "INSERT"
+        sql = f"{verb} INTO {_ident(name)} ({', '.join(_ident(c) for c in cols)}) VALUES ({', '.join('?' * len(cols))})"
+        with sqlite3.connect(self.db_path) as con:
+            con.executemany(sql, [tuple(_sql_value(r.get(c)) for c in cols) for r in rows])
+            con.commit()
+        return len(rows)
+
+    def delete_rows(self, name: str, col: str, op: str, value: Any) -> int:
+        """Delete rows whose col compares (op: "=" or ">") to value; returns the count."""
+        if op not in ("=", ">"):
+            raise ValueError(f"Unsupported operator: {op}")
+        with sqlite3.connect(self.db_path) as con:
+            n = con.execute(f"DELETE FROM {_ident(name)} WHERE {_ident(col)} {op} ?", (_sql_value(value),)).rowcount
+            con.commit()
+        return n
+
+    def list_tables(self, session_id: str) -> List[Dict[str, Any]]:
+        with sqlite3.connect(self.db_path) as con:
+            rows = con.execute(
+                "SELECT source, name, columns, key_cols, updated_at FROM imported_tables WHERE session_id = ? ORDER BY source",
+                (session_id,)
+            ).fetchall()
+        return [{"source": r[0], "name": r[1], "columns": r[2].split(",") if r[2] else [],
+                 "key_cols": r[3].split(",") if r[3] else [], "updated_at": r[4]} for r in rows]
+
+    def describe(self, name: str) -> List[Tuple[str, str]]:
+        with sqlite3.connect(self.db_path) as con:
+            return [(r[1], r[2]) for r in con.execute(f"PRAGMA table_info({_ident(name)})").fetchall()]
+
+    def profile(self, name: str, max_distinct: int = 12) -> Dict[str, Any]:
+        """Row count plus per-column min/max (or the value list for low-cardinality text)."""
+        cols = self.describe(name)
+        out: Dict[str, Any] = {"rows": 0, "columns": {}}
+        with sqlite3.connect(self.db_path) as con:
+            out["rows"] = con.execute(f"SELECT COUNT(*) FROM {_ident(name)}").fetchone()[0]
+            for col, typ in cols:
+                c = _ident(col)
+                lo, hi, nulls = con.execute(
+                    f"SELECT MIN({c}), MAX({c}), SUM({c} IS NULL) FROM {_ident(name)}"
+                ).fetchone()
+                info: Dict[str, Any] = {"type": typ, "min": lo, "max": hi, "nulls": nulls or 0}
+                if typ == "TEXT":
+                    vals = con.execute(f"SELECT DISTINCT {c} FROM {_ident(name)} LIMIT ?", (max_distinct + 1,)).fetchall()
+                    if len(vals) <= max_distinct:
+                        info["values"] = [v[0] for v in vals]
+                out["columns"][col] = info
+        return out
+
+    def query(self, session_id: str, sql: str, max_rows: int = 200, timeout: float | None = None) -> Dict[str, Any]:
+        """Run one read-only SELECT restricted to the session's imported tables, interrupted
+        after timeout seconds (default TABLE_QUERY_TIMEOUT)."""
+        if not RE_SELECT_ONLY.match(sql) or ";" in sql.strip().rstrip(";"):
+            raise ValueError("Only a single SELECT statement is allowed")
+        allowed = {t["name"] for t in self.list_tables(session_id)}
+
+        def authorizer(action, arg1, arg2, dbname, source):
+            if action == sqlite3.SQLITE_READ and arg1 not in allowed:
+                return sqlite3.SQLITE_DENY
+            if action in (sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION):
+                return sqlite3.SQLITE_OK
+            return sqlite3.SQLITE_DENY
+
+        timeout = TABLE_QUERY_TIMEOUT if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        con = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        try:
+            con.set_authorizer(authorizer)
+            if timeout > 0:
+                # a non-zero return aborts the statement (OperationalError "interrupted")
+                con.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+            cur = con.execute(sql.strip().rstrip(";"))
+            columns = [d[0] for d in cur.description or []]
+            rows = cur.fetchmany(max_rows + 1)
+        except sqlite3.DatabaseError as e:
+            if timeout > 0 and time.monotonic() > deadline:
+                raise ValueError(f"Query timed out after {timeout:g}s")
+            raise ValueError(f"Query failed: {e}")
+        finally:
+            con.close()
+        return {"columns": columns, "rows": [list(r) for r in rows[:max_rows]], "truncated": len(rows) > max_rows}
+
+
+def summarize_rows(rows: List[Dict[str, Any]], max_distinct: int = 8) -> Dict[str, Any]:
+    """Per-column ranges (or small value sets) of one row group."""
+    out: Dict[str, Any] = {}
+    if not rows:
+        return out
+    for col in rows[0].keys():
+        vals = [_sql_value(r.get(col)) for r in rows if r.get(col) is not None]
+        if not vals:
+            out[col] = {"nulls": len(rows)}
+            continue
+        info: Dict[str, Any] = {}
+        try:
+            info["min"], info["max"] = min(vals), max(vals)
+        except TypeError:
+            pass
+        if isinstance(vals[0], str):
+            distinct = sorted(set(vals))
+            if len(distinct) <= max_distinct:
+                info["values"] = distinct
+        out[col] = info
+    return out
+
+
+def _fmt_col(col: str, info: Dict[str, Any]) -> str:
+    if "values" in info:
+        return f"{col}: values {', '.join(str(v) for v in info['values'])}"
+    if "min" in info:
+        return f"{col}: {info['min']} .. {info['max']}"
+    return f"{col}: (null)"
+
+
+def table_summary_text(source: str, name: str, profile: Dict[str, Any]) -> str:
+    lines = [f"{source} imported table (local SQL table {name}), {profile['rows']} rows.",
+             "Columns: " + ", ".join(f"{c} {i['type'] or 'ANY'}" for c, i in profile["columns"].items())]
+    lines += [_fmt_col(c, i) for c, i in profile["columns"].items()]
+    return "\n".join(lines)
+
+
+def group_summary_text(source: str, name: str, rows: List[Dict[str, Any]]) -> str:
+    summary = summarize_rows(rows)
+    lines = [f"{source} row group of {len(rows)} rows (local SQL table {name})"]
+    lines += [_fmt_col(c, i) for c, i in summary.items()]
+    return "\n".join(lines)
@@ -0,0 +1,16 @@
+import pytest
+
+from table_store import TableStore
+
+
+def test_table_names_do_not_collide():
+    assert TableStore.table_name("s", "DB2:PROD.DW_ACCT") != TableStore.table_name("s", "DB2:PROD_DW.ACCT")
+
+
+def test_query_is_interrupted_at_timeout(tmp_path):
+    ts = TableStore(str(tmp_path / "tables.sqlite"))
+    name = ts.ensure_table("s", "DB2:T", [{"A": 1}], [])
+    ts.upsert_rows(name, [{"A": i} for i in range(1000)])
+    with pytest.raises(ValueError, match="timed out"):
+        ts.query("s", f"SELECT COUNT(*) FROM {name} a, {name} b, {name} c", timeout=0.2)
+    assert ts.query("s", f"SELECT COUNT(*) FROM {name}")["rows"] == [[1000]]